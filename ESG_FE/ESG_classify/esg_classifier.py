@@ -20,8 +20,17 @@ import torch
 import torch.nn.functional as F
 
 from gensim.utils import simple_preprocess
-from pyvi import ViTokenizer
-from typing import Dict, List
+from typing import Dict, List, Optional
+from utils.autotune import load_hardware_profile, use_threads
+from utils.dedup import SentenceDeduplicator
+from utils.early_exit import EarlyExitModel, wrap_early_exit
+from utils.inference import PredictionTable, load_sequence_classifier, predict_logits
+from utils.replicas import ReplicaPool, maybe_pool
+from utils.profiles import DEFAULT_PROFILE, get_profile, profile_max_length, resolve_model_path
+from utils.metrics import CACHE_REQUESTS, MODEL_LOAD_SECONDS
+from utils.tracing import span
+from utils.tokenization import EncodingCache, load_tokenizer
+from utils.segmentation import default_segmenter, get_segmenter
 
 import warnings
 warnings.filterwarnings("ignore")
@@ -62,15 +71,50 @@ def detect_model_type(model_name: str) -> str:
             return key
     return "auto"  # fallback
 
+
+def preprocess_vi_text(text, vi_tokenizer=None) -> str:
+    """preprocess Vietnamese text (simple_preprocess + word segmentation, mặc định pyvi)"""
+    if pd.isna(text):
+        return ""
+
+    tokens = simple_preprocess(text)
+    text = ' '.join(tokens)
+    return (vi_tokenizer or default_segmenter()).tokenize(text)
+
+
+def preprocess_vi_batch(texts: List[str], vi_tokenizer=None) -> List[str]:
+    """preprocess_vi_text cho cả list, segmenter chạy theo batch"""
+    plain = ["" if pd.isna(text) else ' '.join(simple_preprocess(text)) for text in texts]
+    return (vi_tokenizer or default_segmenter()).tokenize_batch(plain)
+
 class ESGClassifier:
     """ESG Text Classifier using rule-based approach"""
     
-    def __init__(self, model_path):
+    def __init__(self, model_path, profile: str = DEFAULT_PROFILE, long_text: str = "truncate",
+                 segmenter: Optional[str] = None, attention: Optional[str] = None,
+                 early_exit_threshold: Optional[float] = None, replicas: Optional[int] = None):
+        """
+        long_text: "truncate" (cắt ở max_length) | "window" (sliding window cho câu dài)
+        segmenter: "pyvi" | "trie" (utils.segmentation), mặc định ESG_SEGMENTER hoặc pyvi
+        attention: "eager" | "sdpa" | "bettertransformer" (utils.inference), mặc định theo hardware_profile.json
+                   (utils.autotune), ESG_ATTENTION hoặc eager
+        early_exit_threshold: dừng ở layer giữa khi head đạt độ tin cậy này (utils.early_exit), None = full depth
+        replicas: số replica process trên CPU (utils.replicas), mặc định ESG_REPLICAS hoặc 0 (một model)
+        """
         self.model = None
         self.tokenizer = None
         self.classifier = None
-        self.vi_tokenizer = ViTokenizer
-        self.load_model(model_path)
+        self.encoding_cache = EncodingCache()
+        self.vi_tokenizer = default_segmenter() if segmenter is None else get_segmenter(segmenter)
+        self.profile = get_profile(profile)
+        self.long_text = long_text
+        self.hardware = load_hardware_profile("classifier")
+        self.attention = attention or self.hardware.attention
+        self.early_exit_threshold = early_exit_threshold
+        self.replicas = replicas
+        self.model_path, applied = resolve_model_path(model_path, profile)
+        self.max_length = profile_max_length(self.model_path, profile, applied)
+        self.load_model(self.model_path)
     
     def load_model(self, model_path: str):
         """Load tokenizer and create classifier"""
@@ -81,10 +125,15 @@ class ESGClassifier:
 
             model_type = detect_model_type(model_path)
             ModelClass, TokenizerClass = MODEL_MAP[model_type]
-            self.model = ModelClass.from_pretrained(model_path,
-                            num_labels=4, device_map="cuda"
-                        )
-            self.tokenizer = TokenizerClass.from_pretrained(model_path)
+            with MODEL_LOAD_SECONDS.time(kind="classifier"):
+                self.model, self.attention = load_sequence_classifier(
+                    ModelClass, model_path, self.attention, device=device, num_labels=4
+                )
+                self.tokenizer = load_tokenizer(model_path, TokenizerClass)
+            if self.attention != "bettertransformer":  # fused layers không chạy từng layer được
+                self.model = wrap_early_exit(self.model, model_path, self.early_exit_threshold)
+            self.model = maybe_pool(self.model, self.tokenizer, self.replicas, name="classifier")
+            self.encoding_cache.clear()
             metadata_path = os.path.join(model_path, 'model_metadata.json')
             if os.path.exists(metadata_path):
                 with open(metadata_path, 'r', encoding='utf-8') as f:
@@ -98,14 +147,10 @@ class ESGClassifier:
         
     def preproces_text(self,text) -> str:
         """preprocess Vietnamese text"""
-        if pd.isna(text):
-            return ""
-    
-        tokens = simple_preprocess(text)
-        text = ' '.join(tokens)
-        text = self.vi_tokenizer.tokenize(text)
-        
-        return text
+        return preprocess_vi_text(text, self.vi_tokenizer)
+
+    def preprocess_batch(self, texts: List[str]) -> List[str]:
+        return preprocess_vi_batch(texts, self.vi_tokenizer)
     
     def preprocess_dataframe(self, df: pd.DataFrame, text_column: str) -> pd.DataFrame:
         """Preprocess toàn bộ dataframe"""
@@ -113,19 +158,39 @@ class ESGClassifier:
         df[text_column] = df[text_column].apply(self.preproces_text)
         return df
 
-    def classify_text(self, unlabeled_texts: List[str]) -> pd.DataFrame:
+    def classify_text(self, unlabeled_texts: List[str],
+                      near_duplicate_threshold: Optional[float] = None, embeddings: bool = False) -> pd.DataFrame:
+        """
+        Câu trùng (exact) chỉ preprocess + predict một lần rồi fan-out kết quả.
+        near_duplicate_threshold: bật near-dup MinHash/LSH (vd. 0.8), None = chỉ exact.
+        data có thêm cột cluster_id (cluster theo text đã chuẩn hoá, như model phân loại thấy).
+        embeddings: thêm cột embedding (float16, cùng forward pass) cho utils/embeddings.py
+        """
         try:
             LABEL_MAP = {0: "Irrelevant", 1: "Environment", 2: "Social", 3: "Governance"}            
-            processed_texts = [self.preproces_text(text) for text in unlabeled_texts]
-            results = self.batch_predict(processed_texts)
-            df = pd.DataFrame(results)
-            df["label_name"] = df["class_id"].map(LABEL_MAP)
-            counts = df["label_name"].value_counts().reindex(
-                ["Environment", "Social", "Governance", "Irrelevant"], fill_value=0
-            ).to_dict()
-            data = pd.DataFrame(columns=["text","label"])
-            data["text"] = unlabeled_texts
-            data["label"] = df["label_name"]
+            with span("preprocess_dedup", items=len(unlabeled_texts)) as s:
+                dedup = SentenceDeduplicator(threshold=near_duplicate_threshold).build(
+                    unlabeled_texts, preprocess_batch=self.preprocess_batch
+                )
+                s.set(unique=len(dedup.processed))
+            CACHE_REQUESTS.inc(len(unlabeled_texts) - len(dedup.processed), cache="dedup", result="hit")
+            CACHE_REQUESTS.inc(len(dedup.processed), cache="dedup", result="miss")
+            with span("classifier_predict", items=len(dedup.processed), profile=self.profile.name):
+                table = self.predict_table(dedup.processed, embeddings=embeddings).take(dedup.cluster_ids)
+            class_counts = np.bincount(table.class_id, minlength=len(LABEL_MAP))
+            counts = {LABEL_MAP[i]: int(class_counts[i]) for i in (1, 2, 3, 0)}
+            label_names = np.array([LABEL_MAP[i] for i in range(len(LABEL_MAP))], dtype=object)
+            data = pd.DataFrame({
+                "text": unlabeled_texts,
+                "label": label_names[table.class_id],
+                "class_id": table.class_id,
+                "cluster_id": dedup.cluster_ids
+            })
+            if table.embeddings is not None:  # không để trong attrs: pandas copy attrs ở mỗi phép biến đổi
+                data["embedding"] = list(table.embeddings)
+            data.attrs["length_stats"] = table.length_stats()
+            if isinstance(self.model, EarlyExitModel):
+                data.attrs["early_exit"] = self.model.stats()
             return counts, data
 
         except Exception as e:
@@ -152,8 +217,8 @@ class ESGClassifier:
             return_tensors='pt', 
             truncation=True, 
             padding=True,
-            max_length=256
-        ).to("cuda")
+            max_length=self.max_length
+        ).to(device)
         
         self.model.eval()
         with torch.no_grad():
@@ -170,39 +235,46 @@ class ESGClassifier:
         return results
     
 
-    def batch_predict(self, texts: List[str], batch_size: int = 32) -> List[Dict[str, float]]:
+    def predict_table(self, texts: List[str], batch_size: Optional[int] = None,
+                      embeddings: bool = False) -> PredictionTable:
+        """
+        Dự đoán batch, trả về kết quả dạng cột (NumPy). batch_size mặc định theo hardware profile.
+        embeddings: thêm table.embeddings (mean pooling layer cuối). Với early exit thì batch này
+        chạy full depth; replica pool không trả hidden state nên bỏ qua embeddings.
+        """
         if self.model is None or self.tokenizer is None:
             raise ValueError("Model chưa được khởi tạo hoặc load.")
-        
-        self.model.eval()
-        self.model.to(device)
-        all_predictions = []
 
-        with torch.no_grad():
-            for start in range(0, len(texts), batch_size):
-                batch_texts = texts[start:start+batch_size]
-                encoded = self.tokenizer(batch_texts, padding=True, truncation=True, return_tensors='pt', max_length=256).to(device)
-
-                outputs = self.model(**encoded)
-                logits = outputs.logits
-                probs = torch.softmax(logits, dim=-1)
-                confidences, class_ids = torch.max(probs, dim=1)
-
-                for i in range(len(batch_texts)):
-                    class_id = class_ids[i].item()
-                    confidence = confidences[i].item()
-                    results = {
-                        "class": self.label_names[class_id],
-                        "confidence": confidence,
-                        "class_id": class_id
-                    }
-                    all_predictions.append(results)
-
-
-        return all_predictions
+        model = self.model
+        if embeddings and isinstance(model, ReplicaPool):
+            warnings.warn("Replica pool không hỗ trợ embeddings, bỏ qua")
+            embeddings = False
+        elif embeddings and isinstance(model, EarlyExitModel):
+            model = model.model
+        model.eval()
+        model.to(device)
+        use_threads(self.hardware.threads)
+
+        logits, stats = predict_logits(model, self.tokenizer, texts, max_length=self.max_length,
+                                       batch_size=batch_size or self.hardware.batch_size, long_text=self.long_text,
+                                       device=device, cache=self.encoding_cache, pack=self.attention != "eager",
+                                       max_tokens=self.hardware.max_tokens, embeddings=embeddings)
+        return PredictionTable.from_logits(logits, self.label_names, stats)
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Embedding (n, hidden) float16 của text thô (preprocess như classify_text), dùng cho query"""
+        return self.predict_table(self.preprocess_batch(texts), embeddings=True).embeddings
+
+    def batch_predict(self, texts: List[str], batch_size: Optional[int] = None) -> List[Dict[str, float]]:
+        return self.predict_table(texts, batch_size).to_dicts()
     
     def is_ready(self):
         if self.model != None and self.tokenizer != None:
             return True
         return False
+
+    def close(self):
+        """Dừng replica process (nếu dùng replica pool)"""
+        if isinstance(self.model, ReplicaPool):
+            self.model.close()
     
\ No newline at end of file
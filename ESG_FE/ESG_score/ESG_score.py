@@ -1,19 +1,37 @@
+import threading
 import pandas as pd
 import numpy as np
 from sklearn.preprocessing import MinMaxScaler
 import matplotlib.pyplot as plt
 import seaborn as sns
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 from ESG_score.esg_model import ESGModel
+from utils.inference import PredictionTable
+from utils.profiles import DEFAULT_PROFILE, get_profile, profile_max_length, resolve_model_path
+from utils.tracing import span
 
 import warnings
 warnings.filterwarnings('ignore')
 
 class ESGScoreCalculator:
-    def __init__(self):
+    def __init__(self, profile: str = DEFAULT_PROFILE, long_text: str = "truncate", cache_models: bool = False,
+                 attention: Optional[str] = None, replicas: Optional[int] = None):
         """
         ESG Score Calculator cải tiến dựa trên SASB materiality map và sentiment analysis
+        profile: "fast" | "balanced" | "accurate" (xem utils/profiles.py)
+        long_text: "truncate" | "window" cho câu dài hơn max_length
+        cache_models: giữ sentiment model đã load giữa các lần gọi (streaming gọi nhiều lần / document)
+        attention: "eager" | "sdpa" | "bettertransformer" cho sentiment model (utils/inference.py)
+        replicas: số replica process / sentiment model trên CPU (utils/replicas.py)
         """
+        self.profile = get_profile(profile)
+        self.long_text = long_text
+        self.cache_models = cache_models
+        self.attention = attention
+        self.replicas = replicas
+        self._models = {}
+        self._model_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
         self.industry_esg_weights = {
             'Communication Services (Services)': {
                 'E': 0.75,
@@ -75,44 +93,74 @@ class ESGScoreCalculator:
             'social': ['Social Negative', 'Social Neutral', 'Social Positive']
         }
         categories = ["environment", "governance", "social"]
+        category_ids = {"environment": 1, "social": 2, "governance": 3}  # LABEL_MAP của ESGClassifier
+
+        # mask theo category tính trên mảng class_id thay vì so sánh chuỗi mỗi vòng
+        if "class_id" in df.columns:
+            topic_ids = df["class_id"].to_numpy()
+        else:
+            topic_ids = df["label"].str.lower().map(category_ids).fillna(0).to_numpy(dtype=np.int16)
+        all_texts = df["text"].to_numpy(dtype=object).astype(str)
+
         summary = {}
         for category in categories:
-            texts = df[df["label"].str.lower() == category]["text"].tolist()
-            if texts == []:
+            rows = np.flatnonzero(topic_ids == category_ids[category])
+            if len(rows) == 0:
                 continue
+            # câu trùng (đúng từng ký tự) chỉ chạy sentiment một lần, đếm lại theo số câu thật.
+            # Không dùng cluster_id: key dedup của classifier bỏ hoa / thường, model sentiment thì không
+            _, first, inverse = np.unique(all_texts[rows], return_index=True, return_inverse=True)
+            rows = rows[first]
             labels = category_labels[category]
-            result_df = self.classify_single_sentiment(texts, model_path + f"/{category}", category, labels)
-            result_df.loc[result_df["confidence"] < 0.6, "label"] = labels[1]  # always use Neutral label
+            with span(f"sentiment:{category}", items=len(rows)):
+                table = self.classify_single_sentiment(all_texts[rows].tolist(), model_path + f"/{category}", category, labels)
+            table = table.take(inverse)
+            if labels[1] in table.label_names:
+                table = table.with_fallback(0.6, table.label_id(labels[1]))  # always use Neutral label
 
+            counts = table.counts_by_label()
             label_counts = {
-                "Positive": sum(result_df["label"] == labels[2]),
-                "Neutral": sum(result_df["label"] == labels[1]),
-                "Negative": sum(result_df["label"] == labels[0])
+                "Positive": counts.get(labels[2], 0),
+                "Neutral": counts.get(labels[1], 0),
+                "Negative": counts.get(labels[0], 0)
             }
             summary[category] = label_counts
+            summary.setdefault("length_stats", {})[category] = table.length_stats()
         return summary
 
-    def classify_single_sentiment(self, texts: List[str], model_path: str, category: str, labels: List[str]):
+    def classify_single_sentiment(self, texts: List[str], model_path: str, category: str, labels: List[str]) -> PredictionTable:
         """class sentiment"""
-        model = ESGModel(
-            model_name = model_path,
-            num_labels = len(labels),
-            category = category
-        )
-        model.load_model(model_path)
-        results = model.batch_predict(texts) #List[Dict[str, float]
-        data = []
-        for text, result in zip(texts, results):
-            label = result['class']
-            confidence = result['confidence']
-            data.append({
-                "label": label,
-                "confidence": confidence,
-                "text": text
-            })
-
-        df = pd.DataFrame(data)
-        return df
+        model_path, applied = resolve_model_path(model_path, self.profile.name)
+        max_length = profile_max_length(model_path, self.profile.name, applied)
+        if self.cache_models:
+            # calculator được chia sẻ giữa các job worker: mỗi model chỉ load một lần
+            with self._lock:
+                model_lock = self._model_locks.setdefault(model_path, threading.Lock())
+            with model_lock:
+                model = self._models.get(model_path)
+                if model is None:
+                    model = self._models[model_path] = self._load_model(model_path, category, labels, max_length)
+        else:
+            model = self._load_model(model_path, category, labels, max_length)
+        with span("sentiment_predict", items=len(texts), category=category):
+            table = model.predict_table(texts)
+        if not self.cache_models:
+            model.close()
+        return table
+
+    def _load_model(self, model_path: str, category: str, labels: List[str], max_length: int) -> ESGModel:
+        with span("load_model", category=category, path=model_path):
+            model = ESGModel(
+                model_name = model_path,
+                num_labels = len(labels),
+                category = category,
+                max_length = max_length,
+                long_text = self.long_text,
+                attention = self.attention,
+                replicas = self.replicas
+            )
+            model.load_model(model_path)
+        return model
 
     def calculate_company_esg_score(self, 
                                    company_texts: pd.DataFrame, 
@@ -128,8 +176,18 @@ class ESGScoreCalculator:
             available_industries = list(self.industry_esg_weights.keys())
             raise ValueError(f"Industry '{industry}' not supported. Available: {available_industries}")
         
+        with span("classify_multiple_sentiment", items=len(company_texts)):
+            summary = self.classify_multiple_sentiment(company_texts, model_path)
+        total_sentences = len(company_texts[company_texts["label"] != "Irrelevant"]["text"])
+        return self.score_from_summary(summary, industry, total_sentences)
+
+    def score_from_summary(self, summary: Dict, industry: str, total_sentences: int) -> Dict[str, float]:
+        """Điểm ESG từ số câu Positive/Neutral/Negative theo category (output của classify_multiple_sentiment)"""
+        if industry not in self.industry_esg_weights:
+            available_industries = list(self.industry_esg_weights.keys())
+            raise ValueError(f"Industry '{industry}' not supported. Available: {available_industries}")
+
         weights = self.industry_esg_weights[industry]
-        summary = self.classify_multiple_sentiment(company_texts, model_path)
 
         # categories = ["environment", "governance", "social"]
         e_sentiment = (summary["environment"]["Positive"] if "environment" in summary else 0) - \
@@ -168,8 +226,9 @@ class ESGScoreCalculator:
             'e_sentiment_avg': e_sentiment,
             's_sentiment_avg': s_sentiment,
             'g_sentiment_avg': g_sentiment,
-            'total_sentences': len(company_texts[company_texts["label"] != "Irrelevant"]["text"]),
+            'total_sentences': total_sentences,
             'industry_weights': weights.copy(),
-            'sentiment_df': sentiment_df
+            'sentiment_df': sentiment_df,
+            'length_stats': summary.get("length_stats", {})
         }
     
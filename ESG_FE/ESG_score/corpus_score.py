@@ -0,0 +1,155 @@
+import os
+import numpy as np
+import pandas as pd
+from typing import Dict, Iterable, Optional
+from ESG_score.ESG_score import ESGScoreCalculator
+from utils.embeddings import EmbeddingStore
+
+CATEGORIES = ["environment", "social", "governance"]
+SENTIMENTS = ["Positive", "Neutral", "Negative"]
+COUNT_COLUMNS = [f"{c[0].upper()}_{s.lower()}" for c in CATEGORIES for s in SENTIMENTS]
+KEY = ["company", "year"]
+
+
+class ESGCorpusScorer:
+    def __init__(self, company_csv: str = "ESG_company.csv", industry_esg_weights: Optional[Dict] = None,
+                 embedding_store: Optional[EmbeddingStore] = None, embedding_model: Optional[str] = None):
+        """
+        Chấm điểm ESG cho nhiều công ty / nhiều năm cùng lúc.
+        Lưu bảng đếm sentiment theo (company, year); điểm được tính vector hoá trên cả bảng,
+        cập nhật một báo cáo mới chỉ tính lại dòng của báo cáo đó.
+        embedding_store: add_report lưu cột embedding của classify_text(..., embeddings=True)
+        để tìm câu tương tự giữa các công ty (utils/embeddings.py).
+        embedding_model: model_path của ESGClassifier tạo ra embedding (classifier.model_path),
+        bắt buộc khi có embedding_store.
+        """
+        if embedding_store is not None and not embedding_model:
+            raise ValueError("embedding_store cần embedding_model (model_path của ESGClassifier)")
+        self.embedding_store = embedding_store
+        self.embedding_model = embedding_model
+        self.industry_esg_weights = industry_esg_weights or ESGScoreCalculator().industry_esg_weights
+        self.company_industry = {}
+        if company_csv and os.path.exists(company_csv):
+            data_industry = pd.read_csv(company_csv)
+            self.company_industry = data_industry.set_index("Company")["Industry"].to_dict()
+
+        self.counts = pd.DataFrame(columns=KEY + COUNT_COLUMNS + ["total_sentences"]).set_index(KEY)
+        self.scores = pd.DataFrame()
+
+    # ---------- input ----------
+    @staticmethod
+    def _count_predictions(predictions: pd.DataFrame) -> pd.DataFrame:
+        """
+        predictions: DataFrame ["company", "year", "category", "sentiment"]
+        category: environment/social/governance (các giá trị khác = Irrelevant)
+        sentiment: Positive/Neutral/Negative hoặc nhãn đầy đủ như "Social Positive"
+        """
+        category = predictions["category"].astype(str).str.lower().map({c: i for i, c in enumerate(CATEGORIES)})
+        sentiment = predictions["sentiment"].astype(str).str.split().str[-1].map({s: i for i, s in enumerate(SENTIMENTS)})
+
+        group_ids, groups = pd.MultiIndex.from_frame(predictions[KEY]).factorize()
+        relevant = category.notna().to_numpy()
+        scored = relevant & sentiment.notna().to_numpy()
+
+        codes = (group_ids[scored] * 9
+                 + category.to_numpy()[scored].astype(np.int64) * 3
+                 + sentiment.to_numpy()[scored].astype(np.int64))
+        counts = np.bincount(codes, minlength=len(groups) * 9).reshape(len(groups), 9)
+
+        result = pd.DataFrame(counts, columns=COUNT_COLUMNS, index=groups.set_names(KEY))
+        result["total_sentences"] = np.bincount(group_ids[relevant], minlength=len(groups))
+        return result
+
+    def add_predictions(self, predictions: pd.DataFrame) -> pd.DataFrame:
+        """Thêm / thay thế báo cáo của các (company, year) trong predictions, trả về điểm đã cập nhật"""
+        return self._upsert(self._count_predictions(predictions))
+
+    def add_summary(self, company: str, year: int, summary: Dict, total_sentences: int) -> pd.DataFrame:
+        """Thêm một báo cáo từ output của ESGScoreCalculator.classify_multiple_sentiment"""
+        row = {f"{c[0].upper()}_{s.lower()}": summary.get(c, {}).get(s, 0) for c in CATEGORIES for s in SENTIMENTS}
+        row["total_sentences"] = total_sentences
+        index = pd.MultiIndex.from_tuples([(company, year)], names=KEY)
+        return self._upsert(pd.DataFrame([row], index=index))
+
+    def add_report(self, company: str, year: int, company_texts: pd.DataFrame, model_path: str,
+                   calculator: Optional[ESGScoreCalculator] = None) -> pd.DataFrame:
+        """Chạy sentiment cho báo cáo mới của một công ty (output của classify_text) rồi cập nhật"""
+        if self.embedding_store is not None and "embedding" in company_texts:
+            self.embedding_store.add_frame(company_texts, company, year, self.company_industry.get(company),
+                                           model=self.embedding_model)
+        calculator = calculator or ESGScoreCalculator()
+        summary = calculator.classify_multiple_sentiment(company_texts, model_path)
+        total_sentences = int((company_texts["label"] != "Irrelevant").sum())
+        return self.add_summary(company, year, summary, total_sentences)
+
+    def remove(self, company: str, year: Optional[int] = None):
+        keys = [k for k in self.counts.index if k[0] == company and (year is None or k[1] == year)]
+        self.counts = self.counts.drop(keys)
+        if self.embedding_store is not None:
+            self.embedding_store.remove(company, year)
+        if not self.scores.empty:
+            self.scores = self.scores.drop(keys, errors="ignore")
+
+    def _upsert(self, new_counts: pd.DataFrame) -> pd.DataFrame:
+        new_counts = new_counts.astype(np.int64)
+        rest = self.counts.drop(new_counts.index, errors="ignore")
+        self.counts = pd.concat([rest, new_counts]) if len(rest) else new_counts
+        new_scores = self._score(new_counts)
+        if self.scores.empty:
+            self.scores = new_scores
+        else:
+            self.scores = pd.concat([self.scores.drop(new_scores.index, errors="ignore"), new_scores])
+        return new_scores
+
+    # ---------- scoring ----------
+    def industry_of(self, companies: Iterable[str]) -> pd.Series:
+        return pd.Series([self.company_industry.get(c) for c in companies], dtype=object)
+
+    def _score(self, counts: pd.DataFrame) -> pd.DataFrame:
+        """ESG_company = W_E × S_E + W_S × S_S + W_G × S_G, tính cho mọi dòng một lần"""
+        industries = self.industry_of(counts.index.get_level_values("company"))
+        unknown = sorted(set(industries[~industries.isin(self.industry_esg_weights.keys())].astype(str)))
+        if unknown:
+            raise ValueError(f"Industry not supported for some companies: {unknown}. "
+                             f"Available: {list(self.industry_esg_weights.keys())}")
+
+        weights = pd.DataFrame.from_dict(self.industry_esg_weights, orient="index")
+        W = weights.loc[industries.to_numpy(), ["E", "S", "G"]].to_numpy(dtype=float)
+        C = counts[COUNT_COLUMNS].to_numpy(dtype=float).reshape(len(counts), 3, 3)
+        sentiment = C[:, :, 0] - C[:, :, 2]  # Positive - Negative, theo thứ tự E, S, G
+        contribution = W * sentiment
+
+        return pd.DataFrame({
+            "industry": industries.to_numpy(),
+            "company_esg_score": contribution.sum(axis=1),
+            "weighted_e_contribution": contribution[:, 0],
+            "weighted_s_contribution": contribution[:, 1],
+            "weighted_g_contribution": contribution[:, 2],
+            "e_sentiment_avg": sentiment[:, 0],
+            "s_sentiment_avg": sentiment[:, 1],
+            "g_sentiment_avg": sentiment[:, 2],
+            "total_sentences": counts["total_sentences"].to_numpy()
+        }, index=counts.index)
+
+    def rank(self, year: Optional[int] = None, industry: Optional[str] = None) -> pd.DataFrame:
+        """Xếp hạng percentile trong ngành (theo từng năm)"""
+        scores = self.scores.reset_index().copy()
+        if year is not None:
+            scores = scores[scores["year"] == year].copy()
+        if industry is not None:
+            scores = scores[scores["industry"] == industry].copy()
+        grouped = scores.groupby(["industry", "year"])["company_esg_score"]
+        scores["industry_percentile"] = grouped.rank(pct=True, method="average") * 100
+        scores["industry_rank"] = grouped.rank(ascending=False, method="min").astype(int)
+        return scores.sort_values(["year", "industry", "industry_rank"]).reset_index(drop=True)
+
+    # ---------- persistence ----------
+    def save(self, path: str):
+        self.counts.reset_index().to_csv(path, index=False)
+
+    def load(self, path: str):
+        counts = pd.read_csv(path).set_index(KEY)
+        self.counts = counts.iloc[0:0]
+        self.scores = pd.DataFrame()
+        if len(counts):
+            self._upsert(counts)
@@ -8,9 +8,16 @@ from transformers import (
     ElectraTokenizer, ElectraForSequenceClassification,
     DebertaV2ForSequenceClassification
 )
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 import os
 import json
+from utils.autotune import load_hardware_profile, use_threads
+from utils.inference import PredictionTable, load_sequence_classifier, predict_logits
+from utils.metrics import MODEL_LOAD_SECONDS
+from utils.replicas import ReplicaPool, maybe_pool
+from utils.tokenization import EncodingCache, load_tokenizer
+
+device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
 MODEL_MAP = {
     # DistilBERT
@@ -47,13 +54,20 @@ def detect_model_type(model_name: str) -> str:
 
 
 class ESGModel:
-    def __init__(self, model_name: str, num_labels: int, category: str):
+    def __init__(self, model_name: str, num_labels: int, category: str, max_length: int = 256,
+                 long_text: str = "truncate", attention: Optional[str] = None, replicas: Optional[int] = None):
         self.model_name = model_name
         self.num_labels = num_labels
         self.category = category
+        self.max_length = max_length
+        self.long_text = long_text
+        self.hardware = load_hardware_profile("sentiment")  # batch / token budget / threads, xem utils/autotune.py
+        self.attention = attention or self.hardware.attention  # None = ESG_ATTENTION hoặc eager, xem utils/inference.py
+        self.replicas = replicas  # None = ESG_REPLICAS hoặc 0 (một model), xem utils/replicas.py
         self.tokenizer = None
         self.model = None
         self.label_names = None
+        self.encoding_cache = EncodingCache()
     
     def load_model(self, model_path: str):
         """Load model từ đường dẫn"""
@@ -63,10 +77,13 @@ class ESGModel:
 
         model_type = detect_model_type(model_path)
         ModelClass, TokenizerClass = MODEL_MAP[model_type]
-        self.model = ModelClass.from_pretrained(model_path,
-                        num_labels=self.num_labels, device_map="cuda"
-                    )
-        self.tokenizer = TokenizerClass.from_pretrained(model_path)
+        with MODEL_LOAD_SECONDS.time(kind="sentiment"):
+            self.model, self.attention = load_sequence_classifier(
+                ModelClass, model_path, self.attention, device=device, num_labels=self.num_labels
+            )
+            self.tokenizer = load_tokenizer(model_path, TokenizerClass)
+            self.model = maybe_pool(self.model, self.tokenizer, self.replicas, name=self.category)
+        self.encoding_cache.clear()
         
         # Load metadata
         metadata_path = os.path.join(model_path, 'model_metadata.json')
@@ -87,8 +104,8 @@ class ESGModel:
             return_tensors='pt', 
             truncation=True, 
             padding=True,
-            max_length=256
-        )
+            max_length=self.max_length
+        ).to(device)
         
         self.model.eval()
         with torch.no_grad():
@@ -104,38 +121,26 @@ class ESGModel:
         
         return results
     
-    def batch_predict(self, texts: List[str], batch_size: int = 16) -> List[Dict[str, float]]:
-        """Predict batch text"""
+    def predict_table(self, texts: List[str], batch_size: Optional[int] = None) -> PredictionTable:
+        """Predict batch text, kết quả dạng cột (NumPy). batch_size mặc định theo hardware profile"""
         if self.model is None or self.tokenizer is None:
             raise ValueError("Model chưa được khởi tạo hoặc load.")
         
         self.model.eval()
-        results = []
-        
-        for i in range(0, len(texts), batch_size):
-            batch_texts = texts[i:i + batch_size]
-
-            # Tokenize cho cả batch
-            inputs = self.tokenizer(
-                batch_texts,
-                return_tensors='pt',
-                truncation=True,
-                padding=True,
-                max_length=256
-            ).to("cuda")
+        use_threads(self.hardware.threads)
 
-            with torch.no_grad():
-                outputs = self.model(**inputs)
-                probabilities = torch.softmax(outputs.logits, dim=-1)  # shape: (batch, num_classes)
-                predicted_class_idxs = torch.argmax(probabilities, dim=-1)
-
-            for idx, probs in zip(predicted_class_idxs, probabilities):
-                results.append({
-                    "class": self.label_names[idx.item()],
-                    "confidence": probs[idx].item(),
-                    "class_id": idx.item()
-                })
-
-        return results
+        # Tokenize + forward theo batch (câu dài: truncate hoặc sliding window)
+        logits, stats = predict_logits(self.model, self.tokenizer, texts, max_length=self.max_length,
+                                       batch_size=batch_size or self.hardware.batch_size, long_text=self.long_text,
+                                       device=device, cache=self.encoding_cache, pack=self.attention != "eager",
+                                       max_tokens=self.hardware.max_tokens)
+        return PredictionTable.from_logits(logits, self.label_names, stats)
 
+    def batch_predict(self, texts: List[str], batch_size: Optional[int] = None) -> List[Dict[str, float]]:
+        """Predict batch text"""
+        return self.predict_table(texts, batch_size).to_dicts()
 
+    def close(self):
+        """Dừng replica process (nếu dùng replica pool)"""
+        if isinstance(self.model, ReplicaPool):
+            self.model.close()
@@ -5,15 +5,22 @@ import pandas as pd
 import plotly.express as px
 from pathlib import Path
 import json
-import pdfplumber, fitz
+import pdfplumber
 import io
 import re
+import uuid
+import os
 
 # Import custom modules
 from text_server import run_server_background
-from utils.components import render_pdf_viewer, get_custom_css, normalize_full_text
+from utils.components import render_pdf_viewer, get_custom_css, normalize_full_text, extract_pdf_text, split_sentences
 from ESG_classify.esg_classifier import ESGClassifier
 from ESG_score.ESG_score import ESGScoreCalculator
+from utils.profiles import PROFILES, DEFAULT_PROFILE
+from utils.tracing import trace, span
+from utils.metrics import CACHE_REQUESTS, SESSIONS
+from utils.streaming import StreamingAnalyzer
+from utils.jobs import JobManager, analyze_sentences, stream_report
 import warnings
 
 warnings.filterwarnings("ignore", category=UserWarning)
@@ -28,16 +35,34 @@ st.markdown(get_custom_css(), unsafe_allow_html=True)
 model_classifer = "ESG_classify\models\ViBert-ESG-base"
 model_score = "ESG_score\models\phobert-base"
 
+_model_loads = []  # mỗi lần cache miss của get_esg_* thêm một phần tử
+
 # Initialize ESG classifier
 @st.cache_resource
-def get_esg_classifier():
+def get_esg_classifier(profile=DEFAULT_PROFILE):
     """Get ESG classifier instance"""
-    return ESGClassifier(model_classifer)
+    _model_loads.append("classifier")
+    return ESGClassifier(model_classifer, profile=profile, long_text="window")
+
+@st.cache_resource
+def get_streaming_sentiment(profile=DEFAULT_PROFILE):
+    """ESG Score giữ sentiment model giữa các cửa sổ trang"""
+    _model_loads.append("streaming")
+    return ESGScoreCalculator(profile=profile, long_text="window", cache_models=True)
 
 @st.cache_resource
-def get_esg_sentiment():
-    """Get ESG Score"""
-    return ESGScoreCalculator()
+def get_job_manager():
+    """Worker pool dùng chung cho mọi session"""
+    return JobManager(max_workers=int(os.environ.get("ESG_JOB_WORKERS", "2")))
+
+JOB_POLL_SECONDS = 1.0
+
+def cached_model(getter, profile):
+    """Gọi getter (st.cache_resource) và đếm cache hit/miss cho /metrics"""
+    loads = len(_model_loads)
+    resource = getter(profile)
+    CACHE_REQUESTS.inc(cache="model", result="miss" if len(_model_loads) > loads else "hit")
+    return resource
 
 # Start text server in background
 if 'server_started' not in st.session_state:
@@ -63,20 +88,10 @@ if 'last_check' not in st.session_state:
     st.session_state.last_check = 0
 if 'uploaded_file' not in st.session_state:
     st.session_state.uploaded_file = None
+if 'metrics_session_id' not in st.session_state:
+    st.session_state.metrics_session_id = uuid.uuid4().hex
+SESSIONS.touch(st.session_state.metrics_session_id)
     
-def extract_pdf_text(pdf_bytes):
-    try:
-        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-        full_text = []
-        for i, page in enumerate(doc, start=1):
-            text = page.get_text()
-            if text.strip():
-                full_text.append(f'--- Page {i} ---\n{text.strip()}')
-        return '\n'.join(full_text), None
-    except Exception as e:
-        return None, f"Lỗi khi extract PDF: {str(e)}"
-
-
 def save_full_pdf_to_file(text):
     """Save full PDF text to file"""
     try:
@@ -148,7 +163,14 @@ st.markdown("**Workflow: Bôi đen text → Lưu file → Hiển thị area →
 
 # Load model status
 with st.expander("Model Status", expanded=False):
-    classifier = get_esg_classifier()
+    profile = st.selectbox(
+        "⚡ Inference profile:",
+        options=list(PROFILES.keys()),
+        index=list(PROFILES.keys()).index(DEFAULT_PROFILE),
+        key="inference_profile"
+    )
+    debug_tracing = st.checkbox("🐞 Debug: hiển thị thời gian từng bước", key="debug_tracing")
+    classifier = cached_model(get_esg_classifier, profile)
     if classifier.is_ready():
         st.success("✅ ESG Classifier đã sẵn sàng!")
     else:
@@ -230,7 +252,9 @@ with col2:
     with col_b:
         if st.button("📄 Lấy text cả PDF", key="extract_full_btn"):
             if 'pdf_bytes' in st.session_state:
-                with st.spinner("🔄 Đang trích xuất text từ PDF..."):
+                with st.spinner("🔄 Đang trích xuất text từ PDF..."), \
+                        trace("extract_full_pdf") as extract_trace:
+                    st.session_state.last_trace = extract_trace
                     full_text, error = extract_pdf_text(st.session_state.pdf_bytes)
                     
                     if error:
@@ -309,7 +333,7 @@ with col2:
     
     # Show text info
     if text_to_analyze.strip():
-        sentences = [s.strip() for s in text_to_analyze.split('.') if s.strip()]
+        sentences = split_sentences(text_to_analyze)
         words = len(text_to_analyze.split())
         lines = len(text_to_analyze.split('\n'))
         num_sentences = len(sentences)
@@ -321,101 +345,201 @@ with col2:
     else:
         st.success(f"✅ Sẵn sàng phân tích ({num_sentences} câu)")
 
-classifier = get_esg_classifier()
-esg_score = get_esg_sentiment()
+classifier = cached_model(get_esg_classifier, profile)
+job_manager = get_job_manager()
+
+ESG_COLORS = {
+    'Environmental': '#4CAF50',
+    'Social': '#2196F3',
+    'Governance': '#9C27B0',
+    'Irrelevant': '#FF5722'
+}
+
+def render_analysis_result(result, industry):
+    """Biểu đồ + bảng cho kết quả analyze_sentences"""
+    counts = result["counts"]
+    st.markdown("#### 📊 Kết quả phân tích:")
+    st.info("🤖 **Phân tích bằng Rule-based Classifier**")
+    length_stats = result.get("length_stats")
+    if length_stats:
+        st.caption(f"✂️ {length_stats['windowed']}/{length_stats['inputs']} câu dài được chia cửa sổ "
+                   f"({length_stats['chunks']} chunks), {length_stats['truncated']} câu bị cắt")
+    
+    df = pd.DataFrame({
+        'Category': list(counts.keys()),
+        'Số lượng': list(counts.values())
+    })
+    
+    with span("plotly", charts=2):
+        # Bar chart
+        fig_bar = px.bar(
+            df, x='Category', y='Số lượng', color='Category',
+            color_discrete_map=ESG_COLORS,
+            title="📊 Phân bố ESG (số lượng câu)"
+        )
+        fig_bar.update_layout(height=280, showlegend=False)
+        st.plotly_chart(fig_bar, use_container_width=True)
+    
+        # Pie chart
+        fig_pie = px.pie(
+            df, values='Số lượng', names='Category', color='Category',
+            color_discrete_map=ESG_COLORS,
+            title="🥧 Phân bố ESG (%)"
+        )
+        fig_pie.update_layout(height=340)
+        st.plotly_chart(fig_pie, use_container_width=True)
+    
+    st.markdown("#### 📈 Kết Quả ESG Score Chi Tiết")
+    
+    # Hiển thị tổng điểm ESG
+    st.write(f"**Trọng số ngành {industry}:** {result['industry_weights']}")
+
+    with span("plotly", charts=2):
+        fig_sentiment_bar = px.bar(
+            result["sentiment_df"],
+            x="ESG Category",
+            y="Count",
+            color="Sentiment",
+            barmode="group",
+            title="📊 Phân Bổ Sentiment theo Danh Mục ESG"
+        )
+        fig_sentiment_bar.update_layout(height=400)
+        st.plotly_chart(fig_sentiment_bar, use_container_width=True)
+
+    
+        # DataFrame cho weighted contributions (E, S, G)
+        contributions_df = pd.DataFrame({
+            'Category': ['Environmental', 'Social', 'Governance'],
+            'Score Contribution': [
+                abs(result['weighted_e_contribution']),
+                abs(result['weighted_s_contribution']),
+                abs(result['weighted_g_contribution'])
+            ]
+        })
+    
+        fig_weights_pie = px.pie(
+            contributions_df, values='Score Contribution', names='Category',
+            title="🥧 Phân Bố Score"
+        )
+        fig_weights_pie.update_layout(height=340)
+        st.plotly_chart(fig_weights_pie, use_container_width=True)
+    
+    # Results table
+    st.markdown("#### 📋 Bảng Kết Quả ESG (Mở Rộng)")
+    result_df = pd.DataFrame({
+        'Danh mục ESG': [f"🌱 Environmental", f"👥 Social", f"⚖️ Governance"],
+        'Điểm Sentiment Avg': [f"{result['e_sentiment_avg']:.2f}", f"{result['s_sentiment_avg']:.2f}", f"{result['g_sentiment_avg']:.2f}"],
+        'Đóng Góp Weighted': [f"{result['weighted_e_contribution']:.2f}", f"{result['weighted_s_contribution']:.2f}", f"{result['weighted_g_contribution']:.2f}"],
+    })
+    
+    st.dataframe(result_df, use_container_width=True)
+    st.write(f"**Tổng Điểm ESG:** {result['company_esg_score']:.2f}")
+
+def render_stream_result(stream_result):
+    """Kết quả stream_report (StreamingAnalyzer)"""
+    st.markdown(f"#### 📊 Kết quả ({stream_result['pages']} trang, {stream_result['sentences']} câu)")
+    st.plotly_chart(px.bar(
+        pd.DataFrame({'Category': list(stream_result['counts'].keys()),
+                      'Số lượng': list(stream_result['counts'].values())}),
+        x='Category', y='Số lượng', color='Category', title="📊 Phân bố ESG (số lượng câu)"
+    ).update_layout(height=280, showlegend=False), use_container_width=True)
+    st.plotly_chart(px.bar(
+        stream_result["sentiment_df"], x="ESG Category", y="Count", color="Sentiment",
+        barmode="group", title="📊 Phân Bổ Sentiment theo Danh Mục ESG"
+    ).update_layout(height=400), use_container_width=True)
+    st.write(f"**Tổng Điểm ESG:** {stream_result['company_esg_score']:.2f}")
+    if stream_result['results_truncated']:
+        st.caption(f"💾 Kết quả từng câu: {stream_result['results_written']} dòng đầu trong {stream_result['results_path']}")
+    else:
+        st.caption(f"💾 Kết quả từng câu: {stream_result['results_path']}")
+
+def render_job_progress(job):
+    """Tiến độ từng stage + số đếm tạm của job đang chạy"""
+    state = job.snapshot()
+    st.markdown(f"#### ⏳ Job `{state['job_id']}` — {state['status']} ({state['elapsed']:.0f}s)")
+    for stage_name, (done, total) in state["progress"].items():
+        st.progress(min(done / total, 1.0) if total else 0.0, text=f"{stage_name}: {done}/{total}")
+    counts = state["partial"].get("counts")
+    if counts:
+        st.caption("📊 Tạm tính: " + ", ".join(f"{k}: {v}" for k, v in counts.items()))
+    if state["cancel_requested"]:
+        st.caption("🛑 Đang huỷ (dừng sau batch hiện tại)...")
+    elif st.button("🛑 Huỷ phân tích", key=f"cancel_{state['job_id']}"):
+        job_manager.cancel(state["job_id"])
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def job_panel():
+    """Chỉ fragment này chạy lại mỗi JOB_POLL_SECONDS khi job chưa xong"""
+    job = job_manager.get(st.session_state.get('analysis_job_id'))
+    if job is None:
+        return
+    if job.done:
+        st.rerun()  # chạy lại cả trang để hiển thị kết quả
+    render_job_progress(job)
+
+def submit_job(name, fn, *args):
+    previous = job_manager.get(st.session_state.get('analysis_job_id'))
+    if previous is not None and not previous.done:
+        previous.cancel()
+    st.session_state.analysis_job_id = job_manager.submit(
+        name, fn, *args, owner=st.session_state.metrics_session_id
+    )
+
 # ANALYSIS SECTION
 if text_to_analyze.strip() and len(text_to_analyze) >= 10:
     if st.button("🚀 Phân tích ESG", type="primary", key="classify_btn"):
-        with st.spinner("🔍 Đang phân tích ESG..."):
-            counts, data = classifier.classify_text(sentences)
-            
-            st.markdown("#### 📊 Kết quả phân tích:")
-            st.info("🤖 **Phân tích bằng Rule-based Classifier**")
-            
-            df = pd.DataFrame({
-                'Category': list(counts.keys()),
-                'Số lượng': list(counts.values())
-            })
-            
-            # Bar chart
-            fig_bar = px.bar(
-                df, x='Category', y='Số lượng', color='Category',
-                color_discrete_map={
-                    'Environmental': '#4CAF50',
-                    'Social': '#2196F3',
-                    'Governance': '#9C27B0',
-                    'Irrelevant': '#FF5722'
-                },
-                title="📊 Phân bố ESG (số lượng câu)"
-            )
-            fig_bar.update_layout(height=280, showlegend=False)
-            st.plotly_chart(fig_bar, use_container_width=True)
-            
-            # Pie chart
-            fig_pie = px.pie(
-                df, values='Số lượng', names='Category', color='Category',
-                color_discrete_map={
-                    'Environmental': '#4CAF50',
-                    'Social': '#2196F3',
-                    'Governance': '#9C27B0',
-                    'Irrelevant': '#FF5722'
-                },
-                title="🥧 Phân bố ESG (%)"
-            )
-            fig_pie.update_layout(height=340)
-            st.plotly_chart(fig_pie, use_container_width=True)
-            
-            # ESG score
-            result = esg_score.calculate_company_esg_score(data, industry, model_score)
-            
-            st.markdown("#### 📈 Kết Quả ESG Score Chi Tiết")
-            
-            # Hiển thị tổng điểm ESG
-            st.write(f"**Trọng số ngành {industry}:** {result['industry_weights']}")
-
-            fig_sentiment_bar = px.bar(
-                result["sentiment_df"],
-                x="ESG Category",
-                y="Count",
-                color="Sentiment",
-                barmode="group",
-                title="📊 Phân Bổ Sentiment theo Danh Mục ESG"
-            )
-            fig_sentiment_bar.update_layout(height=400)
-            st.plotly_chart(fig_sentiment_bar, use_container_width=True)
-
-            
-            # DataFrame cho weighted contributions (E, S, G)
-            contributions_df = pd.DataFrame({
-                'Category': ['Environmental', 'Social', 'Governance'],
-                'Score Contribution': [
-                    abs(result['weighted_e_contribution']),
-                    abs(result['weighted_s_contribution']),
-                    abs(result['weighted_g_contribution'])
-                ]
-            })
-            
-            fig_weights_pie = px.pie(
-                contributions_df, values='Score Contribution', names='Category',
-                title="🥧 Phân Bố Score"
-            )
-            fig_weights_pie.update_layout(height=340)
-            st.plotly_chart(fig_weights_pie, use_container_width=True)
-            
-            # Results table
-            st.markdown("#### 📋 Bảng Kết Quả ESG (Mở Rộng)")
-            result_df = pd.DataFrame({
-                'Danh mục ESG': [f"🌱 Environmental", f"👥 Social", f"⚖️ Governance"],
-                'Điểm Sentiment Avg': [f"{result['e_sentiment_avg']:.2f}", f"{result['s_sentiment_avg']:.2f}", f"{result['g_sentiment_avg']:.2f}"],
-                'Đóng Góp Weighted': [f"{result['weighted_e_contribution']:.2f}", f"{result['weighted_s_contribution']:.2f}", f"{result['weighted_g_contribution']:.2f}"],
-            })
-            
-            st.dataframe(result_df, use_container_width=True)
-            st.write(f"**Tổng Điểm ESG:** {result['company_esg_score']:.2f}")
+        submit_job("analyze_report", analyze_sentences, classifier, cached_model(get_streaming_sentiment, profile),
+                   sentences, industry, model_score)
 
 elif text_to_analyze.strip() and len(text_to_analyze) < 10:
     st.warning("⚠️ Text quá ngắn. Cần ít nhất 10 ký tự để phân tích.")
 
+# STREAMING ANALYSIS: cả PDF theo cửa sổ trang, chỉ giữ số đếm trong RAM
+if st.session_state.get('pdf_bytes') and industry:
+    with st.expander("🌊 Phân tích streaming cả PDF (báo cáo lớn)", expanded=False):
+        window_pages = st.number_input("Số trang mỗi cửa sổ", min_value=1, max_value=200, value=20, key="window_pages")
+        if st.button("🌊 Phân tích streaming", key="stream_btn"):
+            analyzer = StreamingAnalyzer(classifier, cached_model(get_streaming_sentiment, profile), model_score,
+                                         window_pages=int(window_pages))
+            # CSV kết quả riêng cho từng job (TEMP_DIR/stream_results_<job_id>.csv)
+            submit_job("analyze_report_streaming", stream_report, analyzer, st.session_state.pdf_bytes, industry,
+                       str(TEMP_DIR))
+
+# BACKGROUND JOB: poll khi đang chạy, hiển thị kết quả khi xong
+analysis_job = job_manager.get(st.session_state.get('analysis_job_id'))
+if analysis_job is not None:
+    if not analysis_job.done:
+        job_panel()
+    else:
+        if analysis_job.trace is not None:
+            st.session_state.last_trace = analysis_job.trace
+        if analysis_job.status == "cancelled":
+            st.warning(f"🛑 Đã huỷ job {analysis_job.job_id}")
+        elif analysis_job.status == "failed":
+            st.error(f"❌ Phân tích lỗi: {analysis_job.error}")
+        elif analysis_job.name == "analyze_report_streaming":
+            render_stream_result(analysis_job.result)
+        else:
+            render_analysis_result(analysis_job.result, analysis_job.result["industry"])
+
+# Debug panel: waterfall của lần chạy gần nhất
+if debug_tracing and st.session_state.get('last_trace') is not None:
+    last_trace = st.session_state.last_trace
+    with st.expander(f"🐞 Trace: {last_trace.name}", expanded=True):
+        waterfall = pd.DataFrame(last_trace.waterfall())
+        if not waterfall.empty:
+            waterfall["stage"] = [f"{'  ' * d}{n} #{i}" for i, (d, n) in enumerate(zip(waterfall["depth"], waterfall["name"]))]
+            fig_trace = px.bar(
+                waterfall, x="duration_ms", y="stage", base="start_ms", orientation="h",
+                color="name", hover_data=["items", "bytes", "error"],
+                title="⏱️ Waterfall (ms)"
+            )
+            fig_trace.update_yaxes(autorange="reversed", title=None)
+            fig_trace.update_layout(height=max(300, 24 * len(waterfall)), showlegend=False)
+            st.plotly_chart(fig_trace, use_container_width=True)
+            summary = pd.DataFrame.from_dict(last_trace.summary(), orient="index").sort_values("duration_ms", ascending=False)
+            st.dataframe(summary, use_container_width=True)
+
 # Footer
 st.markdown("---")
 st.markdown("**ESG PDF Text Classification** - Modular architecture with clean separation")
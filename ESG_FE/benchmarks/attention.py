@@ -0,0 +1,133 @@
+"""
+Attention Benchmark
+Eager attention vs length-packed batches vs SDPA vs BetterTransformer on CPU,
+on the sentence-length distribution of real reports (PDF / labeled CSV) or a
+synthetic one. Checks logits against the eager, unpacked baseline.
+
+Per variant: effective attention mode, sentences/sec, padded tokens / real
+tokens, max |logit - eager| and argmax agreement. Exits 1 if a variant differs
+from eager by more than --tolerance.
+
+Usage:
+    python -m benchmarks.attention --pdf report_2023.pdf --model ESG_classify/models/ViBert-ESG-base
+    python -m benchmarks.attention --csv "../Tool label/labeled_data.csv" --batch-size 32
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+import torch
+
+from ESG_classify.esg_classifier import MODEL_MAP, detect_model_type, preprocess_vi_batch
+from benchmarks.fixtures import build_tiny_models, synthetic_sentences
+from utils.components import extract_pdf_text, normalize_full_text, split_sentences
+from utils.inference import encode_inputs, load_sequence_classifier, padded_tokens, predict_logits
+from utils.tokenization import load_tokenizer
+
+VARIANTS = [("eager", False), ("eager", True), ("sdpa", True), ("bettertransformer", True)]
+
+
+def load_sentences(pdfs: List[str], csv: str, text_column: str, limit: int) -> List[str]:
+    sentences = []
+    for path in pdfs or []:
+        with open(path, "rb") as f:
+            text, error = extract_pdf_text(f.read())
+        if error:
+            raise RuntimeError(error)
+        sentences.extend(split_sentences(normalize_full_text(text)))
+    if csv:
+        sentences.extend(pd.read_csv(csv)[text_column].dropna().astype(str).tolist())
+    return (sentences or synthetic_sentences(limit))[:limit]
+
+
+def run_variant(model_path: str, texts: List[str], attention: str, pack: bool, batch_size: int,
+                max_length: int, repeats: int) -> Dict:
+    ModelClass, TokenizerClass = MODEL_MAP[detect_model_type(model_path)]
+    tokenizer = load_tokenizer(model_path, TokenizerClass)
+    model, effective = load_sequence_classifier(ModelClass, model_path, attention, device=torch.device("cpu"))
+
+    chunks, _, _ = encode_inputs(tokenizer, texts, max_length, "window")
+    lengths = [len(c) for c in chunks]
+    padded = padded_tokens(sorted(lengths, reverse=True) if pack else lengths, batch_size)
+
+    def run():
+        return predict_logits(model, tokenizer, texts, max_length=max_length, batch_size=batch_size,
+                              long_text="window", device=torch.device("cpu"), pack=pack)[0]
+
+    logits = run()  # warmup
+    start = time.perf_counter()
+    for _ in range(repeats):
+        logits = run()
+    seconds = time.perf_counter() - start
+    return {
+        "attention": attention,
+        "effective_attention": effective,
+        "pack": pack,
+        "sent_per_sec": len(texts) * repeats / seconds if seconds > 0 else 0.0,
+        "pad_ratio": padded / max(sum(lengths), 1),
+        "logits": logits.float().cpu().numpy()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Eager vs packed vs SDPA vs BetterTransformer inference")
+    parser.add_argument("--model", help="Model dir (default: tiny bert fixture)")
+    parser.add_argument("--pdf", nargs="*", help="Reports to take sentences from")
+    parser.add_argument("--csv", help="CSV with sentences (e.g. labeled_data.csv)")
+    parser.add_argument("--text-column", default="Sentences")
+    parser.add_argument("--preprocess", action="store_true", help="preprocess_vi_text first (topic classifier input)")
+    parser.add_argument("--sentences", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--max-length", type=int, default=256)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--tolerance", type=float, default=1e-3, help="Max |logit - eager|")
+    parser.add_argument("--output", help="Write results JSON here")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    model_path = args.model or build_tiny_models(os.path.join(tempfile.gettempdir(), "esg_bench_models"))[0]
+    texts = load_sentences(args.pdf, args.csv, args.text_column, args.sentences)
+    if args.preprocess:
+        texts = preprocess_vi_batch(texts)
+
+    results = [run_variant(model_path, texts, attention, pack, args.batch_size, args.max_length, args.repeats)
+               for attention, pack in VARIANTS]
+    baseline_logits = results[0]["logits"]
+    baseline_speed = results[0]["sent_per_sec"]
+    word_counts = np.array([len(t.split()) for t in texts])
+    report = {
+        "model": model_path,
+        "sentences": len(texts),
+        "words_p50_p90_p99": [float(np.percentile(word_counts, q)) for q in (50, 90, 99)],
+        "variants": []
+    }
+    failed = False
+    for result in results:
+        logits = result.pop("logits")
+        result["max_abs_diff"] = float(np.abs(logits - baseline_logits).max()) if len(logits) else 0.0
+        result["argmax_agreement"] = float((logits.argmax(1) == baseline_logits.argmax(1)).mean()) if len(logits) else 1.0
+        result["speedup"] = result["sent_per_sec"] / max(baseline_speed, 1e-9)
+        failed |= result["max_abs_diff"] > args.tolerance
+        report["variants"].append(result)
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if failed:
+        print(f"❌ Có variant lệch eager quá tolerance {args.tolerance}")
+        sys.exit(1)
+    print("✅ Mọi variant khớp eager trong tolerance")
+
+
+if __name__ == "__main__":
+    main()
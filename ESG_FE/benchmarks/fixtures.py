@@ -0,0 +1,115 @@
+"""
+Benchmark Fixtures
+Synthetic report text / PDF and tiny randomly-initialized models, so the
+pipeline benchmark runs offline on CPU without the real checkpoints.
+
+The tiny models use the "bert" MODEL_MAP entry (BertForSequenceClassification +
+BertTokenizer with a vocab built from the synthetic corpus) and are saved in the
+same layout the app expects: a classifier dir and a sentiment root with
+environment/governance/social sub-dirs, each with model_metadata.json.
+"""
+
+import json
+import os
+import random
+from typing import List, Optional
+
+import fitz
+import torch
+from transformers import BertConfig, BertForSequenceClassification, BertTokenizer
+
+SPECIAL_TOKENS = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"]
+
+WORDS = (
+    "công ty phát triển bền vững môi trường khí thải nhà kính năng lượng tái tạo nước thải "
+    "chất thải rắn tiết kiệm điện người lao động an toàn sức khỏe đào tạo phúc lợi cộng đồng "
+    "khách hàng nhà cung cấp hội đồng quản trị cổ đông kiểm toán minh bạch rủi ro tuân thủ "
+    "chính sách quy định báo cáo thường niên doanh thu lợi nhuận tăng trưởng giảm năm kế hoạch "
+    "mục tiêu thực hiện đầu tư dự án hệ thống quản lý chất lượng trách nhiệm xã hội"
+).split()
+
+CATEGORY_LABELS = {
+    "environment": ["Environmental Negative", "Environmental Neutral", "Environmental Positive"],
+    "governance": ["Governance Negative", "Governance Neutral", "Governance Positive"],
+    "social": ["Social Negative", "Social Neutral", "Social Positive"]
+}
+TOPIC_LABELS = ["Irrelevant", "Environment", "Social", "Governance"]
+
+
+def synthetic_sentences(n: int, seed: int = 0, min_words: int = 8, max_words: int = 40) -> List[str]:
+    """Câu tiếng Việt giả lập với độ dài ngẫu nhiên (có cả câu dài hơn max_length)"""
+    rng = random.Random(seed)
+    sentences = []
+    for _ in range(n):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))]
+        sentences.append(" ".join(words).capitalize())
+    return sentences
+
+
+def synthetic_report(sentences: List[str], sentences_per_page: int = 30) -> str:
+    """Text dạng output của extract_pdf_text (có marker --- Page N ---)"""
+    pages = []
+    for i in range(0, len(sentences), sentences_per_page):
+        body = ". ".join(sentences[i:i + sentences_per_page]) + "."
+        pages.append(f"--- Page {i // sentences_per_page + 1} ---\n{body}")
+    return "\n".join(pages)
+
+
+def synthetic_pdf(sentences: List[str], sentences_per_page: int = 30, running_header: Optional[str] = None) -> bytes:
+    """PDF nhiều trang, mỗi trang một đoạn văn; running_header: thêm header + số trang ở footer"""
+    doc = fitz.open()
+    for i in range(0, len(sentences), sentences_per_page):
+        page = doc.new_page()
+        body = ". ".join(sentences[i:i + sentences_per_page]) + "."
+        page.insert_textbox(fitz.Rect(50, 50, page.rect.width - 50, page.rect.height - 50), body, fontsize=8)
+        if running_header:
+            page.insert_text((50, 30), running_header, fontsize=8)
+            page.insert_text((page.rect.width / 2, page.rect.height - 25), str(i // sentences_per_page + 1), fontsize=8)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def _build_vocab() -> List[str]:
+    pieces = set()
+    for word in WORDS:
+        pieces.add(word)
+        pieces.update(word)
+    return SPECIAL_TOKENS + sorted(pieces) + ["_", "."]
+
+
+def _save_tiny_model(path: str, vocab_file: str, vocab_size: int, labels: List[str], metadata: dict,
+                     hidden_size: int, num_layers: int, seed: int):
+    torch.manual_seed(seed)
+    config = BertConfig(vocab_size=vocab_size, hidden_size=hidden_size, num_hidden_layers=num_layers,
+                        num_attention_heads=max(1, hidden_size // 32), intermediate_size=hidden_size * 4,
+                        max_position_embeddings=512, num_labels=len(labels))
+    os.makedirs(path, exist_ok=True)
+    BertForSequenceClassification(config).save_pretrained(path)
+    BertTokenizer(vocab_file, do_lower_case=True).save_pretrained(path)
+    with open(os.path.join(path, "model_metadata.json"), "w", encoding="utf-8") as f:
+        json.dump(dict(metadata, label_names=labels), f, ensure_ascii=False, indent=2)
+
+
+def build_tiny_models(root: str, hidden_size: int = 64, num_layers: int = 2, seed: int = 0):
+    """
+    Tạo (nếu chưa có) model nhỏ khởi tạo ngẫu nhiên, trả về (classifier_path, sentiment_root).
+    Đường dẫn chứa "bert" để detect_model_type chọn BertForSequenceClassification.
+    """
+    classifier_path = os.path.join(root, "bert-tiny-classifier")
+    sentiment_root = os.path.join(root, "bert-tiny-sentiment")
+    if os.path.exists(os.path.join(classifier_path, "model_metadata.json")):
+        return classifier_path, sentiment_root
+
+    os.makedirs(root, exist_ok=True)
+    vocab = _build_vocab()
+    vocab_file = os.path.join(root, "vocab.txt")
+    with open(vocab_file, "w", encoding="utf-8") as f:
+        f.write("\n".join(vocab) + "\n")
+
+    _save_tiny_model(classifier_path, vocab_file, len(vocab), TOPIC_LABELS, {"category": "topic"},
+                     hidden_size, num_layers, seed)
+    for i, (category, labels) in enumerate(CATEGORY_LABELS.items(), start=1):
+        _save_tiny_model(os.path.join(sentiment_root, category), vocab_file, len(vocab), labels,
+                         {"category": category}, hidden_size, num_layers, seed + i)
+    return classifier_path, sentiment_root
@@ -0,0 +1,245 @@
+"""
+Pipeline Benchmark
+Times every stage of the report pipeline on a synthetic (or fixture) report with
+tiny random models on CPU, writes JSON and compares it against a stored baseline.
+
+Stages: pdf_extract, normalize, split_sentences, pyvi, preprocess, tokenize,
+classifier_predict (ESGClassifier.batch_predict), sentiment_predict
+(ESGModel.batch_predict), company_score (calculate_company_esg_score).
+
+Per stage: items/sec (pages, chars or sentences, see "unit"), p50/p99 latency of one call (page, document or batch)
+and peak RSS sampled while the stage runs.
+
+Usage:
+    python -m benchmarks.pipeline --sentences 2000 --output bench.json
+    python -m benchmarks.pipeline --pdf report.pdf --baseline benchmarks/baseline.json
+    python -m benchmarks.pipeline --write-baseline benchmarks/baseline.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+import torch
+from pyvi import ViTokenizer
+
+import ESG_classify.esg_classifier as esg_classifier
+import ESG_score.esg_model as esg_model
+from ESG_classify.esg_classifier import ESGClassifier
+from ESG_score.ESG_score import ESGScoreCalculator
+from ESG_score.esg_model import ESGModel
+from benchmarks.fixtures import build_tiny_models, synthetic_pdf, synthetic_sentences
+from utils.components import extract_pdf_text, normalize_full_text, split_sentences
+
+# một stage bị coi là regression nếu chậm / tốn RAM hơn baseline quá tolerance
+THROUGHPUT_KEY = "items_per_sec"
+LOWER_IS_BETTER = ("p50_ms", "p99_ms", "peak_rss_mb")
+
+
+def current_rss() -> int:
+    """RSS hiện tại (bytes), fallback về peak của process nếu không có /proc"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource  # không có trên Windows
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    except ImportError:
+        return 0
+
+
+class RSSSampler:
+    """Lấy mẫu RSS trong thread nền để có peak riêng cho từng stage"""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self.peak = current_rss()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+
+def run_stage(calls: List[Callable[[], int]], repeats: int = 1, unit: str = "sentences") -> Dict:
+    """calls: mỗi hàm xử lý một đơn vị (trang / document / batch) và trả về số item đã xử lý"""
+    latencies, items = [], 0
+    with RSSSampler() as rss:
+        for _ in range(max(repeats, 1)):
+            for call in calls:
+                start = time.perf_counter()
+                items += call()
+                latencies.append(time.perf_counter() - start)
+    total = sum(latencies)
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "unit": unit,
+        "items": items,
+        "calls": len(latencies),
+        "seconds": total,
+        "items_per_sec": items / total if total > 0 else 0.0,
+        "p50_ms": float(np.percentile(latencies_ms, 50)) if len(latencies) else 0.0,
+        "p99_ms": float(np.percentile(latencies_ms, 99)) if len(latencies) else 0.0,
+        "peak_rss_mb": rss.peak / 2 ** 20
+    }
+
+
+def batched(items: List, size: int) -> List[List]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def benchmark(pdf_bytes: bytes, model_root: str, batch_size: int = 32, repeats: int = 3) -> Dict[str, Dict]:
+    classifier_path, sentiment_root = build_tiny_models(model_root)
+    results = {}
+
+    # ---------- text ----------
+    results["pdf_extract"] = run_stage([lambda: len(extract_pdf_text(pdf_bytes)[0].split("--- Page")) - 1], repeats, "pages")
+    raw_text, error = extract_pdf_text(pdf_bytes)
+    if error:
+        raise RuntimeError(error)
+    results["normalize"] = run_stage([lambda: len(normalize_full_text(raw_text))], repeats, "chars")
+    text = normalize_full_text(raw_text)
+    results["split_sentences"] = run_stage([lambda: len(split_sentences(text))], repeats)
+    sentences = split_sentences(text)
+    if not sentences:
+        raise RuntimeError("Không tách được câu nào từ PDF")
+
+    batches = batched(sentences, batch_size)
+    results["pyvi"] = run_stage([lambda b=b: len([ViTokenizer.tokenize(s) for s in b]) for b in batches], repeats)
+
+    classifier = ESGClassifier(classifier_path)
+    if not classifier.is_ready():
+        raise RuntimeError(f"Không load được classifier: {classifier_path}")
+    results["preprocess"] = run_stage(
+        [lambda b=b: len([classifier.preproces_text(s) for s in b]) for b in batches], repeats)
+    processed = [classifier.preproces_text(s) for s in sentences]
+    processed_batches = batched(processed, batch_size)
+    results["tokenize"] = run_stage(
+        [lambda b=b: len(classifier.tokenizer(b, truncation=True, max_length=classifier.max_length)["input_ids"])
+         for b in processed_batches], repeats)
+
+    # ---------- models ----------
+    classifier.batch_predict(processed_batches[0])  # warmup
+    results["classifier_predict"] = run_stage(
+        [lambda b=b: len(classifier.batch_predict(b, batch_size=batch_size)) for b in processed_batches], repeats)
+
+    category = "environment"
+    sentiment = ESGModel(model_name=sentiment_root, num_labels=3, category=category)
+    sentiment.load_model(os.path.join(sentiment_root, category))
+    sentiment.batch_predict(batches[0])  # warmup
+    results["sentiment_predict"] = run_stage(
+        [lambda b=b: len(sentiment.batch_predict(b, batch_size=batch_size)) for b in batches], repeats)
+
+    # cả pipeline sentiment + score (gồm load 3 model trong classify_single_sentiment)
+    _, data = classifier.classify_text(sentences)
+    calculator = ESGScoreCalculator()
+    industry = next(iter(calculator.industry_esg_weights))
+    results["company_score"] = run_stage(
+        [lambda: calculator.calculate_company_esg_score(data, industry, sentiment_root)["total_sentences"]], repeats)
+    return results
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float = 0.2) -> List[str]:
+    """Các stage chậm / tốn RAM hơn baseline quá tolerance"""
+    regressions = []
+    for stage, base in baseline.items():
+        if stage not in results:
+            continue
+        current = results[stage]
+        if base.get(THROUGHPUT_KEY) and current[THROUGHPUT_KEY] < base[THROUGHPUT_KEY] * (1 - tolerance):
+            regressions.append(f"{stage}: {THROUGHPUT_KEY} {current[THROUGHPUT_KEY]:.1f} < "
+                               f"baseline {base[THROUGHPUT_KEY]:.1f}")
+        for key in LOWER_IS_BETTER:
+            if base.get(key) and current[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{stage}: {key} {current[key]:.1f} > baseline {base[key]:.1f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every stage of the ESG report pipeline")
+    parser.add_argument("--pdf", help="Fixture PDF (default: synthetic report)")
+    parser.add_argument("--sentences", type=int, default=1000, help="Synthetic report size")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--models", default=os.path.join(tempfile.gettempdir(), "esg_bench_models"),
+                        help="Where the tiny random models are created / reused")
+    parser.add_argument("--threads", type=int, default=None, help="torch.set_num_threads")
+    parser.add_argument("--output", help="Write results JSON here")
+    parser.add_argument("--baseline", help="Baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown (0.2 = 20%%)")
+    parser.add_argument("--write-baseline", help="Save these results as the new baseline")
+    args = parser.parse_args()
+
+    # benchmark luôn chạy trên CPU để số liệu so sánh được giữa các máy
+    esg_classifier.device = esg_model.device = torch.device("cpu")
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    if args.pdf:
+        with open(args.pdf, "rb") as f:
+            pdf_bytes = f.read()
+        workload = os.path.basename(args.pdf)
+    else:
+        pdf_bytes = synthetic_pdf(synthetic_sentences(args.sentences))
+        workload = f"synthetic-{args.sentences}"
+
+    results = benchmark(pdf_bytes, args.models, batch_size=args.batch_size, repeats=args.repeats)
+    report = {
+        "meta": {
+            "workload": workload,
+            "batch_size": args.batch_size,
+            "repeats": args.repeats,
+            "threads": torch.get_num_threads(),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "machine": platform.machine(),
+            "timestamp": time.time()
+        },
+        "stages": results
+    }
+
+    print(json.dumps(report, indent=2))
+    for path in (args.output, args.write_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("meta", {}).get("workload") != workload:
+            print(f"⚠️ Baseline workload {baseline.get('meta', {}).get('workload')} khác {workload}")
+        regressions = compare(results, baseline["stages"], args.tolerance)
+        if regressions:
+            print("❌ Regressions:")
+            for line in regressions:
+                print(f"  - {line}")
+            sys.exit(1)
+        print("✅ Không có regression so với baseline")
+
+
+if __name__ == "__main__":
+    main()
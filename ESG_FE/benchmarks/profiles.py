@@ -0,0 +1,96 @@
+"""
+Profile Benchmark
+Latency and agreement of the fast/balanced/accurate profiles.
+Agreement is measured against the "accurate" profile predictions.
+
+Usage:
+    python -m benchmarks.profiles --corpus temp_text/full_pdf.txt
+"""
+
+import argparse
+import os
+import time
+from typing import Dict, List
+
+import pandas as pd
+
+from ESG_classify.esg_classifier import ESGClassifier
+from ESG_score.esg_model import ESGModel
+from training.distill import SENTIMENT_CATEGORIES, load_corpus
+from utils.profiles import PROFILES, profile_max_length, resolve_model_path
+
+
+def _time_predict(predict_fn, texts: List[str]):
+    start = time.perf_counter()
+    results = predict_fn(texts)
+    elapsed = time.perf_counter() - start
+    return [r["class_id"] for r in results], elapsed
+
+
+def benchmark_classifier(model_path: str, texts: List[str]) -> Dict[str, dict]:
+    """Topic classifier: latency + class_id của mỗi profile"""
+    rows = {}
+    for name in PROFILES:
+        classifier = ESGClassifier(model_path, profile=name)
+        if not classifier.is_ready():
+            continue
+        processed = [classifier.preproces_text(text) for text in texts]
+        classifier.batch_predict(processed[:32])  # warmup
+        class_ids, elapsed = _time_predict(classifier.batch_predict, processed)
+        rows[name] = {"model": "topic", "class_ids": class_ids, "seconds": elapsed}
+    return rows
+
+
+def benchmark_sentiment(model_root: str, category: str, texts: List[str]) -> Dict[str, dict]:
+    """Một sentiment model: latency + class_id của mỗi profile"""
+    rows = {}
+    for name in PROFILES:
+        model_path, applied = resolve_model_path(os.path.join(model_root, category), name)
+        model = ESGModel(model_name=model_path, num_labels=3, category=category,
+                         max_length=profile_max_length(model_path, name, applied))
+        model.load_model(model_path)
+        model.batch_predict(texts[:16])  # warmup
+        class_ids, elapsed = _time_predict(model.batch_predict, texts)
+        rows[name] = {"model": category, "class_ids": class_ids, "seconds": elapsed}
+    return rows
+
+
+def summarize(rows: Dict[str, dict], num_texts: int) -> pd.DataFrame:
+    """Bảng latency / throughput / agreement so với profile accurate"""
+    reference = rows.get("accurate", next(iter(rows.values())))["class_ids"]
+    table = []
+    for name, row in rows.items():
+        agreement = sum(a == b for a, b in zip(row["class_ids"], reference)) / max(len(reference), 1)
+        table.append({
+            "model": row["model"],
+            "profile": name,
+            "ms/sentence": 1000 * row["seconds"] / max(num_texts, 1),
+            "sentences/s": num_texts / row["seconds"] if row["seconds"] else float("inf"),
+            "agreement": agreement
+        })
+    return pd.DataFrame(table)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark inference profiles")
+    parser.add_argument("--classifier", default=os.path.join("ESG_classify", "models", "ViBert-ESG-base"))
+    parser.add_argument("--sentiment", default=os.path.join("ESG_score", "models", "phobert-base"))
+    parser.add_argument("--corpus", nargs="+", required=True)
+    parser.add_argument("--limit", type=int, default=2000)
+    parser.add_argument("--output", default=None, help="Optional CSV output path")
+    args = parser.parse_args()
+
+    texts = load_corpus(args.corpus)[:args.limit]
+    tables = [summarize(benchmark_classifier(args.classifier, texts), len(texts))]
+    for category in SENTIMENT_CATEGORIES:
+        if os.path.exists(os.path.join(args.sentiment, category)):
+            tables.append(summarize(benchmark_sentiment(args.sentiment, category, texts), len(texts)))
+
+    table = pd.concat(tables, ignore_index=True)
+    print(table.to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+    if args.output:
+        table.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Replica Scaling Benchmark
+Throughput of one in-process model vs ReplicaPool configurations
+(replicas × threads per replica) and both dispatch policies, on synthetic
+sentences or a corpus file. Logits of every configuration are checked
+against the single-model run.
+
+Usage:
+    python -m benchmarks.replicas --configs 1x1 1x8 2x4 4x2 8x1 --sentences 4000
+    python -m benchmarks.replicas --model ESG_classify/models/ViBert-ESG-base --configs 1x32 4x8 8x4 16x2
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+import torch
+
+from ESG_classify.esg_classifier import MODEL_MAP, detect_model_type
+from benchmarks.fixtures import build_tiny_models, synthetic_sentences
+from utils.inference import load_sequence_classifier, predict_logits
+from utils.replicas import DISPATCH_POLICIES, ReplicaPool, numa_nodes, plan_core_sets
+from utils.tokenization import load_tokenizer
+
+
+def parse_config(value: str) -> Tuple[int, int]:
+    """"4x2" -> (4 replicas, 2 threads)"""
+    replicas, threads = value.lower().split("x")
+    return int(replicas), int(threads)
+
+
+def _throughput(model, tokenizer, texts: List[str], batch_size: int, max_length: int, repeats: int):
+    def run():
+        return predict_logits(model, tokenizer, texts, max_length=max_length, batch_size=batch_size,
+                              device=torch.device("cpu"), pack=True)[0]
+
+    logits = run()  # warmup
+    start = time.perf_counter()
+    for _ in range(repeats):
+        logits = run()
+    seconds = time.perf_counter() - start
+    return len(texts) * repeats / seconds if seconds > 0 else 0.0, logits.float().cpu().numpy()
+
+
+def run_config(model_path: str, texts: List[str], replicas: int, threads: int, policy: str,
+               batch_size: int, max_length: int, repeats: int) -> Dict:
+    ModelClass, TokenizerClass = MODEL_MAP[detect_model_type(model_path)]
+    tokenizer = load_tokenizer(model_path, TokenizerClass)
+    model, _ = load_sequence_classifier(ModelClass, model_path, "eager", device=torch.device("cpu"))
+    pool = ReplicaPool(model, tokenizer.pad_token_id or 0, replicas, threads, policy, name="bench")
+    try:
+        speed, logits = _throughput(pool, tokenizer, texts, batch_size, max_length, repeats)
+    finally:
+        pool.close()
+    return {"replicas": replicas, "threads": threads, "policy": policy, "core_sets": pool.core_sets,
+            "sent_per_sec": speed, "logits": logits}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput vs replica / thread configuration")
+    parser.add_argument("--model", help="Model dir (default: tiny bert fixture)")
+    parser.add_argument("--corpus", help="Text file, one sentence per line (default: synthetic)")
+    parser.add_argument("--sentences", type=int, default=2000)
+    parser.add_argument("--configs", nargs="+", default=["1x1", "1x4", "2x2", "4x1"],
+                        help="REPLICASxTHREADS, e.g. 4x2")
+    parser.add_argument("--policies", nargs="+", default=list(DISPATCH_POLICIES), choices=DISPATCH_POLICIES)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--max-length", type=int, default=256)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", help="Write results JSON here")
+    args = parser.parse_args()
+
+    model_path = args.model or build_tiny_models(os.path.join(tempfile.gettempdir(), "esg_bench_models"))[0]
+    if args.corpus:
+        with open(args.corpus, "r", encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()][:args.sentences]
+    else:
+        texts = synthetic_sentences(args.sentences)
+    configs = [parse_config(c) for c in args.configs]
+
+    # Baseline: một model trong process, số thread = config lớn nhất
+    max_threads = max(r * t for r, t in configs)
+    torch.set_num_threads(max_threads)
+    ModelClass, TokenizerClass = MODEL_MAP[detect_model_type(model_path)]
+    tokenizer = load_tokenizer(model_path, TokenizerClass)
+    model, _ = load_sequence_classifier(ModelClass, model_path, "eager", device=torch.device("cpu"))
+    baseline_speed, baseline_logits = _throughput(model, tokenizer, texts, args.batch_size, args.max_length,
+                                                  args.repeats)
+    del model
+
+    report = {
+        "model": model_path,
+        "sentences": len(texts),
+        "numa_nodes": [len(node) for node in numa_nodes()],
+        "baseline": {"replicas": 0, "threads": max_threads, "sent_per_sec": baseline_speed},
+        "configs": []
+    }
+    for replicas, threads in configs:
+        print(f"{replicas}x{threads}: cores {plan_core_sets(replicas, threads)}")
+        for policy in args.policies:
+            result = run_config(model_path, texts, replicas, threads, policy, args.batch_size,
+                                args.max_length, args.repeats)
+            logits = result.pop("logits")
+            result["speedup_vs_single"] = result["sent_per_sec"] / max(baseline_speed, 1e-9)
+            result["max_abs_diff"] = float(np.abs(logits - baseline_logits).max()) if len(logits) else 0.0
+            report["configs"].append(result)
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
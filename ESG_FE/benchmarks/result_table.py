@@ -0,0 +1,89 @@
+"""
+Result Table Benchmark
+Time and peak memory of post-processing N sentence predictions:
+list-of-dicts + DataFrame + boolean masks (old path) vs PredictionTable (np.bincount).
+Runs on synthetic logits, no model needed.
+
+Usage:
+    python -m benchmarks.result_table --rows 1000000
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import torch
+
+from utils.inference import PredictionTable
+
+LABELS = ['Environmental Negative', 'Environmental Neutral', 'Environmental Positive']
+
+
+def legacy_counts(logits: torch.Tensor) -> dict:
+    """Old path: dict per prediction -> DataFrame -> mask -> sum() over Python booleans"""
+    probabilities = torch.softmax(logits, dim=-1)
+    predicted_class_idxs = torch.argmax(probabilities, dim=-1)
+    results = []
+    for idx, probs in zip(predicted_class_idxs, probabilities):
+        results.append({
+            "class": LABELS[idx.item()],
+            "confidence": probs[idx].item(),
+            "class_id": idx.item()
+        })
+    result_df = pd.DataFrame([{"label": r["class"], "confidence": r["confidence"]} for r in results])
+    result_df.loc[result_df["confidence"] < 0.6, "label"] = LABELS[1]
+    return {
+        "Positive": sum(result_df["label"] == LABELS[2]),
+        "Neutral": sum(result_df["label"] == LABELS[1]),
+        "Negative": sum(result_df["label"] == LABELS[0])
+    }
+
+
+def table_counts(logits: torch.Tensor) -> dict:
+    """New path: columnar PredictionTable + np.bincount"""
+    table = PredictionTable.from_logits(logits, LABELS).with_fallback(0.6, 1)
+    counts = table.counts_by_label()
+    return {"Positive": counts[LABELS[2]], "Neutral": counts[LABELS[1]], "Negative": counts[LABELS[0]]}
+
+
+def measure(fn, logits: torch.Tensor):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(logits)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-sentence result post-processing")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--skip-legacy", action="store_true", help="Only time the columnar path")
+    args = parser.parse_args()
+
+    logits = torch.from_numpy(np.random.RandomState(0).randn(args.rows, len(LABELS)).astype(np.float32) * 2)
+    per_million = 1_000_000 / args.rows
+
+    rows = []
+    paths = [("PredictionTable", table_counts)]
+    if not args.skip_legacy:
+        paths.insert(0, ("list-of-dicts", legacy_counts))
+    reference = None
+    for name, fn in paths:
+        counts, elapsed, peak = measure(fn, logits)
+        reference = reference or counts
+        rows.append({
+            "path": name,
+            "s / 1M sentences": elapsed * per_million,
+            "peak MB / 1M sentences": peak / 2 ** 20 * per_million,
+            "counts match": counts == reference
+        })
+
+    print(pd.DataFrame(rows).to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+
+
+if __name__ == "__main__":
+    main()
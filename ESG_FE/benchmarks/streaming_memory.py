@@ -0,0 +1,93 @@
+"""
+Streaming Memory Check
+Chạy StreamingAnalyzer trên PDF tổng hợp với số trang tăng dần (mỗi lần trong
+một process riêng) và kiểm tra peak RSS không vượt quá cap, bất kể số trang.
+Dùng tiny random models (benchmarks/fixtures.py), chạy offline trên CPU.
+
+Usage:
+    python -m benchmarks.streaming_memory --pages 50 200 500 --cap-mb 1500
+Exit code 1 nếu có lần chạy vượt cap.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.fixtures import build_tiny_models, synthetic_pdf, synthetic_sentences
+from benchmarks.pipeline import current_rss, RSSSampler
+
+
+def run_child(pdf_path: str, model_root: str, window_pages: int, results_path: str):
+    """Process con: chạy streaming analysis, in ra peak RSS (MB) dạng JSON"""
+    import torch
+    import ESG_classify.esg_classifier as esg_classifier
+    import ESG_score.esg_model as esg_model
+    from ESG_classify.esg_classifier import ESGClassifier
+    from ESG_score.ESG_score import ESGScoreCalculator
+    from utils.streaming import StreamingAnalyzer
+
+    esg_classifier.device = esg_model.device = torch.device("cpu")
+    classifier_path, sentiment_root = build_tiny_models(model_root)
+    classifier = ESGClassifier(classifier_path)
+    calculator = ESGScoreCalculator(cache_models=True)
+    industry = next(iter(calculator.industry_esg_weights))
+    analyzer = StreamingAnalyzer(classifier, calculator, sentiment_root, window_pages=window_pages,
+                                 results_path=results_path)
+    baseline = current_rss()
+    with RSSSampler() as rss:
+        result = analyzer.run(pdf_path, industry)
+    print(json.dumps({
+        "pages": result["pages"],
+        "sentences": result["sentences"],
+        "baseline_rss_mb": baseline / 2 ** 20,
+        "peak_rss_mb": rss.peak / 2 ** 20
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check streaming analysis peak RSS against a cap")
+    parser.add_argument("--pages", type=int, nargs="+", default=[50, 200, 500])
+    parser.add_argument("--sentences-per-page", type=int, default=30)
+    parser.add_argument("--window-pages", type=int, default=20)
+    parser.add_argument("--cap-mb", type=float, default=1500, help="Peak RSS cap per run")
+    parser.add_argument("--models", default=os.path.join(tempfile.gettempdir(), "esg_bench_models"))
+    parser.add_argument("--child", nargs=2, metavar=("PDF", "RESULTS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child[0], args.models, args.window_pages, args.child[1])
+        return
+
+    build_tiny_models(args.models)
+    runs, failed = [], False
+    with tempfile.TemporaryDirectory() as tmp:
+        for pages in args.pages:
+            pdf_path = os.path.join(tmp, f"report_{pages}.pdf")
+            sentences = synthetic_sentences(pages * args.sentences_per_page, seed=pages)
+            with open(pdf_path, "wb") as f:
+                f.write(synthetic_pdf(sentences, args.sentences_per_page))
+            del sentences
+
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.streaming_memory", "--child", pdf_path,
+                 os.path.join(tmp, f"results_{pages}.csv"), "--models", args.models,
+                 "--window-pages", str(args.window_pages)],
+                check=True, capture_output=True, text=True
+            ).stdout
+            run = json.loads(output.strip().splitlines()[-1])
+            ok = run["peak_rss_mb"] <= args.cap_mb
+            failed |= not ok
+            runs.append(run)
+            print(f"{'✅' if ok else '❌'} {pages} trang, {run['sentences']} câu: "
+                  f"peak RSS {run['peak_rss_mb']:.0f} MB (cap {args.cap_mb:.0f} MB)")
+
+    growth = runs[-1]["peak_rss_mb"] - runs[0]["peak_rss_mb"]
+    print(f"RSS tăng {growth:.0f} MB từ {runs[0]['pages']} lên {runs[-1]['pages']} trang")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Tokenizer Benchmark
+Token-id parity and throughput of the slow MODEL_MAP tokenizer vs the fast
+tokenizer from utils.tokenization.load_tokenizer, plus encode_inputs with a warm
+EncodingCache (repeated sentences).
+
+Usage:
+    python -m benchmarks.tokenize_speed ESG_classify/models/ViBert-ESG-base ESG_score/models/phobert-base/environment
+    python -m benchmarks.tokenize_speed --sentences 5000 --csv Data/labeled_data.csv
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from typing import Dict, List
+
+import pandas as pd
+from transformers import AutoTokenizer
+
+from ESG_classify.esg_classifier import MODEL_MAP, detect_model_type
+from benchmarks.fixtures import build_tiny_models, synthetic_sentences
+from utils.inference import encode_inputs
+from utils.tokenization import EncodingCache, check_parity, load_tokenizer
+
+
+def _throughput(fn, texts: List[str], repeats: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn(texts)
+    seconds = time.perf_counter() - start
+    return len(texts) * repeats / seconds if seconds > 0 else 0.0
+
+
+def benchmark_model(model_path: str, texts: List[str], max_length: int = 256, repeats: int = 3) -> Dict:
+    _, TokenizerClass = MODEL_MAP[detect_model_type(model_path)]
+    if TokenizerClass is AutoTokenizer:
+        slow = AutoTokenizer.from_pretrained(model_path, use_fast=False)
+    else:
+        slow = TokenizerClass.from_pretrained(model_path)
+    chosen = load_tokenizer(model_path, TokenizerClass, samples=texts[:200])
+
+    def encode(tokenizer, cache=None):
+        return lambda batch: encode_inputs(tokenizer, batch, max_length, "window", cache=cache)
+
+    cache = EncodingCache()
+    encode(chosen, cache)(texts)  # warm
+    report = {
+        "model": model_path,
+        "slow_class": type(slow).__name__,
+        "chosen_class": type(chosen).__name__,
+        "fast": bool(getattr(chosen, "is_fast", False)),
+        "parity_mismatches": check_parity(chosen, slow, texts) if chosen is not slow else [],
+        "slow_sent_per_sec": _throughput(encode(slow), texts, repeats),
+        "chosen_sent_per_sec": _throughput(encode(chosen), texts, repeats),
+        "cached_sent_per_sec": _throughput(encode(chosen, cache), texts, repeats)
+    }
+    report["speedup"] = report["chosen_sent_per_sec"] / max(report["slow_sent_per_sec"], 1e-9)
+    report["cached_speedup"] = report["cached_sent_per_sec"] / max(report["slow_sent_per_sec"], 1e-9)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Slow vs fast vs cached tokenization")
+    parser.add_argument("models", nargs="*", help="Model dirs (default: tiny bert fixture)")
+    parser.add_argument("--csv", help="Sentences from this CSV instead of synthetic ones")
+    parser.add_argument("--text-column", default="Sentences")
+    parser.add_argument("--sentences", type=int, default=2000)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", help="Write results JSON here")
+    args = parser.parse_args()
+
+    if args.csv:
+        texts = pd.read_csv(args.csv)[args.text_column].dropna().astype(str).tolist()[:args.sentences]
+    else:
+        texts = synthetic_sentences(args.sentences)
+    models = args.models or [build_tiny_models(os.path.join(tempfile.gettempdir(), "esg_bench_models"))[0]]
+
+    results = [benchmark_model(path, texts, repeats=args.repeats) for path in models]
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+    for result in results:
+        if result["parity_mismatches"]:
+            print(f"❌ {result['model']}: {len(result['parity_mismatches'])} câu lệch token-id")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,25 @@
 // PDF Viewer JavaScript
-const pdfData = new Uint8Array(PDF_DATA_PLACEHOLDER);
+const pdfData = Uint8Array.from(atob(PDF_DATA_PLACEHOLDER), c => c.charCodeAt(0));
+
+// Nén gzip trước khi gửi (server giải nén theo Content-Encoding); trình duyệt
+// không có CompressionStream hoặc text ngắn thì gửi thẳng
+const COMPRESS_MIN_CHARS = 1024;
+async function postText(url, text) {
+    const headers = { 'Content-Type': 'text/plain; charset=utf-8' };
+    let body = text;
+    if (typeof CompressionStream !== 'undefined' && text.length >= COMPRESS_MIN_CHARS) {
+        try {
+            const stream = new Blob([text]).stream().pipeThrough(new CompressionStream('gzip'));
+            body = await new Response(stream).blob();
+            headers['Content-Encoding'] = 'gzip';
+        } catch (error) {
+            console.warn('⚠️ Không nén được, gửi không nén:', error);
+            body = text;
+        }
+    }
+    return fetch(url, { method: 'POST', headers, body });
+}
+
 let isReady = false;
 let currentScale = 1.2;
 let pdfDoc = null;
@@ -300,11 +320,7 @@ function setupSelectionHandlers() {
                 statusEl.style.color = '#856404';
 
                 // Gửi POST với encoding utf-8
-                fetch('http://localhost:8888/save-text', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'text/plain; charset=utf-8' },
-                    body: selectedText
-                }).then(response => {
+                postText('http://localhost:8888/save-text', selectedText).then(response => {
                     if (response.ok) {
                         statusEl.textContent = '✅ Đã lưu ' + selectedText.length + ' ký tự vào file!';
                         statusEl.style.background = '#d4edda';
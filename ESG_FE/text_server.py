@@ -1,4 +1,8 @@
 #!/usr/bin/env python3
+import os
+import codecs
+import hashlib
+import zlib
 import http.server
 import socketserver
 from pathlib import Path
@@ -9,15 +13,55 @@ from threading import Thread
 import sys
 from pyvi import ViTokenizer
 import re
+from utils.metrics import REGISTRY, HTTP_REQUESTS, HTTP_LATENCY, HTTP_REQUEST_BYTES, HTTP_IN_FLIGHT
 
 PORT = 8888
 TEMP_DIR = Path("temp_text")
 TEMP_DIR.mkdir(exist_ok=True)
 TEXT_FILE = TEMP_DIR / "selected.txt"
 FULL_PDF_FILE = TEMP_DIR / "full_pdf.txt"
+ROUTES = {'/save-text', '/save-full-pdf', '/status', '/metrics'}
+READ_CHUNK = 64 * 1024
+MAX_BODY_BYTES = 64 * 1024 * 1024  # giới hạn sau khi giải nén
+CONTENT_ENCODINGS = {'identity', 'gzip', 'x-gzip', 'deflate'}
+
+class BodyTooLarge(Exception):
+    pass
 
 class TextHandler(http.server.BaseHTTPRequestHandler):
+    def send_response(self, code, message=None):
+        self._status = code
+        super().send_response(code, message)
+    
+    def _instrumented(self, handler):
+        """Request count / latency / payload size theo route (route lạ gộp vào 'other')"""
+        route = self.path.split('?', 1)[0]
+        route = route if route in ROUTES else 'other'
+        self._status = 0
+        HTTP_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            handler()
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            HTTP_LATENCY.observe(time.perf_counter() - start, route=route)
+            HTTP_REQUESTS.inc(route=route, method=self.command, status=self._status)
+            if self.command == 'POST':
+                body_bytes = getattr(self, '_body_bytes', None)
+                if body_bytes is None:
+                    body_bytes = int(self.headers.get('Content-Length') or 0)
+                HTTP_REQUEST_BYTES.observe(body_bytes, route=route)
+    
     def do_POST(self):
+        self._instrumented(self._handle_post)
+    
+    def do_GET(self):
+        self._instrumented(self._handle_get)
+    
+    def do_OPTIONS(self):
+        self._instrumented(self._handle_options)
+    
+    def _handle_post(self):
         if self.path == '/save-text':
             self._save_text(TEXT_FILE, "Selected text")
         elif self.path == '/save-full-pdf':
@@ -26,71 +70,165 @@ class TextHandler(http.server.BaseHTTPRequestHandler):
             self.send_response(404)
             self.end_headers()
     
+    def _iter_raw_body(self):
+        """Body thô theo từng khối: Transfer-Encoding chunked hoặc Content-Length"""
+        self._body_bytes = 0
+        if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            while True:
+                size_line = self.rfile.readline(1024)
+                size = int(size_line.split(b';', 1)[0].strip() or b'0', 16)
+                if size == 0:
+                    # bỏ qua trailers cho tới dòng trống
+                    while self.rfile.readline(1024) not in (b'\r\n', b'\n', b''):
+                        pass
+                    return
+                remaining = size
+                while remaining:
+                    data = self.rfile.read(min(remaining, READ_CHUNK))
+                    if not data:
+                        raise ValueError('Unexpected end of chunked body')
+                    remaining -= len(data)
+                    self._body_bytes += len(data)
+                    yield data
+                self.rfile.readline(1024)  # CRLF sau mỗi chunk
+        else:
+            remaining = int(self.headers.get('Content-Length') or 0)
+            while remaining:
+                data = self.rfile.read(min(remaining, READ_CHUNK))
+                if not data:
+                    raise ValueError('Unexpected end of body')
+                remaining -= len(data)
+                self._body_bytes += len(data)
+                yield data
+    
+    def _iter_body(self):
+        """Body đã giải nén (Content-Encoding gzip / deflate), giới hạn MAX_BODY_BYTES"""
+        encoding = self.headers.get('Content-Encoding', 'identity').strip().lower()
+        if encoding not in CONTENT_ENCODINGS:
+            raise ValueError(f'Unsupported Content-Encoding: {encoding}')
+        decompressor = None
+        total = 0
+        for data in self._iter_raw_body():
+            if encoding != 'identity':
+                if decompressor is None:
+                    # gzip / zlib tự nhận dạng header, deflate "raw" (không header) dùng wbits âm
+                    zlib_header = len(data) >= 2 and data[0] & 0x0f == 8 and ((data[0] << 8) | data[1]) % 31 == 0
+                    wbits = 32 + zlib.MAX_WBITS if encoding != 'deflate' or zlib_header else -zlib.MAX_WBITS
+                    decompressor = zlib.decompressobj(wbits)
+                data = decompressor.decompress(data, MAX_BODY_BYTES - total + 1)
+                if decompressor.unconsumed_tail:
+                    raise BodyTooLarge(f'Body exceeds {MAX_BODY_BYTES} bytes')
+            total += len(data)
+            if total > MAX_BODY_BYTES:
+                raise BodyTooLarge(f'Body exceeds {MAX_BODY_BYTES} bytes')
+            if data:
+                yield data
+        if decompressor is not None:
+            tail = decompressor.flush()
+            if total + len(tail) > MAX_BODY_BYTES:
+                raise BodyTooLarge(f'Body exceeds {MAX_BODY_BYTES} bytes')
+            if tail:
+                yield tail
+    
+    def _send_json(self, code, payload):
+        self.send_response(code)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'POST')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Content-Encoding')
+        self.send_header('Content-type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps(payload).encode())
+    
     def _save_text(self, file_path, description):
+        tmp_path = file_path.with_name(file_path.name + '.tmp')
+        metadata_file = TEMP_DIR / f"{file_path.stem}_metadata.json"
         try:
-            # Get content length
-            content_length = int(self.headers['Content-Length'])
+            # Stream body -> file tạm, tính sha256 / số ký tự / preview trên đường đi
+            digest = hashlib.sha256()
+            decoder = codecs.getincrementaldecoder('utf-8')()
+            length, preview = 0, ''
+            with open(tmp_path, 'wb') as f:
+                for data in self._iter_body():
+                    digest.update(data)
+                    text = decoder.decode(data)
+                    length += len(text)
+                    if len(preview) <= 100:
+                        preview += text[:101 - len(preview)]
+                    f.write(data)
+                length += len(decoder.decode(b'', final=True))  # lỗi nếu UTF-8 không hợp lệ
+            content_hash = digest.hexdigest()
             
-            # Read the text data
-            text_data = self.rfile.read(content_length).decode('utf-8')
+            # Nội dung không đổi: giữ nguyên file (mtime không đổi nên app không đọc lại)
+            previous = {}
+            if metadata_file.exists():
+                with open(metadata_file, 'r', encoding='utf-8') as f:
+                    previous = json.load(f)
+            if file_path.exists() and previous.get('sha256') == content_hash:
+                os.remove(tmp_path)
+                self._send_json(200, {
+                    'status': 'success',
+                    'message': f'{description} unchanged ({length} characters)',
+                    'unchanged': True,
+                    'sha256': content_hash,
+                    'timestamp': time.time(),
+                    'file': str(file_path.name)
+                })
+                return
             
-            # Save to file
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(text_data)
+            # Save to file (thay thế nguyên tử)
+            os.replace(tmp_path, file_path)
             
             # Save metadata
             metadata = {
                 'timestamp': time.time(),
-                'length': len(text_data),
+                'length': length,
+                'sha256': content_hash,
                 'type': description,
-                'preview': text_data[:100] + "..." if len(text_data) > 100 else text_data
+                'preview': preview[:100] + "..." if length > 100 else preview
             }
             
-            metadata_file = TEMP_DIR / f"{file_path.stem}_metadata.json"
             with open(metadata_file, 'w', encoding='utf-8') as f:
                 json.dump(metadata, f, indent=2)
             
             # Send success response
-            self.send_response(200)
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.send_header('Access-Control-Allow-Methods', 'POST')
-            self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            
-            response = {
+            self._send_json(200, {
                 'status': 'success',
-                'message': f'{description} saved ({len(text_data)} characters)',
+                'message': f'{description} saved ({length} characters)',
+                'unchanged': False,
+                'sha256': content_hash,
                 'timestamp': time.time(),
                 'file': str(file_path.name)
-            }
-            
-            self.wfile.write(json.dumps(response).encode())
-            print(f"✅ {description}: {len(text_data)} characters → {file_path.name}")
+            })
+            print(f"✅ {description}: {length} characters → {file_path.name}")
             
         except Exception as e:
             print(f"❌ Error saving {description}: {e}")
-            self.send_response(500)
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            
-            error_response = {
+            if tmp_path.exists():
+                os.remove(tmp_path)
+            code = 413 if isinstance(e, BodyTooLarge) else 400 if isinstance(e, (ValueError, zlib.error)) else 500
+            self.close_connection = True  # body có thể chưa đọc hết
+            self._send_json(code, {
                 'status': 'error',
                 'message': str(e)
-            }
-            self.wfile.write(json.dumps(error_response).encode())
+            })
     
-    def do_OPTIONS(self):
+    def _handle_options(self):
         # Handle CORS preflight
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Content-Encoding')
         self.end_headers()
     
-    def do_GET(self):
-        if self.path == '/status':
+    def _handle_get(self):
+        if self.path == '/metrics':
+            body = REGISTRY.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif self.path == '/status':
             self.send_response(200)
             self.send_header('Access-Control-Allow-Origin', '*')
             self.send_header('Content-type', 'application/json')
@@ -117,8 +255,9 @@ class TextHandler(http.server.BaseHTTPRequestHandler):
             self.end_headers()
     
     def log_message(self, format, *args):
-        # Suppress default logging
-        pass
+        # Suppress default logging (ESG_ACCESS_LOG=1 để bật), số liệu request có ở /metrics
+        if os.environ.get('ESG_ACCESS_LOG'):
+            super().log_message(format, *args)
 
 def start_server():
     """Start the text server"""
@@ -0,0 +1 @@
+# Training package
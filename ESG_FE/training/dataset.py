@@ -0,0 +1,282 @@
+"""
+Pre-tokenized Dataset
+Runs preprocess + pyvi and the model tokenizer once over the labeled CSVs
+(Tool label/labeled_data.csv format: Sentences, E, G, S, I) and stores the
+token ids in a flat memory-mapped file, so fine-tuning / evaluation epochs
+only read integers from disk.
+
+Layout of <output>/:
+    tokens.bin     token ids of every sentence, concatenated (uint16 or int32)
+    offsets.npy    int64 (n + 1,), sentence i = tokens[offsets[i]:offsets[i + 1]]
+    labels.npy     uint8 (n, 4) multi-hot in LABEL_COLUMNS order
+    class_ids.npy  int8 (n,) ESGClassifier class_id, -1 when not exactly one label
+    hashes.npy     uint64 (n,) sentence hash, used for dedup and the train/eval split
+    meta.json      tokenizer, max_length, dtype, build stats
+
+Usage:
+    python -m training.dataset build --csv "../Tool label/labeled_data.csv" \
+        --tokenizer ESG_classify/models/ViBert-ESG-base --output data/esg_tokens
+    python -m training.dataset inspect data/esg_tokens
+"""
+
+import argparse
+import json
+import os
+import random
+from functools import partial
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import torch
+from torch.utils.data import DataLoader, Dataset, Sampler
+
+from ESG_classify.esg_classifier import MODEL_MAP, detect_model_type, preprocess_vi_text
+from utils.dedup import exact_key, in_eval_split, sentence_hash
+from utils.tokenization import load_tokenizer as load_fast_or_slow
+
+LABEL_COLUMNS = ["E", "S", "G", "I"]
+# cột nhãn -> class_id của ESGClassifier (0: Irrelevant, 1: Environment, 2: Social, 3: Governance)
+COLUMN_TO_CLASS = {"I": 0, "E": 1, "S": 2, "G": 3}
+
+
+def load_tokenizer(model_path: str):
+    """Cùng tokenizer với lúc inference (fast nếu khớp token-id với slow)"""
+    _, TokenizerClass = MODEL_MAP[detect_model_type(model_path)]
+    return load_fast_or_slow(model_path, TokenizerClass)
+
+
+def load_labeled(paths: List[str], text_column: str = "Sentences") -> pd.DataFrame:
+    """Gộp các CSV đã gán nhãn, cột nhãn thiếu / lỗi được coi là 0"""
+    frames = []
+    for path in paths:
+        df = pd.read_csv(path)
+        if text_column not in df.columns:
+            raise ValueError(f"{path} không có cột '{text_column}'")
+        df = df.rename(columns={text_column: "Sentences"})
+        for col in LABEL_COLUMNS:
+            df[col] = (pd.to_numeric(df[col], errors="coerce") == 1).astype(np.uint8) if col in df.columns else 0
+        frames.append(df[["Sentences"] + LABEL_COLUMNS])
+    data = pd.concat(frames, ignore_index=True)
+    data = data[data["Sentences"].notna()]
+    data["Sentences"] = data["Sentences"].astype(str)
+    return data.reset_index(drop=True)
+
+
+def build_dataset(csv_paths: List[str],
+                  tokenizer_path: str,
+                  output_dir: str,
+                  max_length: int = 256,
+                  text_column: str = "Sentences",
+                  preprocess: bool = True,
+                  batch_size: int = 1024) -> Dict:
+    """
+    Dedup theo hash câu, preprocess (pyvi) và tokenize một lần, ghi ra output_dir.
+    preprocess=False cho sentiment models (nhận câu thô như classify_single_sentiment).
+    """
+    data = load_labeled(csv_paths, text_column)
+    keys = [exact_key(s) for s in data["Sentences"]]
+
+    # câu trùng: giữ lần xuất hiện đầu, đếm số câu trùng có nhãn khác
+    first = {}
+    conflicts = 0
+    labels = data[LABEL_COLUMNS].to_numpy(dtype=np.uint8)
+    for i, key in enumerate(keys):
+        if key not in first:
+            first[key] = i
+        elif not np.array_equal(labels[first[key]], labels[i]):
+            conflicts += 1
+    kept = list(first.values())
+    sentences = data["Sentences"].to_numpy()[kept].tolist()
+    labels = labels[kept]
+    hashes = np.array([sentence_hash(s) for s in sentences], dtype=np.uint64)
+    print(f"{len(data)} câu, {len(kept)} sau dedup ({conflicts} câu trùng có nhãn khác)")
+
+    texts = [preprocess_vi_text(s) for s in sentences] if preprocess else sentences
+
+    tokenizer = load_tokenizer(tokenizer_path)
+    dtype = np.uint16 if len(tokenizer) <= np.iinfo(np.uint16).max + 1 else np.int32
+    os.makedirs(output_dir, exist_ok=True)
+
+    lengths, truncated = [], 0
+    with open(os.path.join(output_dir, "tokens.bin"), "wb") as f:
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            encoded = tokenizer(batch, truncation=False)["input_ids"]
+            # đếm câu bị cắt theo độ dài trước khi cắt, chỉ encode lại những câu đó
+            long_rows = [i for i, ids in enumerate(encoded) if len(ids) > max_length]
+            if long_rows:
+                cut = tokenizer([batch[i] for i in long_rows], truncation=True, max_length=max_length)["input_ids"]
+                for i, ids in zip(long_rows, cut):
+                    encoded[i] = ids
+                truncated += len(long_rows)
+            for ids in encoded:
+                f.write(np.asarray(ids, dtype=dtype).tobytes())
+                lengths.append(len(ids))
+
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    one_label = labels.sum(axis=1) == 1
+    class_ids = np.full(len(labels), -1, dtype=np.int8)
+    class_ids[one_label] = np.array([COLUMN_TO_CLASS[c] for c in LABEL_COLUMNS], dtype=np.int8)[labels[one_label].argmax(axis=1)]
+
+    np.save(os.path.join(output_dir, "offsets.npy"), offsets)
+    np.save(os.path.join(output_dir, "labels.npy"), labels)
+    np.save(os.path.join(output_dir, "class_ids.npy"), class_ids)
+    np.save(os.path.join(output_dir, "hashes.npy"), hashes)
+
+    meta = {
+        "tokenizer": tokenizer_path,
+        "max_length": max_length,
+        "preprocess": preprocess,
+        "dtype": np.dtype(dtype).name,
+        "pad_token_id": tokenizer.pad_token_id or 0,
+        "label_columns": LABEL_COLUMNS,
+        "sources": csv_paths,
+        "rows": len(data),
+        "sentences": len(kept),
+        "duplicates": len(data) - len(kept),
+        "label_conflicts": conflicts,
+        "tokens": int(offsets[-1]),
+        "truncated": truncated
+    }
+    with open(os.path.join(output_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    print(f"✅ Dataset đã được lưu: {output_dir} ({meta['tokens']} tokens)")
+    return meta
+
+
+class TokenizedDataset(Dataset):
+    """Đọc dataset đã build, token ids được memory-map (không load cả file vào RAM)"""
+
+    def __init__(self, path: str, indices: Optional[np.ndarray] = None):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.tokens = np.memmap(os.path.join(path, "tokens.bin"), dtype=self.meta["dtype"], mode="r")
+        self.offsets = np.load(os.path.join(path, "offsets.npy"))
+        self.labels = np.load(os.path.join(path, "labels.npy"))
+        self.class_ids = np.load(os.path.join(path, "class_ids.npy"))
+        self.hashes = np.load(os.path.join(path, "hashes.npy"))
+        self.indices = np.arange(len(self.labels)) if indices is None else np.asarray(indices)
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def lengths(self) -> np.ndarray:
+        i = self.indices
+        return self.offsets[i + 1] - self.offsets[i]
+
+    def __getitem__(self, item: int) -> Dict:
+        i = self.indices[item]
+        ids = self.tokens[self.offsets[i]:self.offsets[i + 1]].astype(np.int64)
+        return {"input_ids": ids, "labels": self.labels[i], "class_id": int(self.class_ids[i])}
+
+    def subset(self, indices) -> "TokenizedDataset":
+        dataset = TokenizedDataset.__new__(TokenizedDataset)
+        dataset.__dict__.update(self.__dict__)
+        dataset.indices = self.indices[np.asarray(indices)]
+        return dataset
+
+    def split(self, eval_percent: int = 10):
+        """Chia train/eval theo hash câu: cố định giữa các lần build, câu trùng không lọt sang cả hai phía"""
+        is_eval = in_eval_split(self.hashes[self.indices], eval_percent)
+        return self.subset(np.flatnonzero(~is_eval)), self.subset(np.flatnonzero(is_eval))
+
+
+class LengthBucketSampler(Sampler):
+    """
+    Batch các câu có độ dài gần nhau để giảm padding:
+    xáo trộn, sắp theo độ dài trong từng bucket (bucket_batches batch), rồi xáo thứ tự batch.
+    """
+
+    def __init__(self, lengths: np.ndarray, batch_size: int, shuffle: bool = True,
+                 bucket_batches: int = 50, seed: int = 0):
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.bucket_size = batch_size * bucket_batches
+        self.seed = seed
+        self.epoch = 0
+
+    def __iter__(self):
+        rng = np.random.RandomState(self.seed + self.epoch)
+        self.epoch += 1
+        order = rng.permutation(len(self.lengths)) if self.shuffle else np.arange(len(self.lengths))
+        batches = []
+        for start in range(0, len(order), self.bucket_size):
+            bucket = order[start:start + self.bucket_size]
+            bucket = bucket[np.argsort(self.lengths[bucket], kind="stable")]
+            batches.extend(bucket[i:i + self.batch_size].tolist() for i in range(0, len(bucket), self.batch_size))
+        if self.shuffle:
+            random.Random(self.seed + self.epoch).shuffle(batches)
+        return iter(batches)
+
+    def __len__(self) -> int:
+        return (len(self.lengths) + self.batch_size - 1) // self.batch_size
+
+
+def collate(items: List[Dict], pad_token_id: int = 0) -> Dict[str, torch.Tensor]:
+    """Padding động tới câu dài nhất trong batch"""
+    max_len = max(len(item["input_ids"]) for item in items)
+    input_ids = np.full((len(items), max_len), pad_token_id, dtype=np.int64)
+    attention_mask = np.zeros((len(items), max_len), dtype=np.int64)
+    for row, item in enumerate(items):
+        n = len(item["input_ids"])
+        input_ids[row, :n] = item["input_ids"]
+        attention_mask[row, :n] = 1
+    return {
+        "input_ids": torch.from_numpy(input_ids),
+        "attention_mask": torch.from_numpy(attention_mask),
+        "labels": torch.from_numpy(np.stack([item["labels"] for item in items]).astype(np.float32)),
+        "class_id": torch.tensor([item["class_id"] for item in items], dtype=torch.long)
+    }
+
+
+def make_dataloader(dataset: TokenizedDataset, batch_size: int = 32, shuffle: bool = True,
+                    num_workers: int = 0, seed: int = 0) -> DataLoader:
+    """DataLoader với length bucketing + padding động"""
+    pad_token_id = dataset.meta.get("pad_token_id", 0)
+    return DataLoader(
+        dataset,
+        batch_sampler=LengthBucketSampler(dataset.lengths(), batch_size, shuffle=shuffle, seed=seed),
+        collate_fn=partial(collate, pad_token_id=pad_token_id),
+        num_workers=num_workers
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build / inspect pre-tokenized ESG datasets")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="Tokenize labeled CSVs once into a memmapped dataset")
+    build.add_argument("--csv", nargs="+", required=True, help="Labeled CSVs (Sentences, E, G, S, I)")
+    build.add_argument("--tokenizer", required=True, help="Model dir whose tokenizer is used")
+    build.add_argument("--output", required=True)
+    build.add_argument("--max-length", type=int, default=256)
+    build.add_argument("--text-column", default="Sentences")
+    build.add_argument("--raw", action="store_true", help="Skip preprocess + pyvi (sentiment models)")
+
+    inspect = commands.add_parser("inspect", help="Print dataset stats")
+    inspect.add_argument("path")
+    inspect.add_argument("--eval-percent", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_dataset(args.csv, args.tokenizer, args.output, max_length=args.max_length,
+                      text_column=args.text_column, preprocess=not args.raw)
+    else:
+        dataset = TokenizedDataset(args.path)
+        train, evaluation = dataset.split(args.eval_percent)
+        lengths = dataset.lengths()
+        print(json.dumps(dataset.meta, ensure_ascii=False, indent=2))
+        print(f"train: {len(train)}, eval: {len(evaluation)}")
+        print(f"length mean {lengths.mean():.1f}, p50 {np.percentile(lengths, 50):.0f}, "
+              f"p99 {np.percentile(lengths, 99):.0f}, max {lengths.max()}")
+        print("label counts:", dict(zip(LABEL_COLUMNS, dataset.labels.sum(axis=0).tolist())))
+
+
+if __name__ == "__main__":
+    main()
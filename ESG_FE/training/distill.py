@@ -0,0 +1,220 @@
+"""
+Knowledge Distillation
+Trains compact student models for the "fast" profile, using the current
+topic classifier and sentiment models as teachers over unlabeled report text.
+
+Students keep the teacher's architecture family (only fewer layers / smaller
+hidden size), so they load through the same MODEL_MAP / detect_model_type path.
+
+Usage:
+    python -m training.distill --classifier ESG_classify/models/ViBert-ESG-base \
+        --sentiment ESG_score/models/phobert-base --corpus temp_text/full_pdf.txt
+"""
+
+import argparse
+import copy
+import json
+import os
+import re
+from typing import List, Optional
+
+import pandas as pd
+import torch
+import torch.nn.functional as F
+
+from ESG_classify.esg_classifier import MODEL_MAP, detect_model_type, preprocess_vi_text
+from utils.profiles import get_profile
+from utils.tokenization import load_tokenizer
+
+device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+SENTIMENT_CATEGORIES = ["environment", "governance", "social"]
+
+
+def load_corpus(paths: List[str], text_column: str = "Sentences", unique: bool = True) -> List[str]:
+    """Đọc câu từ file .txt (tách theo dấu chấm) hoặc .csv (cột text_column)"""
+    sentences = []
+    for path in paths:
+        if path.endswith('.csv'):
+            df = pd.read_csv(path)
+            sentences.extend(df[text_column].dropna().astype(str).tolist())
+        else:
+            with open(path, 'r', encoding='utf-8') as f:
+                text = f.read()
+            sentences.extend(s.strip() for s in text.split('.') if s.strip())
+    sentences = [s for s in sentences if len(s) >= 10]
+    # giữ thứ tự, bỏ câu trùng
+    return list(dict.fromkeys(sentences)) if unique else sentences
+
+
+def build_student(teacher, num_layers: int = 4, hidden_size: Optional[int] = None):
+    """
+    Tạo student cùng kiến trúc với teacher nhưng ít layer hơn.
+    Nếu giữ nguyên hidden_size thì khởi tạo từ embeddings và các layer cách đều của teacher.
+    """
+    config = copy.deepcopy(teacher.config)
+    teacher_layers = config.num_hidden_layers if hasattr(config, "num_hidden_layers") else config.n_layers
+    num_layers = min(num_layers, teacher_layers)
+
+    if hasattr(config, "n_layers"):  # DistilBERT naming
+        config.n_layers = num_layers
+    else:
+        config.num_hidden_layers = num_layers
+
+    if hidden_size and hidden_size != getattr(config, "hidden_size", None):
+        config.hidden_size = hidden_size
+        config.intermediate_size = hidden_size * 4
+        config.num_attention_heads = max(1, hidden_size // 64)
+        if hasattr(config, "embedding_size"):  # Electra
+            config.embedding_size = hidden_size
+        return type(teacher)(config)
+
+    student = type(teacher)(config)
+
+    # layer i của student <- layer kept[i] của teacher
+    step = teacher_layers / num_layers
+    kept = [int(round((i + 1) * step)) - 1 for i in range(num_layers)]
+    layer_pattern = re.compile(r'\.layer\.(\d+)\.')
+    teacher_state = teacher.state_dict()
+    student_state = student.state_dict()
+    for key in student_state:
+        match = layer_pattern.search(key)
+        source = key
+        if match:
+            source = layer_pattern.sub(f'.layer.{kept[int(match.group(1))]}.', key, count=1)
+        if source in teacher_state and teacher_state[source].shape == student_state[key].shape:
+            student_state[key] = teacher_state[source].clone()
+    student.load_state_dict(student_state)
+    return student
+
+
+@torch.no_grad()
+def teacher_logits(model, tokenizer, texts: List[str], max_length: int, batch_size: int = 32) -> torch.Tensor:
+    """Soft targets của teacher, tính một lần cho cả corpus"""
+    model.eval()
+    outputs = []
+    for start in range(0, len(texts), batch_size):
+        encoded = tokenizer(texts[start:start + batch_size], padding=True, truncation=True,
+                            return_tensors='pt', max_length=max_length).to(device)
+        outputs.append(model(**encoded).logits.float().cpu())
+    return torch.cat(outputs)
+
+
+def distill(teacher_path: str,
+            texts: List[str],
+            output_path: Optional[str] = None,
+            num_layers: int = 4,
+            hidden_size: Optional[int] = None,
+            epochs: int = 3,
+            batch_size: int = 32,
+            learning_rate: float = 5e-5,
+            temperature: float = 2.0) -> str:
+    """Distill một teacher thành student và lưu vào <teacher_path>-fast"""
+    if not os.path.exists(teacher_path):
+        raise FileNotFoundError(f"Model path không tồn tại: {teacher_path}")
+    if not texts:
+        raise ValueError("Corpus rỗng, không thể distill")
+
+    profile = get_profile("fast")
+    output_path = output_path or teacher_path.rstrip("/\\") + profile.model_suffix
+    print(f"Distilling {teacher_path} → {output_path} ({len(texts)} câu)")
+
+    ModelClass, TokenizerClass = MODEL_MAP[detect_model_type(teacher_path)]
+    teacher = ModelClass.from_pretrained(teacher_path).to(device)
+    tokenizer = load_tokenizer(teacher_path, TokenizerClass)
+
+    targets = teacher_logits(teacher, tokenizer, texts, max_length=256, batch_size=batch_size)
+    student = build_student(teacher, num_layers=num_layers, hidden_size=hidden_size).to(device)
+    del teacher
+
+    optimizer = torch.optim.AdamW(student.parameters(), lr=learning_rate)
+    student.train()
+    for epoch in range(epochs):
+        order = torch.randperm(len(texts))
+        total_loss = 0.0
+        for start in range(0, len(texts), batch_size):
+            idx = order[start:start + batch_size]
+            encoded = tokenizer([texts[i] for i in idx], padding=True, truncation=True,
+                                return_tensors='pt', max_length=profile.max_length).to(device)
+            logits = student(**encoded).logits
+            soft_targets = F.softmax(targets[idx].to(device) / temperature, dim=-1)
+            loss = F.kl_div(F.log_softmax(logits / temperature, dim=-1), soft_targets,
+                            reduction='batchmean') * temperature ** 2
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            total_loss += loss.item() * len(idx)
+        print(f"Epoch {epoch + 1}/{epochs} - KD loss: {total_loss / len(texts):.4f}")
+
+    student.eval()
+    os.makedirs(output_path, exist_ok=True)
+    student.save_pretrained(output_path)
+    tokenizer.save_pretrained(output_path)
+
+    # giữ label_names / category của teacher
+    metadata = {}
+    metadata_path = os.path.join(teacher_path, 'model_metadata.json')
+    if os.path.exists(metadata_path):
+        with open(metadata_path, 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+    metadata.update({
+        'profile': profile.name,
+        'max_length': profile.max_length,
+        'distilled_from': teacher_path,
+        'num_layers': num_layers,
+        'hidden_size': student.config.hidden_size,
+        'temperature': temperature,
+        'corpus_size': len(texts)
+    })
+    with open(os.path.join(output_path, 'model_metadata.json'), 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, ensure_ascii=False, indent=2)
+
+    print(f"✅ Student đã được lưu: {output_path}")
+    return output_path
+
+
+def distill_classifier(classifier_path: str, texts: List[str], **kwargs) -> str:
+    """Topic classifier nhận input đã qua preprocess + pyvi giống ESGClassifier.classify_text"""
+    processed = [preprocess_vi_text(text) for text in texts]
+    return distill(classifier_path, processed, **kwargs)
+
+
+def distill_sentiment(sentiment_path: str, texts: List[str], **kwargs) -> List[str]:
+    """3 sentiment models nhận câu thô giống ESGScoreCalculator.classify_single_sentiment"""
+    outputs = []
+    for category in SENTIMENT_CATEGORIES:
+        teacher_path = os.path.join(sentiment_path, category)
+        if os.path.exists(teacher_path):
+            outputs.append(distill(teacher_path, texts, **kwargs))
+        else:
+            print(f"⚠️ Bỏ qua {category}: không có {teacher_path}")
+    return outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distill ESG models for the fast profile")
+    parser.add_argument("--classifier", help="Topic classifier teacher dir")
+    parser.add_argument("--sentiment", help="Sentiment models root dir (environment/governance/social)")
+    parser.add_argument("--corpus", nargs="+", required=True, help=".txt or .csv files with report text")
+    parser.add_argument("--text-column", default="Sentences")
+    parser.add_argument("--layers", type=int, default=4)
+    parser.add_argument("--hidden-size", type=int, default=None)
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--temperature", type=float, default=2.0)
+    args = parser.parse_args()
+
+    texts = load_corpus(args.corpus, args.text_column)
+    kwargs = dict(num_layers=args.layers, hidden_size=args.hidden_size, epochs=args.epochs,
+                  batch_size=args.batch_size, temperature=args.temperature)
+
+    if not args.classifier and not args.sentiment:
+        parser.error("Cần --classifier và/hoặc --sentiment")
+    if args.classifier:
+        distill_classifier(args.classifier, texts, **kwargs)
+    if args.sentiment:
+        distill_sentiment(args.sentiment, texts, **kwargs)
+
+
+if __name__ == "__main__":
+    main()
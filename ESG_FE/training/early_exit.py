@@ -0,0 +1,211 @@
+"""
+Early-Exit Heads
+Trains one linear head per intermediate layer of the topic classifier on the
+labeled CSVs (backbone frozen: [CLS] states are computed once), and reports,
+per confidence threshold, the average layers executed and the accuracy vs
+full-depth inference on the eval split (same hash split as training/dataset.py).
+
+Loss per head: (1 - alpha) * CE(gold label) + alpha * KL(full-depth prediction);
+rows without exactly one label only use the KL term.
+
+Usage:
+    python -m training.early_exit train --model ESG_classify/models/ViBert-ESG-base \
+        --csv "../Tool label/labeled_data.csv" "../Tool label/labeled_data_2.csv"
+    python -m training.early_exit evaluate --model ESG_classify/models/ViBert-ESG-base \
+        --csv "../Tool label/labeled_data.csv" --thresholds 0.8 0.9 0.95 0.99
+"""
+
+import argparse
+import json
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from ESG_classify.esg_classifier import MODEL_MAP, detect_model_type, preprocess_vi_batch
+from training.dataset import COLUMN_TO_CLASS, LABEL_COLUMNS, load_labeled, load_tokenizer
+from utils.dedup import in_eval_split, sentence_hash
+from utils.early_exit import EarlyExitModel, ExitHeads
+from utils.inference import predict_logits
+
+device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+DEFAULT_THRESHOLDS = [0.8, 0.9, 0.95, 0.99]
+
+
+def load_split(csv_paths: List[str], eval_percent: int, text_column: str = "Sentences"):
+    """(texts đã preprocess, gold class_id hoặc -1, mask eval)"""
+    data = load_labeled(csv_paths, text_column).drop_duplicates("Sentences").reset_index(drop=True)
+    labels = data[LABEL_COLUMNS].to_numpy()
+    one_label = labels.sum(axis=1) == 1
+    gold = np.full(len(data), -1, dtype=np.int64)
+    gold[one_label] = np.array([COLUMN_TO_CLASS[c] for c in LABEL_COLUMNS])[labels[one_label].argmax(axis=1)]
+    is_eval = in_eval_split([sentence_hash(s) for s in data["Sentences"]], eval_percent)
+    return preprocess_vi_batch(data["Sentences"].tolist()), gold, is_eval
+
+
+def load_backbone(model_path: str):
+    ModelClass, _ = MODEL_MAP[detect_model_type(model_path)]
+    model = ModelClass.from_pretrained(model_path).to(device).eval()
+    return model, load_tokenizer(model_path)
+
+
+@torch.no_grad()
+def collect_features(model, tokenizer, texts: List[str], layers: List[int], max_length: int = 256,
+                     batch_size: int = 32):
+    """[CLS] state sau mỗi exit layer + logits full-depth, tính một lần"""
+    features = {layer: [] for layer in layers}
+    final = []
+    for start in range(0, len(texts), batch_size):
+        encoded = tokenizer(texts[start:start + batch_size], padding=True, truncation=True,
+                            return_tensors='pt', max_length=max_length).to(device)
+        output = model(**encoded, output_hidden_states=True)
+        for layer in layers:
+            features[layer].append(output.hidden_states[layer][:, 0].float().cpu())
+        final.append(output.logits.float().cpu())
+    return {layer: torch.cat(chunks) for layer, chunks in features.items()}, torch.cat(final)
+
+
+def train_heads(features: Dict[int, torch.Tensor], final_logits: torch.Tensor, gold: np.ndarray,
+                num_labels: int, epochs: int = 20, batch_size: int = 64, learning_rate: float = 1e-3,
+                alpha: float = 0.5, seed: int = 0) -> ExitHeads:
+    torch.manual_seed(seed)
+    layers = sorted(features)
+    heads = ExitHeads(layers, features[layers[0]].shape[1], num_labels)
+    gold = torch.as_tensor(gold)
+    soft_targets = F.softmax(final_logits, dim=-1)
+    optimizer = torch.optim.AdamW(heads.parameters(), lr=learning_rate)
+
+    heads.train()
+    n = len(gold)
+    for epoch in range(epochs):
+        order = torch.randperm(n)
+        total = 0.0
+        for start in range(0, n, batch_size):
+            idx = order[start:start + batch_size]
+            loss = 0.0
+            for head, layer in zip(heads.heads, layers):
+                logits = head(features[layer][idx])
+                kl = F.kl_div(F.log_softmax(logits, dim=-1), soft_targets[idx], reduction="batchmean")
+                labeled = gold[idx] >= 0
+                ce = F.cross_entropy(logits[labeled], gold[idx][labeled]) if labeled.any() else logits.sum() * 0
+                loss = loss + (1 - alpha) * ce + alpha * kl
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            total += loss.item() * len(idx)
+        print(f"Epoch {epoch + 1}/{epochs}: loss={total / max(n, 1):.4f}")
+    return heads.eval()
+
+
+@torch.no_grad()
+def simulate(heads: ExitHeads, features: Dict[int, torch.Tensor], final_logits: torch.Tensor,
+             gold: np.ndarray, num_layers: int, thresholds: List[float]) -> List[Dict]:
+    """Kết quả early exit theo từng threshold, tính trên feature đã có (không chạy lại model)"""
+    full_pred = final_logits.argmax(-1).numpy()
+    head_probs = [F.softmax(head(features[layer]), dim=-1) for head, layer in zip(heads.heads, heads.layers)]
+    labeled = gold >= 0
+    reports = []
+    for threshold in thresholds:
+        pred = full_pred.copy()
+        depth = np.full(len(pred), num_layers)
+        pending = np.ones(len(pred), dtype=bool)
+        for layer, probs in zip(heads.layers, head_probs):
+            confidence, head_pred = probs.max(-1)
+            exit_now = pending & (confidence.numpy() >= threshold)
+            pred[exit_now] = head_pred.numpy()[exit_now]
+            depth[exit_now] = layer
+            pending &= ~exit_now
+        reports.append({
+            "threshold": threshold,
+            "avg_layers": float(depth.mean()) if len(depth) else 0.0,
+            "layer_reduction": 1 - float(depth.mean()) / num_layers if len(depth) else 0.0,
+            "exit_rate": float((depth < num_layers).mean()) if len(depth) else 0.0,
+            "accuracy": float((pred[labeled] == gold[labeled]).mean()) if labeled.any() else None,
+            "full_accuracy": float((full_pred[labeled] == gold[labeled]).mean()) if labeled.any() else None,
+            "agreement_with_full": float((pred == full_pred).mean()) if len(pred) else 1.0
+        })
+    return reports
+
+
+def time_inference(model, tokenizer, texts: List[str], threshold: Optional[float], heads: Optional[ExitHeads],
+                   batch_size: int = 32) -> Dict:
+    """Thời gian thật qua predict_logits: full depth (threshold None) hoặc EarlyExitModel"""
+    runner = model if threshold is None else EarlyExitModel(model, heads, threshold)
+    start = time.perf_counter()
+    predict_logits(runner, tokenizer, texts, batch_size=batch_size, device=device)
+    seconds = time.perf_counter() - start
+    report = {"threshold": threshold, "sent_per_sec": len(texts) / seconds if seconds > 0 else 0.0}
+    if threshold is not None:
+        report["measured_avg_layers"] = runner.stats()["avg_layers"]
+    return report
+
+
+def evaluate(model, tokenizer, heads: ExitHeads, texts: List[str], gold: np.ndarray,
+             thresholds: List[float], batch_size: int = 32) -> Dict:
+    num_layers = model.config.num_hidden_layers
+    features, final_logits = collect_features(model, tokenizer, texts, heads.layers, batch_size=batch_size)
+    timings = [time_inference(model, tokenizer, texts, None, None, batch_size)]
+    timings += [time_inference(model, tokenizer, texts, t, heads, batch_size) for t in thresholds]
+    return {
+        "eval_sentences": len(texts),
+        "num_layers": num_layers,
+        "exit_layers": heads.layers,
+        "thresholds": simulate(heads, features, final_logits, gold, num_layers, thresholds),
+        "timing": timings
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train / evaluate early-exit heads for the topic classifier")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in ("train", "evaluate"):
+        command = sub.add_parser(name)
+        command.add_argument("--model", required=True, help="Topic classifier dir")
+        command.add_argument("--csv", nargs="+", required=True, help="Labeled CSVs (Sentences,E,S,G,I)")
+        command.add_argument("--text-column", default="Sentences")
+        command.add_argument("--eval-percent", type=int, default=10)
+        command.add_argument("--batch-size", type=int, default=32)
+        command.add_argument("--thresholds", type=float, nargs="+", default=DEFAULT_THRESHOLDS)
+        command.add_argument("--output", help="Write the evaluation report JSON here")
+        if name == "train":
+            command.add_argument("--layers", type=int, nargs="+",
+                                 help="Exit layers (default: every 2nd layer except the last)")
+            command.add_argument("--epochs", type=int, default=20)
+            command.add_argument("--learning-rate", type=float, default=1e-3)
+            command.add_argument("--alpha", type=float, default=0.5, help="Weight of the KL-to-full-depth term")
+    args = parser.parse_args()
+
+    texts, gold, is_eval = load_split(args.csv, args.eval_percent, args.text_column)
+    model, tokenizer = load_backbone(args.model)
+    num_layers = model.config.num_hidden_layers
+    eval_texts = [t for t, e in zip(texts, is_eval) if e]
+
+    if args.command == "train":
+        layers = args.layers or list(range(2, num_layers, 2))
+        if not layers or max(layers) >= num_layers:
+            raise ValueError(f"Exit layers phải nằm trong 1..{num_layers - 1}")
+        train_texts = [t for t, e in zip(texts, is_eval) if not e]
+        print(f"Training heads on layers {layers} ({len(train_texts)} train / {len(eval_texts)} eval câu)")
+        features, final_logits = collect_features(model, tokenizer, train_texts, layers, batch_size=args.batch_size)
+        heads = train_heads(features, final_logits, gold[~is_eval], model.config.num_labels,
+                            epochs=args.epochs, learning_rate=args.learning_rate, alpha=args.alpha)
+    else:
+        heads = ExitHeads.load(args.model)
+        if heads is None:
+            raise FileNotFoundError(f"Chưa có early-exit heads trong {args.model}, chạy 'train' trước")
+
+    report = evaluate(model, tokenizer, heads, eval_texts, gold[is_eval], args.thresholds, args.batch_size)
+    if args.command == "train":
+        heads.save(args.model, report=report)
+        print(f"✅ Saved heads → {args.model}")
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""
+Hardware Autotune
+Sweeps batch size, max-tokens budget (utils.inference.batch_bounds), torch
+thread count and attention backend for one model on the local machine, and
+saves the fastest setting to hardware_profile.json (ESG_HARDWARE_PROFILE).
+ESGClassifier and ESGModel read their entry ("classifier" / "sentiment") at
+load time; without a file (or with a file tuned on another machine) they keep
+the built-in defaults (batch 32 / 16, no token budget, torch threads, eager).
+
+Search is coordinate-wise: each round sweeps one setting at a time while the
+others stay at the best value so far. Backends whose logits differ from eager
+by more than --tolerance are rejected. Every measurement is kept in the file.
+
+Usage:
+    python -m utils.autotune --kind classifier --model ESG_classify/models/ViBert-ESG-base
+    python -m utils.autotune --kind sentiment --model ESG_score/models/phobert-base/environment \
+        --batch-sizes 8 16 32 64 --max-tokens 0 2048 4096 --threads 4 8 16
+"""
+
+import argparse
+import json
+import os
+import platform
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Tuple
+
+import torch
+
+HARDWARE_PROFILE_FILE = os.environ.get("ESG_HARDWARE_PROFILE", "hardware_profile.json")
+KINDS = ("classifier", "sentiment")
+DEFAULT_BATCH_SIZES = {"classifier": 32, "sentiment": 16}
+
+
+@dataclass
+class HardwareProfile:
+    batch_size: int
+    max_tokens: Optional[int] = None   # None = chỉ giới hạn theo batch_size
+    threads: Optional[int] = None      # None = để torch tự chọn
+    attention: Optional[str] = None    # None = ESG_ATTENTION hoặc eager
+
+
+def machine_key() -> Dict:
+    """Profile chỉ dùng lại trên máy có cùng key"""
+    return {
+        "cpu_count": os.cpu_count(),
+        "machine": platform.machine(),
+        "processor": platform.processor() or platform.machine(),
+        "cuda": torch.cuda.get_device_name(0) if torch.cuda.is_available() else None,
+        "torch": torch.__version__
+    }
+
+
+def _read(path: str) -> Optional[Dict]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Không đọc được {path} ({e}), dùng cấu hình mặc định")
+        return None
+
+
+def load_hardware_profile(kind: str, path: Optional[str] = None) -> HardwareProfile:
+    """Profile đã tune cho kind trên máy này, không có thì mặc định"""
+    default = HardwareProfile(DEFAULT_BATCH_SIZES[kind])
+    data = _read(path or HARDWARE_PROFILE_FILE)
+    if not data or kind not in data.get("profiles", {}):
+        return default
+    if data.get("machine") != machine_key():
+        print(f"⚠️ {path or HARDWARE_PROFILE_FILE} được tune trên máy khác, dùng cấu hình mặc định "
+              f"(chạy lại: python -m utils.autotune --kind {kind})")
+        return default
+    return HardwareProfile(**data["profiles"][kind])
+
+
+def save_hardware_profile(kind: str, profile: HardwareProfile, measurements: List[Dict],
+                          path: Optional[str] = None):
+    path = path or HARDWARE_PROFILE_FILE
+    data = _read(path) or {}
+    if data.get("machine") != machine_key():
+        data = {}  # profile của máy khác: bỏ
+    data["machine"] = machine_key()
+    data.setdefault("profiles", {})[kind] = asdict(profile)
+    data.setdefault("measurements", {})[kind] = measurements
+    data.setdefault("tuned_at", {})[kind] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+
+
+def use_threads(threads: Optional[int]):
+    """torch.set_num_threads nếu profile có threads (setting toàn process)"""
+    if threads and torch.get_num_threads() != threads:
+        torch.set_num_threads(threads)
+
+
+# ---------- sweep ----------
+
+class Sweep:
+    def __init__(self, model_path: str, texts: List[str], max_length: int, long_text: str,
+                 repeats: int, tolerance: float):
+        from ESG_classify.esg_classifier import MODEL_MAP, detect_model_type
+        from utils.tokenization import load_tokenizer
+
+        self.model_path = model_path
+        self.texts = texts
+        self.max_length = max_length
+        self.long_text = long_text
+        self.repeats = repeats
+        self.tolerance = tolerance
+        self.ModelClass, TokenizerClass = MODEL_MAP[detect_model_type(model_path)]
+        self.tokenizer = load_tokenizer(model_path, TokenizerClass)
+        self._models: Dict[str, Tuple] = {}
+        self._results: Dict[Tuple, Dict] = {}
+        self.baseline = None
+        self.default_threads = torch.get_num_threads()
+        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+    def _model(self, attention: str):
+        from utils.inference import load_sequence_classifier
+
+        if attention not in self._models:
+            self._models[attention] = load_sequence_classifier(self.ModelClass, self.model_path, attention,
+                                                               device=self.device)
+        return self._models[attention]
+
+    def measure(self, profile: HardwareProfile) -> Dict:
+        from utils.inference import predict_logits
+
+        key = tuple(asdict(profile).values())
+        if key in self._results:
+            return self._results[key]
+        model, effective = self._model(profile.attention)
+        result = dict(asdict(profile), effective_attention=effective)
+        if effective != profile.attention:
+            result["skipped"] = f"{profile.attention} không dùng được, fallback {effective}"
+        else:
+            torch.set_num_threads(profile.threads or self.default_threads)
+
+            def run():
+                return predict_logits(model, self.tokenizer, self.texts, max_length=self.max_length,
+                                      batch_size=profile.batch_size, long_text=self.long_text, device=self.device,
+                                      pack=profile.attention != "eager", max_tokens=profile.max_tokens)[0]
+
+            logits = run()  # warmup
+            start = time.perf_counter()
+            for _ in range(self.repeats):
+                logits = run()
+            seconds = time.perf_counter() - start
+            result["sent_per_sec"] = len(self.texts) * self.repeats / seconds if seconds > 0 else 0.0
+            if self.baseline is None:
+                self.baseline = logits
+            result["max_abs_diff"] = float((logits - self.baseline).abs().max()) if len(logits) else 0.0
+            if result["max_abs_diff"] > self.tolerance:
+                result["skipped"] = f"logits lệch eager {result['max_abs_diff']:.2e}"
+        print({k: v for k, v in result.items() if v is not None})
+        self._results[key] = result
+        return result
+
+    @property
+    def measurements(self) -> List[Dict]:
+        return list(self._results.values())
+
+
+def autotune(sweep: Sweep, start: HardwareProfile, grid: Dict[str, List], rounds: int = 1) -> HardwareProfile:
+    """Coordinate search: mỗi round lần lượt sweep từng setting trong grid"""
+    best = start
+    best_speed = sweep.measure(best).get("sent_per_sec", 0.0)
+    for _ in range(rounds):
+        improved = False
+        for field, values in grid.items():
+            for value in values:
+                candidate = HardwareProfile(**dict(asdict(best), **{field: value}))
+                result = sweep.measure(candidate)
+                if "skipped" not in result and result["sent_per_sec"] > best_speed:
+                    best, best_speed, improved = candidate, result["sent_per_sec"], True
+        if not improved:
+            break
+    return best
+
+
+def _default_threads() -> List[int]:
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    threads, n = [], 1
+    while n < cores:
+        threads.append(n)
+        n *= 2
+    return threads + [cores]
+
+
+def main():
+    from benchmarks.fixtures import synthetic_sentences
+    from utils.inference import ATTENTION_MODES
+    from utils.profiles import DEFAULT_PROFILE, PROFILES, get_profile
+
+    parser = argparse.ArgumentParser(description="Tune batch size / token budget / threads / attention for this machine")
+    parser.add_argument("--kind", required=True, choices=KINDS)
+    parser.add_argument("--model", required=True, help="Model dir to tune with")
+    parser.add_argument("--corpus", help="Text file, one sentence per line (default: synthetic sentences)")
+    parser.add_argument("--sentences", type=int, default=512)
+    parser.add_argument("--profile", default=DEFAULT_PROFILE, choices=list(PROFILES), help="For max_length")
+    parser.add_argument("--long-text", default="window", choices=["truncate", "window"])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[4, 8, 16, 32, 64, 128])
+    parser.add_argument("--max-tokens", type=int, nargs="+", default=[0, 2048, 4096, 8192],
+                        help="Token budget per batch, 0 = none")
+    parser.add_argument("--threads", type=int, nargs="+", default=None, help="Default: 1, 2, 4, ... cores")
+    parser.add_argument("--attention", nargs="+", default=list(ATTENTION_MODES), choices=ATTENTION_MODES)
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument("--repeats", type=int, default=2)
+    parser.add_argument("--tolerance", type=float, default=1e-3, help="Max |logit - eager| for a backend")
+    parser.add_argument("--config", default=HARDWARE_PROFILE_FILE, help="Where to save the profile")
+    parser.add_argument("--dry-run", action="store_true", help="Print the result without saving")
+    args = parser.parse_args()
+
+    if args.corpus:
+        with open(args.corpus, "r", encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()][:args.sentences]
+    else:
+        texts = synthetic_sentences(args.sentences)
+    threads = args.threads or _default_threads()
+
+    sweep = Sweep(args.model, texts, get_profile(args.profile).max_length, args.long_text,
+                  args.repeats, args.tolerance)
+    start = HardwareProfile(DEFAULT_BATCH_SIZES[args.kind], attention="eager")  # cấu hình mặc định hiện tại
+    grid = {
+        "attention": args.attention,
+        "batch_size": args.batch_sizes,
+        "max_tokens": [t or None for t in args.max_tokens],
+        "threads": threads
+    }
+    best = autotune(sweep, start, grid, args.rounds)
+
+    baseline = sweep.measure(start)["sent_per_sec"]
+    tuned = sweep.measure(best)["sent_per_sec"]
+    print(f"\nDefault {asdict(start)}: {baseline:.1f} câu/s")
+    print(f"Best    {asdict(best)}: {tuned:.1f} câu/s ({tuned / max(baseline, 1e-9):.2f}x)")
+    if not args.dry_run:
+        save_hardware_profile(args.kind, best, sweep.measurements, args.config)
+        print(f"✅ Saved {args.kind} profile → {args.config}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+PDF Boilerplate Stripping
+Running headers / footers, page numbers and company names repeat at the same
+place on many pages. Text blocks from PyMuPDF (page.get_text("blocks")) are
+keyed by normalized text (lowercase, digits -> #, whitespace collapsed) and the
+vertical band of the page they sit in; a block whose key shows up on at least
+`min_pages` pages (default max(3, 10% of the pages)) is dropped before the text
+reaches normalize_full_text / clean_artifacts. Neighbouring bands count as the
+same position so a footer that shifts slightly between pages still matches.
+
+Used by extract_pdf_text and streaming.iter_pages. Measure the effect:
+    python -m benchmarks.boilerplate report_2023.pdf report_2024.pdf
+"""
+
+import hashlib
+import math
+import os
+import re
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+Y_BANDS = 40             # số dải dọc của trang
+MIN_REPEAT_PAGES = 3
+MIN_REPEAT_RATIO = 0.1
+MAX_BLOCK_CHARS = 200    # đoạn văn dài không bao giờ coi là boilerplate
+STRIP_BOILERPLATE = os.environ.get("ESG_STRIP_BOILERPLATE", "1") != "0"
+
+BlockKey = Tuple[str, int]  # (hash text đã chuẩn hoá, dải dọc)
+
+
+def normalize_block(text: str) -> str:
+    return re.sub(r"\s+", " ", re.sub(r"\d+", "#", text.lower())).strip()
+
+
+def block_key(text: str, y0: float, y1: float, page_height: float) -> Optional[BlockKey]:
+    normalized = normalize_block(text)
+    if not normalized or len(normalized) > MAX_BLOCK_CHARS:
+        return None
+    band = min(int((y0 + y1) / 2 / page_height * Y_BANDS), Y_BANDS - 1) if page_height else 0
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=8).hexdigest(), band
+
+
+def page_blocks(page) -> List[Tuple[str, Optional[BlockKey]]]:
+    """(text, key) của các text block theo thứ tự của PyMuPDF (bỏ image block)"""
+    height = page.rect.height
+    blocks = []
+    for x0, y0, x1, y1, text, _, block_type in page.get_text("blocks"):
+        text = text.strip()
+        if block_type != 0 or not text:
+            continue
+        blocks.append((text, block_key(text, y0, y1, height)))
+    return blocks
+
+
+def default_min_pages(num_pages: int) -> int:
+    return max(MIN_REPEAT_PAGES, math.ceil(MIN_REPEAT_RATIO * num_pages))
+
+
+def repeated_keys(page_keys: Sequence[Sequence[Optional[BlockKey]]], min_pages: Optional[int] = None) -> Set[BlockKey]:
+    """Key xuất hiện (cùng dải hoặc dải kề bên) trên >= min_pages trang"""
+    min_pages = min_pages or default_min_pages(len(page_keys))
+    pages: Dict[BlockKey, Set[int]] = defaultdict(set)
+    for page_no, keys in enumerate(page_keys):
+        for key in keys:
+            if key is not None:
+                pages[key].add(page_no)
+    repeated = set()
+    for (digest, band), seen in pages.items():
+        if len(seen) >= min_pages:
+            repeated.add((digest, band))
+            continue
+        nearby = seen | pages.get((digest, band - 1), set()) | pages.get((digest, band + 1), set())
+        if len(nearby) >= min_pages:
+            repeated.add((digest, band))
+    return repeated
+
+
+def strip_pages(pages: Sequence[Sequence[Tuple[str, Optional[BlockKey]]]],
+                repeated: Set[BlockKey]) -> Tuple[List[str], Dict[str, int]]:
+    """Text từng trang sau khi bỏ block lặp, kèm thống kê block / ký tự bị bỏ"""
+    texts = []
+    stats = {"blocks": 0, "dropped_blocks": 0, "chars": 0, "dropped_chars": 0, "repeated_keys": len(repeated)}
+    for blocks in pages:
+        kept = []
+        for text, key in blocks:
+            stats["blocks"] += 1
+            stats["chars"] += len(text)
+            if key in repeated:
+                stats["dropped_blocks"] += 1
+                stats["dropped_chars"] += len(text)
+            else:
+                kept.append(text)
+        texts.append("\n".join(kept))
+    return texts, stats
@@ -4,10 +4,14 @@ Handles rendering of HTML components and templates
 """
 
 import os
+import base64
 from pathlib import Path
 import re
 import fitz
 import pdfplumber 
+from utils.boilerplate import STRIP_BOILERPLATE, page_blocks, repeated_keys, strip_pages
+from utils.tracing import span
+from utils.triage import get_policy, triage_page
 
 def smart_normalize_text(text, remove_single_chars=True):
     if not text:
@@ -126,24 +130,81 @@ def process_page_content(content, remove_single_chars=True):
     
     return '\n'.join(processed_lines)
 
+def ensure_dot(p):
+    return p if re.search(r'[.!?…]$', p) else p + '.'
+
 def clean_text_remove_intro_outro_add_dots(text):
     paragraphs = [p.strip() for p in text.strip().split('\n\n') if p.strip()]
     # print("đoạn 1:", paragraphs[0])
     # print("đoạn cuối:", paragraphs[-1])
     if len(paragraphs) >= 3:
         paragraphs = paragraphs[1:-1]
-    def ensure_dot(p):
-        return p if re.search(r'[.!?…]$', p) else p + '.'
     paragraphs = [ensure_dot(p) for p in paragraphs]
 
     return '\n'.join(paragraphs)
 
 def normalize_full_text(raw_text):
-    full_normalized, _ = smart_normalize_text(raw_text)
-    cleaned_text = clean_text_remove_intro_outro_add_dots(full_normalized)
+    with span("normalize", bytes=len(raw_text or "")) as s:
+        full_normalized, pages = smart_normalize_text(raw_text)
+        cleaned_text = clean_text_remove_intro_outro_add_dots(full_normalized)
+        s.set(items=len(pages), output_bytes=len(cleaned_text))
     return cleaned_text
 
 
+def extract_pdf_pages(pdf_bytes, strip_boilerplate=None, min_repeat_pages=None, triage=None):
+    """
+    [(page_no, text)] của các trang có text, và quyết định triage của từng trang.
+    strip_boilerplate: bỏ block lặp lại trên nhiều trang (header / footer / số trang,
+    xem utils/boilerplate.py), mặc định ESG_STRIP_BOILERPLATE (bật).
+    triage: policy bỏ trang báo cáo tài chính / bảng số (utils/triage.py), mặc định ESG_TRIAGE (off).
+    """
+    if strip_boilerplate is None:
+        strip_boilerplate = STRIP_BOILERPLATE
+    policy = get_policy(triage)
+    with span("extract_pdf", bytes=len(pdf_bytes)) as s:
+        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+        try:
+            if strip_boilerplate:
+                blocks = [page_blocks(page) for page in doc]
+                repeated = repeated_keys([[key for _, key in b] for b in blocks], min_repeat_pages)
+                texts, stats = strip_pages(blocks, repeated)
+                s.set(**stats)
+            else:
+                texts = [page.get_text() for page in doc]
+            pages, decisions = [], []
+            for i, text in enumerate(texts, start=1):
+                text = text.strip()
+                if not text:
+                    continue
+                if policy is not None:
+                    decision = triage_page(doc.load_page(i - 1), text, policy, i)
+                    decisions.append(decision)
+                    if decision.skip:
+                        continue
+                pages.append((i, text))
+            s.set(items=len(doc), text_pages=len(pages), skipped_pages=sum(d.skip for d in decisions))
+        finally:
+            doc.close()
+    return pages, decisions
+
+
+def extract_pdf_text(pdf_bytes, strip_boilerplate=None, min_repeat_pages=None, triage=None):
+    """Text của từng trang với marker --- Page N --- (xem extract_pdf_pages)"""
+    try:
+        pages, _ = extract_pdf_pages(pdf_bytes, strip_boilerplate, min_repeat_pages, triage)
+        return '\n'.join(f'--- Page {i} ---\n{text}' for i, text in pages), None
+    except Exception as e:
+        return None, f"Lỗi khi extract PDF: {str(e)}"
+
+
+def split_sentences(text):
+    """Tách câu theo dấu chấm (đầu vào của ESGClassifier.classify_text)"""
+    with span("split_sentences", bytes=len(text)) as s:
+        sentences = [part.strip() for part in text.split('.') if part.strip()]
+        s.set(items=len(sentences))
+    return sentences
+
+
 def load_template(template_name):
     """Load HTML template from templates directory"""
     template_path = Path("templates") / template_name
@@ -187,8 +248,8 @@ def render_pdf_viewer(pdf_bytes):
         template = template.replace('<script src="/static/js/pdf_viewer.js"></script>', 
                                   f'<script>{js_content}</script>')
         
-        # Replace PDF data
-        template = template.replace("PDF_DATA_PLACEHOLDER", str(list(pdf_bytes)))
+        # Replace PDF data (base64, thay vì chuỗi list số ~4 ký tự / byte)
+        template = template.replace("PDF_DATA_PLACEHOLDER", '"' + base64.b64encode(pdf_bytes).decode('ascii') + '"')
         
         return template
     except Exception as e:
@@ -0,0 +1,230 @@
+"""
+Sentence Deduplication
+Exact hashing + MinHash/LSH near-duplicate clustering in front of classification,
+so inference runs once per cluster representative and results are fanned back out.
+
+Report the dedup ratio on a corpus:
+    python -m utils.dedup --corpus report_2022.txt report_2023.txt --threshold 0.8 --output dedup.json
+"""
+
+import argparse
+import hashlib
+import json
+import re
+import zlib
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def normalize_for_hash(text: str) -> str:
+    """Chuẩn hoá nhẹ trước khi hash: lowercase, gộp khoảng trắng"""
+    return re.sub(r'\s+', ' ', str(text)).strip().lower()
+
+
+def exact_key(text: str) -> str:
+    return hashlib.sha1(normalize_for_hash(text).encode('utf-8')).hexdigest()
+
+
+def sentence_hash(text: str) -> int:
+    """64 bit đầu của exact_key, dùng cho dedup và chia train / eval"""
+    return int(exact_key(text)[:16], 16)
+
+
+def in_eval_split(hashes, eval_percent: int):
+    """
+    Câu (theo sentence_hash) thuộc tập eval: cùng một phép chia cho mọi tool
+    training / đánh giá (training.dataset, training.early_exit, utils.segmentation).
+    """
+    return (np.asarray(hashes, dtype=np.uint64) % np.uint64(100)) < np.uint64(eval_percent)
+
+
+@dataclass
+class DedupResult:
+    """
+    representatives: vị trí (trong input) của câu đại diện mỗi cluster
+    cluster_ids: cluster của từng câu input, cùng độ dài với input
+    """
+    representatives: List[int]
+    cluster_ids: np.ndarray
+    processed: List[str] = field(default_factory=list)  # text đã preprocess của representative
+    stats: Dict[str, float] = field(default_factory=dict)
+
+    def fan_out(self, rep_values: List) -> List:
+        """Kết quả theo representative -> kết quả cho mọi câu input"""
+        return [rep_values[c] for c in self.cluster_ids]
+
+
+class MinHasher:
+    """MinHash signatures over token shingles (vectorized universal hashing)"""
+
+    def __init__(self, num_perm: int = 64, shingle_size: int = 2, seed: int = 1):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.a = rng.randint(1, 1 << 31, size=num_perm, dtype=np.int64).astype(np.uint64)
+        self.b = rng.randint(0, 1 << 31, size=num_perm, dtype=np.int64).astype(np.uint64)
+
+    def shingles(self, tokens: List[str]) -> np.ndarray:
+        k = self.shingle_size if len(tokens) >= self.shingle_size else 1
+        grams = {' '.join(tokens[i:i + k]) for i in range(len(tokens) - k + 1)} or {''}
+        return np.fromiter((zlib.crc32(g.encode('utf-8')) for g in grams), dtype=np.uint64)
+
+    def signature(self, tokens: List[str]) -> np.ndarray:
+        x = self.shingles(tokens)
+        hashed = (np.outer(self.a, x) + self.b[:, None]) % _MERSENNE_PRIME & _MAX_HASH
+        return hashed.min(axis=1)
+
+
+class SentenceDeduplicator:
+    """
+    Exact dedup (sha1 của text đã chuẩn hoá) rồi near-dup bằng MinHash/LSH
+    trên token của text đã preprocess (pyvi).
+    threshold=None: chỉ dedup exact (không đổi kết quả phân loại).
+    """
+
+    def __init__(self,
+                 threshold: Optional[float] = 0.8,
+                 num_perm: int = 64,
+                 bands: int = 16,
+                 shingle_size: int = 2):
+        if threshold is not None and num_perm % bands != 0:
+            raise ValueError(f"num_perm ({num_perm}) phải chia hết cho bands ({bands})")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.hasher = MinHasher(num_perm=num_perm, shingle_size=shingle_size)
+
+    def build(self, texts: List[str], preprocess: Optional[Callable[[str], str]] = None,
+              preprocess_batch: Optional[Callable[[List[str]], List[str]]] = None) -> DedupResult:
+        """preprocess (hoặc preprocess_batch, một lần cho cả list) chỉ chạy cho mỗi câu exact-unique"""
+        # 1. exact
+        first_seen: Dict[str, int] = {}
+        exact_of = np.empty(len(texts), dtype=np.int64)
+        for i, text in enumerate(texts):
+            exact_of[i] = first_seen.setdefault(exact_key(text), i)
+        unique_positions = list(first_seen.values())
+        if preprocess_batch is not None:
+            processed = dict(zip(unique_positions, preprocess_batch([texts[pos] for pos in unique_positions])))
+        else:
+            processed = {pos: preprocess(texts[pos]) if preprocess else texts[pos] for pos in unique_positions}
+
+        # 2. near-duplicate: greedy clustering, chỉ representative được đưa vào bucket LSH
+        rep_of: Dict[int, int] = {}
+        representatives: List[int] = []
+        if self.threshold is None:
+            for pos in unique_positions:
+                rep_of[pos] = len(representatives)
+                representatives.append(pos)
+        else:
+            buckets: Dict[tuple, List[int]] = {}
+            signatures: List[np.ndarray] = []
+            for pos in unique_positions:
+                sig = self.hasher.signature(processed[pos].split())
+                keys = [(b, sig[b * self.rows:(b + 1) * self.rows].tobytes()) for b in range(self.bands)]
+                match = None
+                for key in keys:
+                    for cluster in buckets.get(key, ()):
+                        if np.mean(signatures[cluster] == sig) >= self.threshold:
+                            match = cluster
+                            break
+                    if match is not None:
+                        break
+                if match is None:
+                    match = len(representatives)
+                    representatives.append(pos)
+                    signatures.append(sig)
+                    for key in keys:
+                        buckets.setdefault(key, []).append(match)
+                rep_of[pos] = match
+
+        cluster_ids = np.fromiter((rep_of[p] for p in exact_of), dtype=np.int64, count=len(texts))
+        total = len(texts)
+        stats = {
+            "total": total,
+            "exact_unique": len(unique_positions),
+            "clusters": len(representatives),
+            "exact_dedup_ratio": 1 - len(unique_positions) / total if total else 0.0,
+            "dedup_ratio": 1 - len(representatives) / total if total else 0.0,
+        }
+        return DedupResult(representatives, cluster_ids, [processed[p] for p in representatives], stats)
+
+
+def corpus_report(documents: Dict[str, List[str]], deduplicator: SentenceDeduplicator,
+                  preprocess: Optional[Callable[[str], str]] = None, top: int = 20) -> Dict:
+    """
+    Dedup ratio của cả corpus (mọi document chung một index) và theo từng document:
+    bao nhiêu câu lặp lại trong document, bao nhiêu câu có cluster xuất hiện ở document khác.
+    raw_unique: số câu khác nhau đúng từng ký tự, là số lần chạy sentiment sau dedup.
+    """
+    names = list(documents)
+    sentences = [s for name in names for s in documents[name]]
+    doc_of = np.repeat(np.arange(len(names)), [len(documents[name]) for name in names])
+    result = deduplicator.build(sentences, preprocess)
+    clusters = result.cluster_ids
+
+    cluster_docs = {}
+    for cluster, doc in zip(clusters.tolist(), doc_of.tolist()):
+        cluster_docs.setdefault(cluster, set()).add(doc)
+    shared = np.fromiter((len(cluster_docs[c]) > 1 for c in clusters.tolist()), dtype=bool, count=len(clusters))
+
+    total = len(sentences)
+    report = dict(result.stats)
+    report["raw_unique"] = len(set(sentences))
+    report["raw_dedup_ratio"] = 1 - report["raw_unique"] / total if total else 0.0
+    report["cross_document_ratio"] = float(shared.mean()) if total else 0.0
+    report["documents"] = {}
+    for i, name in enumerate(names):
+        mask = doc_of == i
+        count = int(mask.sum())
+        report["documents"][name] = {
+            "sentences": count,
+            "clusters": int(len(np.unique(clusters[mask]))),
+            "within_document_dedup_ratio": 1 - len(np.unique(clusters[mask])) / count if count else 0.0,
+            "shared_with_other_documents": int(shared[mask].sum())
+        }
+    sizes = np.bincount(clusters, minlength=len(result.representatives))
+    report["top_repeated"] = [
+        {"text": sentences[result.representatives[c]][:200], "sentences": int(sizes[c]),
+         "documents": len(cluster_docs[c])}
+        for c in np.argsort(-sizes, kind="stable")[:top] if sizes[c] > 1
+    ]
+    return report
+
+
+def main():
+    from training.distill import load_corpus
+
+    parser = argparse.ArgumentParser(description="Dedup ratio report for a report corpus")
+    parser.add_argument("--corpus", nargs="+", required=True, help=".txt or .csv files, one document each")
+    parser.add_argument("--threshold", type=float, default=0.8, help="Near-dup threshold, <= 0 = exact only")
+    parser.add_argument("--pyvi", action="store_true", help="Tokenize with pyvi (same as classify_text)")
+    parser.add_argument("--top", type=int, default=20, help="Most repeated clusters to list")
+    parser.add_argument("--output", help="Write report JSON here")
+    args = parser.parse_args()
+
+    documents = {path: load_corpus([path], unique=False) for path in args.corpus}
+    preprocess = None
+    if args.pyvi:
+        from ESG_classify.esg_classifier import preprocess_vi_text
+        preprocess = preprocess_vi_text
+
+    deduplicator = SentenceDeduplicator(threshold=args.threshold if args.threshold > 0 else None)
+    report = corpus_report(documents, deduplicator, preprocess, top=args.top)
+    for key, value in report.items():
+        if not isinstance(value, (dict, list)):
+            print(f"{key:>22}: {value:.3f}" if isinstance(value, float) else f"{key:>22}: {value}")
+    for name, row in report["documents"].items():
+        print(f"{name}: {row['sentences']} câu, {row['clusters']} cluster, "
+              f"{row['shared_with_other_documents']} câu lặp ở document khác")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Early-Exit Inference
+Linear heads on the [CLS] state of intermediate encoder layers (trained by
+training/early_exit.py, saved as <model_dir>/early_exit_heads.pt). Rows whose
+head confidence reaches the threshold stop there; the rest of the batch keeps
+going, and rows that never exit use the model's own classifier.
+
+EarlyExitModel wraps a *ForSequenceClassification model and is called like it
+(`model(**batch).logits`), so predict_logits / windowing work unchanged.
+Supported: BERT-family encoders (bert, roberta / phobert, xlm-roberta /
+visobert, electra). DistilBERT / DeBERTa keep full-depth inference.
+"""
+
+import os
+import threading
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import torch
+import torch.nn as nn
+
+HEADS_FILE = "early_exit_heads.pt"
+
+
+class ExitHeads(nn.Module):
+    """Một Linear(hidden, num_labels) cho mỗi exit layer (đánh số từ 1)"""
+
+    def __init__(self, layers: List[int], hidden_size: int, num_labels: int):
+        super().__init__()
+        self.layers = list(layers)
+        self.heads = nn.ModuleList(nn.Linear(hidden_size, num_labels) for _ in self.layers)
+
+    def forward(self, cls_states: List[torch.Tensor]) -> List[torch.Tensor]:
+        return [head(state) for head, state in zip(self.heads, cls_states)]
+
+    def save(self, model_path: str, **meta):
+        torch.save({
+            "layers": self.layers,
+            "hidden_size": self.heads[0].in_features,
+            "num_labels": self.heads[0].out_features,
+            "state_dict": self.state_dict(),
+            **meta
+        }, os.path.join(model_path, HEADS_FILE))
+
+    @classmethod
+    def load(cls, model_path: str, map_location=None) -> Optional["ExitHeads"]:
+        path = os.path.join(model_path, HEADS_FILE)
+        if not os.path.exists(path):
+            return None
+        checkpoint = torch.load(path, map_location=map_location or "cpu")
+        heads = cls(checkpoint["layers"], checkpoint["hidden_size"], checkpoint["num_labels"])
+        heads.load_state_dict(checkpoint["state_dict"])
+        return heads.eval()
+
+
+def encoder_parts(model):
+    """(base model, list encoder layer) hoặc raise nếu kiến trúc không hỗ trợ"""
+    base = model.base_model
+    encoder = getattr(base, "encoder", None)
+    if encoder is None or not hasattr(encoder, "layer") or not hasattr(base, "embeddings"):
+        raise ValueError(f"Early exit không hỗ trợ {type(model).__name__}")
+    return base, encoder.layer
+
+
+def classify_final(model, sequence_output: torch.Tensor) -> torch.Tensor:
+    """Head gốc của model trên output layer cuối (BERT: pooler + classifier, RoBERTa/Electra: classifier)"""
+    pooler = getattr(model.base_model, "pooler", None)
+    if pooler is not None:
+        return model.classifier(pooler(sequence_output))
+    return model.classifier(sequence_output)
+
+
+class EarlyExitModel(nn.Module):
+    def __init__(self, model, heads: ExitHeads, threshold: float = 0.9):
+        super().__init__()
+        self.base, self.layers = encoder_parts(model)
+        self.model = model
+        self.heads = heads.to(next(model.parameters()).device).eval()
+        self.exit_at = {layer: i for i, layer in enumerate(heads.layers)}
+        self.threshold = threshold
+        self.config = model.config
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    @property
+    def device(self):
+        return self.model.device
+
+    def __getstate__(self):
+        state = self.__dict__.copy()  # lock không pickle được (gửi sang replica process)
+        state.pop("_lock", None)
+        return state
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self._lock = threading.Lock()
+
+    def reset_stats(self):
+        with self._lock:
+            self._rows = 0
+            self._layers = 0
+            self._exits: Dict[int, int] = {}
+
+    def stats(self) -> Dict:
+        """avg_layers: số layer trung bình mỗi chunk, exits: số chunk dừng ở từng layer"""
+        with self._lock:
+            rows, layers, exits = self._rows, self._layers, dict(self._exits)
+        return {
+            "rows": rows,
+            "avg_layers": layers / rows if rows else 0.0,
+            "num_layers": len(self.layers),
+            "exits": exits
+        }
+
+    @torch.no_grad()
+    def forward(self, input_ids, attention_mask=None, token_type_ids=None, **_):
+        if attention_mask is None:
+            attention_mask = torch.ones_like(input_ids)
+        hidden = self.base.embeddings(input_ids=input_ids, token_type_ids=token_type_ids)
+        if hasattr(self.base, "embeddings_project"):  # Electra: embedding_size != hidden_size
+            hidden = self.base.embeddings_project(hidden)
+        mask = self.base.get_extended_attention_mask(attention_mask, input_ids.shape)
+
+        logits = torch.empty((len(input_ids), self.config.num_labels), device=hidden.device)
+        exit_layer = torch.full((len(input_ids),), len(self.layers), dtype=torch.long)
+        active = torch.arange(len(input_ids), device=hidden.device)
+
+        for depth, layer in enumerate(self.layers, start=1):
+            hidden = layer(hidden, attention_mask=mask)[0]
+            if depth == len(self.layers):
+                logits[active] = classify_final(self.model, hidden).float()
+                break
+            if depth not in self.exit_at:
+                continue
+            head_logits = self.heads.heads[self.exit_at[depth]](hidden[:, 0]).float()
+            done = torch.softmax(head_logits, dim=-1).max(dim=-1).values >= self.threshold
+            if done.any():
+                logits[active[done]] = head_logits[done]
+                exit_layer[active[done].cpu()] = depth
+                keep = ~done
+                if not keep.any():
+                    break
+                active, hidden, mask = active[keep], hidden[keep], mask[keep]
+
+        with self._lock:
+            self._rows += len(input_ids)
+            self._layers += int(exit_layer.sum())
+            for depth, count in zip(*torch.unique(exit_layer, return_counts=True)):
+                self._exits[int(depth)] = self._exits.get(int(depth), 0) + int(count)
+        return SimpleNamespace(logits=logits)
+
+
+def wrap_early_exit(model, model_path: str, threshold: Optional[float]):
+    """EarlyExitModel nếu có threshold + heads đã train, không thì model gốc"""
+    if threshold is None:
+        return model
+    heads = ExitHeads.load(model_path)
+    if heads is None:
+        print(f"⚠️ Chưa có {HEADS_FILE} trong {model_path} (python -m training.early_exit train), chạy full depth")
+        return model
+    try:
+        return EarlyExitModel(model, heads, threshold)
+    except ValueError as e:
+        print(f"⚠️ {e}, chạy full depth")
+        return model
@@ -0,0 +1,400 @@
+"""
+Sentence Embedding Store
+Keeps the classifier's pooled sentence embeddings (predict_logits(embeddings=True),
+same forward pass as topic classification) of every scored report, so similar
+disclosures can be searched across companies without running the model again.
+
+Layout of <root>/ (ESG_EMBEDDINGS, default "embeddings"):
+    vectors.f16    float16 (count, dim), L2-normalized, append-only, read as np.memmap
+    meta.csv       row, company, year, industry, label, text, active
+    store.json     dim, count, model
+    ivf.npz        centroids, list of every row at build time (optional, build-ivf)
+
+Re-adding a (company, year) marks its old rows inactive; `compact` rewrites the
+files without them. Search is cosine similarity: brute force (chunked matmul
+over the memmap) or IVF (k-means lists, only the nprobe closest lists are scored;
+rows added after the build are always scored).
+
+Usage:
+    python -m utils.embeddings stats
+    python -m utils.embeddings build-ivf --nlist 256
+    python -m utils.embeddings query "giảm phát thải khí nhà kính" --model ESG_classify/models/ViBert-ESG-base \
+        --k 10 --industry Utilities --exclude-company VNM --index ivf
+"""
+
+import argparse
+import json
+import os
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+EMBEDDINGS_DIR = os.environ.get("ESG_EMBEDDINGS", "embeddings")
+META_COLUMNS = ["row", "company", "year", "industry", "label", "text", "active"]
+SEARCH_CHUNK = 65536
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize (tính trên float32) rồi lưu float16"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return (vectors / np.maximum(norms, 1e-12)).astype(np.float16)
+
+
+def _as_set(value) -> Optional[set]:
+    if value is None:
+        return None
+    if isinstance(value, (str, int, np.integer)):
+        return {value}
+    return set(value)
+
+
+class EmbeddingStore:
+    def __init__(self, root: str = EMBEDDINGS_DIR):
+        self.root = root
+        self.info = {"dim": None, "count": 0, "model": None}
+        self._meta: Optional[pd.DataFrame] = None
+        self._vectors: Optional[np.memmap] = None
+        path = os.path.join(root, "store.json")
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.info.update(json.load(f))
+
+    @property
+    def count(self) -> int:
+        return self.info["count"]
+
+    @property
+    def dim(self) -> Optional[int]:
+        return self.info["dim"]
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """(count, dim) float16, memmap chỉ đọc"""
+        if self.count == 0:
+            return np.empty((0, self.dim or 0), dtype=np.float16)
+        if self._vectors is None:
+            self._vectors = np.memmap(self._path("vectors.f16"), dtype=np.float16, mode="r",
+                                      shape=(self.count, self.dim))
+        return self._vectors
+
+    @property
+    def meta(self) -> pd.DataFrame:
+        if self._meta is None:
+            if os.path.exists(self._path("meta.csv")):
+                self._meta = pd.read_csv(self._path("meta.csv"), keep_default_na=False,
+                                         dtype={"company": str, "industry": str, "label": str, "text": str})
+            else:
+                self._meta = pd.DataFrame(columns=META_COLUMNS)
+        return self._meta
+
+    # ---------- write ----------
+    def add(self, vectors: np.ndarray, texts: List[str], labels: List[str], company: str, year: int,
+            industry: Optional[str] = None, model: Optional[str] = None, replace: bool = True) -> int:
+        """
+        Thêm embedding của một báo cáo; câu trùng text trong báo cáo chỉ lưu một lần.
+        replace: đánh dấu inactive các dòng cũ của cùng (company, year). Trả về số dòng đã thêm.
+        """
+        vectors = np.asarray(vectors)
+        if len(vectors) != len(texts) or len(texts) != len(labels):
+            raise ValueError("vectors, texts và labels phải cùng độ dài")
+        if self.dim is not None and len(vectors) and vectors.shape[1] != self.dim:
+            raise ValueError(f"Embedding dim {vectors.shape[1]} khác dim của store ({self.dim})")
+        if model and self.info["model"] and model != self.info["model"]:
+            raise ValueError(f"Store được tạo với model {self.info['model']}, không thêm embedding của {model}")
+
+        os.makedirs(self.root, exist_ok=True)
+        meta = self.meta
+        if replace and len(meta):
+            old = (meta["company"] == str(company)) & (meta["year"] == int(year))
+            meta.loc[old, "active"] = False
+
+        _, first = np.unique(np.asarray(texts, dtype=object).astype(str), return_index=True)
+        keep = np.sort(first)
+        if len(keep):
+            with open(self._path("vectors.f16"), "ab") as f:
+                f.write(normalize(vectors[keep]).tobytes())
+            rows = pd.DataFrame({
+                "row": np.arange(self.count, self.count + len(keep)),
+                "company": str(company),
+                "year": int(year),
+                "industry": industry or "",
+                "label": np.asarray(labels, dtype=object)[keep],
+                "text": np.asarray(texts, dtype=object)[keep],
+                "active": True
+            })
+            meta = pd.concat([meta, rows], ignore_index=True) if len(meta) else rows
+            self.info["dim"] = int(vectors.shape[1])
+            self.info["count"] += len(keep)
+            self.info["model"] = self.info["model"] or model
+        self._meta = meta
+        self._save()
+        return len(keep)
+
+    def add_frame(self, data: pd.DataFrame, company: str, year: int, industry: Optional[str] = None,
+                  model: Optional[str] = None, skip_irrelevant: bool = True) -> int:
+        """Thêm output của ESGClassifier.classify_text(..., embeddings=True) (cột text, label, embedding)"""
+        if "embedding" not in data:
+            raise ValueError("data không có cột embedding (classify_text(..., embeddings=True))")
+        if skip_irrelevant:
+            data = data[data["label"] != "Irrelevant"]
+        vectors = np.stack(data["embedding"].to_numpy()) if len(data) else np.empty((0, self.dim or 0))
+        return self.add(vectors, data["text"].tolist(), data["label"].tolist(), company, year, industry, model)
+
+    def remove(self, company: str, year: Optional[int] = None):
+        meta = self.meta
+        mask = meta["company"] == str(company)
+        if year is not None:
+            mask &= meta["year"] == int(year)
+        meta.loc[mask, "active"] = False
+        self._save()
+
+    def compact(self) -> int:
+        """Ghi lại store chỉ với các dòng active (index IVF cũ bị xoá). Trả về số dòng đã bỏ"""
+        meta = self.meta
+        active = meta["active"].to_numpy(dtype=bool, copy=True)
+        removed = int((~active).sum())
+        if removed == 0:
+            return 0
+        rows = meta.loc[active, "row"].to_numpy(dtype=np.int64)
+        tmp = self._path("vectors.f16.tmp")
+        with open(tmp, "wb") as f:
+            for start in range(0, len(rows), SEARCH_CHUNK):
+                f.write(np.ascontiguousarray(self.vectors[rows[start:start + SEARCH_CHUNK]]).tobytes())
+        self._vectors = None
+        os.replace(tmp, self._path("vectors.f16"))
+        meta = meta[active].reset_index(drop=True)
+        meta["row"] = np.arange(len(meta))
+        self._meta = meta
+        self.info["count"] = len(meta)
+        if os.path.exists(self._path("ivf.npz")):
+            os.remove(self._path("ivf.npz"))
+        self._save()
+        return removed
+
+    def _save(self):
+        self._vectors = None  # memmap mở lại với count mới
+        self.meta.to_csv(self._path("meta.csv"), index=False)
+        with open(self._path("store.json"), "w", encoding="utf-8") as f:
+            json.dump(self.info, f, ensure_ascii=False, indent=2)
+
+    # ---------- read ----------
+    def mask(self, company=None, year=None, industry=None, label=None, exclude_company=None) -> np.ndarray:
+        """Dòng active thoả các filter (giá trị đơn hoặc list)"""
+        meta = self.meta
+        mask = meta["active"].to_numpy(dtype=bool, copy=True)  # không copy thì &= ghi vào cột active
+        for column, value in (("company", company), ("year", year), ("industry", industry), ("label", label)):
+            values = _as_set(value)
+            if values is not None:
+                if column == "year":
+                    values = {int(v) for v in values}
+                mask &= meta[column].isin(values).to_numpy()
+        excluded = _as_set(exclude_company)
+        if excluded:
+            mask &= ~meta["company"].isin(excluded).to_numpy()
+        return mask
+
+    def stats(self) -> Dict:
+        meta = self.meta
+        active = meta[meta["active"].astype(bool)] if len(meta) else meta
+        return {
+            "root": self.root,
+            "model": self.info["model"],
+            "dim": self.dim,
+            "rows": self.count,
+            "active_rows": len(active),
+            "reports": int(active[["company", "year"]].drop_duplicates().shape[0]) if len(active) else 0,
+            "bytes": self.count * (self.dim or 0) * 2,
+            "ivf": os.path.exists(self._path("ivf.npz"))
+        }
+
+
+def _topk(scores: np.ndarray, rows: np.ndarray, k: int):
+    if len(scores) > k:
+        best = np.argpartition(-scores, k - 1)[:k]
+        scores, rows = scores[best], rows[best]
+    order = np.argsort(-scores, kind="stable")
+    return scores[order], rows[order]
+
+
+def _score_rows(store: EmbeddingStore, queries: np.ndarray, rows: np.ndarray, k: int):
+    """Top-k (scores, rows) của mỗi query trên các dòng rows, đọc memmap theo chunk"""
+    best = [(np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)) for _ in range(len(queries))]
+    contiguous = len(rows) == store.count
+    for start in range(0, len(rows), SEARCH_CHUNK):
+        chunk = rows[start:start + SEARCH_CHUNK]
+        block = store.vectors[start:start + len(chunk)] if contiguous else store.vectors[chunk]
+        scores = queries @ np.asarray(block, dtype=np.float32).T
+        for i in range(len(queries)):
+            best[i] = _topk(np.concatenate([best[i][0], scores[i]]), np.concatenate([best[i][1], chunk]), k)
+    return best
+
+
+class BruteForceIndex:
+    def __init__(self, store: EmbeddingStore):
+        self.store = store
+
+    def search(self, queries: np.ndarray, k: int = 10, **filters) -> List:
+        """[(scores, rows)] cho từng query; filters như EmbeddingStore.mask"""
+        queries = normalize(queries).astype(np.float32)
+        rows = np.flatnonzero(self.store.mask(**filters))
+        return _score_rows(self.store, queries, rows, k)
+
+
+class IVFIndex:
+    def __init__(self, store: EmbeddingStore, nprobe: int = 8):
+        self.store = store
+        self.nprobe = nprobe
+        self.centroids = None
+        self.assignments = None
+        path = os.path.join(store.root, "ivf.npz")
+        if os.path.exists(path):
+            data = np.load(path)
+            self.centroids, self.assignments = data["centroids"], data["assignments"]
+
+    @property
+    def built(self) -> bool:
+        return self.centroids is not None
+
+    def build(self, nlist: Optional[int] = None, sample: int = 50000, iterations: int = 20, seed: int = 0):
+        """Spherical k-means trên mẫu các dòng active, rồi gán mọi dòng vào list gần nhất"""
+        rows = np.flatnonzero(self.store.mask())
+        if len(rows) == 0:
+            raise ValueError("Store không có dòng active để build IVF")
+        nlist = min(nlist or max(1, int(np.sqrt(len(rows)))), len(rows))
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(rng.choice(rows, size=min(sample, len(rows)), replace=False))
+        data = np.asarray(self.store.vectors[sample_rows], dtype=np.float32)
+        centroids = data[rng.choice(len(data), size=nlist, replace=False)]
+        for _ in range(iterations):
+            assign = np.argmax(data @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, data)
+            empty = np.bincount(assign, minlength=nlist) == 0
+            sums[empty] = data[rng.choice(len(data), size=int(empty.sum()))]  # list rỗng: lấy lại điểm ngẫu nhiên
+            centroids = normalize(sums).astype(np.float32)
+
+        assignments = np.empty(self.store.count, dtype=np.int32)
+        for start in range(0, self.store.count, SEARCH_CHUNK):
+            block = np.asarray(self.store.vectors[start:start + SEARCH_CHUNK], dtype=np.float32)
+            assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        self.centroids, self.assignments = centroids, assignments
+        np.savez(os.path.join(self.store.root, "ivf.npz"), centroids=centroids, assignments=assignments)
+        return self
+
+    def search(self, queries: np.ndarray, k: int = 10, nprobe: Optional[int] = None, **filters) -> List:
+        if not self.built:
+            raise ValueError("Chưa build IVF (python -m utils.embeddings build-ivf)")
+        queries = normalize(queries).astype(np.float32)
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        mask = self.store.mask(**filters)
+        covered = len(self.assignments)
+        results = []
+        for query in queries:
+            probes = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+            candidates = np.zeros(len(mask), dtype=bool)
+            candidates[:covered] = np.isin(self.assignments, probes)
+            candidates[covered:] = True  # dòng thêm sau khi build
+            results.extend(_score_rows(self.store, query[None, :], np.flatnonzero(candidates & mask), k))
+        return results
+
+
+def search(store: EmbeddingStore, queries: Union[str, List[str], np.ndarray], classifier=None, k: int = 10,
+           index: str = "brute", nprobe: int = 8, **filters) -> pd.DataFrame:
+    """
+    Câu gần nhất trong store cho từng query (text thô -> classifier.embed, hoặc embedding sẵn).
+    filters: company, year, industry, label, exclude_company.
+    Trả về DataFrame [query, rank, score, row, company, year, industry, label, text].
+    """
+    if isinstance(queries, str):
+        queries = [queries]
+    if isinstance(queries, np.ndarray):
+        names, vectors = list(range(len(queries))), queries
+    else:
+        if classifier is None:
+            raise ValueError("Cần classifier để embed query dạng text")
+        names, vectors = list(queries), classifier.embed(list(queries))
+
+    if index == "ivf":
+        results = IVFIndex(store, nprobe).search(vectors, k, **filters)
+    elif index == "brute":
+        results = BruteForceIndex(store).search(vectors, k, **filters)
+    else:
+        raise ValueError(f"Index '{index}' not supported. Available: ['brute', 'ivf']")
+
+    meta = store.meta.set_index("row")
+    frames = []
+    for name, (scores, rows) in zip(names, results):
+        found = meta.loc[rows, ["company", "year", "industry", "label", "text"]].reset_index()
+        found.insert(0, "score", scores)
+        found.insert(0, "rank", np.arange(1, len(rows) + 1))
+        found.insert(0, "query", name)
+        frames.append(found)
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def similar(store: EmbeddingStore, row: int, k: int = 10, other_companies: bool = True, **filters) -> pd.DataFrame:
+    """Câu gần nhất với một dòng đã có trong store, mặc định chỉ ở công ty khác"""
+    company = store.meta.loc[store.meta["row"] == row, "company"]
+    if other_companies and len(company):
+        filters.setdefault("exclude_company", company.iloc[0])
+    return search(store, np.asarray(store.vectors[[row]]), k=k, **filters)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sentence embedding store: stats, IVF build, similarity search")
+    parser.add_argument("--store", default=EMBEDDINGS_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("stats", help="Rows, reports and size of the store")
+    commands.add_parser("compact", help="Drop inactive (replaced / removed) rows")
+
+    build = commands.add_parser("build-ivf", help="Cluster the store for IVF search")
+    build.add_argument("--nlist", type=int, default=None, help="Default: sqrt(active rows)")
+    build.add_argument("--sample", type=int, default=50000)
+    build.add_argument("--iterations", type=int, default=20)
+
+    query = commands.add_parser("query", help="Nearest sentences for query texts")
+    query.add_argument("text", nargs="+")
+    query.add_argument("--model", default=None, help="ESGClassifier model dir (default: the store's model)")
+    query.add_argument("--k", type=int, default=10)
+    query.add_argument("--index", choices=["brute", "ivf"], default="brute")
+    query.add_argument("--nprobe", type=int, default=8)
+    query.add_argument("--company", nargs="*")
+    query.add_argument("--exclude-company", nargs="*")
+    query.add_argument("--year", type=int, nargs="*")
+    query.add_argument("--industry", nargs="*")
+    query.add_argument("--label", nargs="*")
+    query.add_argument("--output", help="Write results CSV here")
+    args = parser.parse_args()
+
+    store = EmbeddingStore(args.store)
+    if args.command == "stats":
+        print(json.dumps(store.stats(), indent=2, ensure_ascii=False))
+    elif args.command == "compact":
+        print(f"Đã bỏ {store.compact()} dòng inactive")
+    elif args.command == "build-ivf":
+        index = IVFIndex(store).build(args.nlist, sample=args.sample, iterations=args.iterations)
+        sizes = np.bincount(index.assignments, minlength=len(index.centroids))
+        print(f"✅ IVF: {len(index.centroids)} lists, list size mean {sizes.mean():.1f}, max {sizes.max()}")
+    else:
+        from ESG_classify.esg_classifier import ESGClassifier
+        model = args.model or store.info["model"]
+        if not model:
+            raise SystemExit("Store không ghi model, cần --model")
+        classifier = ESGClassifier(model)
+        results = search(store, args.text, classifier, k=args.k, index=args.index, nprobe=args.nprobe,
+                         company=args.company or None, exclude_company=args.exclude_company or None,
+                         year=args.year or None, industry=args.industry or None, label=args.label or None)
+        with pd.option_context("display.max_colwidth", 120, "display.width", 200):
+            print(results.to_string(index=False))
+        if args.output:
+            results.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
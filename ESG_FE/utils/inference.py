@@ -0,0 +1,323 @@
+"""
+Inference Utilities
+Shared encoding / forward helpers for ESGClassifier and ESGModel
+"""
+
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+
+from utils.metrics import INFERENCE_BATCH_SIZE, INFERENCE_LATENCY, INFERENCE_SENTENCES
+from utils.tracing import NOOP_SPAN, span
+
+LONG_TEXT_MODES = ("truncate", "window")
+# eager: HF attention với attention mask đầy đủ (mặc định)
+# sdpa: torch scaled_dot_product_attention (attn_implementation="sdpa")
+# bettertransformer: optimum BetterTransformer (fused encoder, nested tensor bỏ qua pad)
+# Mode khác eager còn batch theo độ dài (pack) để gần như không còn pad token.
+ATTENTION_MODES = ("eager", "sdpa", "bettertransformer")
+DEFAULT_ATTENTION = os.environ.get("ESG_ATTENTION", "eager")
+
+
+def _to_bettertransformer(model):
+    from optimum.bettertransformer import BetterTransformer  # optional dependency
+    return BetterTransformer.transform(model.eval())
+
+
+def load_sequence_classifier(ModelClass, model_path: str, attention: Optional[str] = None,
+                             device=None, **kwargs) -> Tuple[torch.nn.Module, str]:
+    """
+    from_pretrained với attention mode, trả về (model, mode thực tế).
+    sdpa không được hỗ trợ (transformers cũ / kiến trúc chưa có) -> thử
+    bettertransformer -> eager.
+    """
+    attention = attention or DEFAULT_ATTENTION
+    if attention not in ATTENTION_MODES:
+        raise ValueError(f"attention '{attention}' not supported. Available: {list(ATTENTION_MODES)}")
+
+    model = None
+    if attention == "sdpa":
+        try:
+            model = ModelClass.from_pretrained(model_path, attn_implementation="sdpa", **kwargs)
+        except (ValueError, TypeError, ImportError) as e:
+            print(f"⚠️ SDPA không dùng được cho {ModelClass.__name__} ({e}), thử BetterTransformer")
+            attention = "bettertransformer"
+    if model is None:
+        model = ModelClass.from_pretrained(model_path, **kwargs)
+    if device is not None:
+        model = model.to(device)
+    model.eval()
+
+    if attention == "bettertransformer":
+        try:
+            model = _to_bettertransformer(model)
+        except Exception as e:
+            print(f"⚠️ BetterTransformer không dùng được ({e}), dùng eager attention")
+            attention = "eager"
+    return model, attention
+
+
+def batch_bounds(lengths: List[int], batch_size: int, max_tokens: Optional[int] = None) -> List[Tuple[int, int]]:
+    """
+    Chia chunk (theo thứ tự lengths) thành các batch [start, end): tối đa
+    batch_size chunk và, nếu có max_tokens, tối đa max_tokens token kể cả pad
+    (batch luôn có ít nhất một chunk).
+    """
+    bounds, start = [], 0
+    while start < len(lengths):
+        end, longest = start, 0
+        while end < len(lengths) and end - start < batch_size:
+            longest = max(longest, lengths[end])
+            if max_tokens and end > start and longest * (end - start + 1) > max_tokens:
+                break
+            end += 1
+        bounds.append((start, end))
+        start = end
+    return bounds
+
+
+def padded_tokens(lengths: List[int], batch_size: int, max_tokens: Optional[int] = None) -> int:
+    """Số token (kể cả pad) khi batch theo thứ tự lengths"""
+    return sum(max(lengths[start:end]) * (end - start) for start, end in batch_bounds(lengths, batch_size, max_tokens))
+
+
+def encode_inputs(tokenizer, texts: List[str], max_length: int = 256,
+                  long_text: str = "truncate", stride: int = 64,
+                  cache=None) -> Tuple[List[List[int]], List[int], Dict]:
+    """
+    Tokenize texts thành các chunk input_ids (đã có special tokens).
+    long_text="truncate": giữ max_length token đầu (giống truncation=True).
+    long_text="window": chia input quá dài thành các cửa sổ chồng lấn `stride` token.
+    cache: EncodingCache (utils.tokenization), câu đã gặp không tokenize lại.
+    Trả về (chunks, owners, stats) với owners[i] = vị trí text gốc của chunk i.
+    """
+    if long_text not in LONG_TEXT_MODES:
+        raise ValueError(f"long_text '{long_text}' not supported. Available: {list(LONG_TEXT_MODES)}")
+
+    body = max_length - tokenizer.num_special_tokens_to_add()
+    step = max(body - stride, 1)
+    if cache is not None:
+        token_ids = cache.encode(tokenizer, list(texts))
+    else:
+        token_ids = tokenizer(list(texts), add_special_tokens=False, truncation=False)["input_ids"]
+
+    chunks, owners, num_chunks, truncated = [], [], [], []
+    for i, ids in enumerate(token_ids):
+        pieces = [ids[:body]]
+        if len(ids) > body and long_text == "window":
+            pieces = []
+            start = 0
+            while True:
+                pieces.append(ids[start:start + body])
+                if start + body >= len(ids):
+                    break
+                start += step
+        for piece in pieces:
+            chunks.append(tokenizer.build_inputs_with_special_tokens(piece))
+            owners.append(i)
+        num_chunks.append(len(pieces))
+        truncated.append(len(ids) > body and long_text == "truncate")
+
+    stats = {
+        "inputs": len(token_ids),
+        "chunks": len(chunks),
+        "truncated": sum(truncated),
+        "windowed": sum(n > 1 for n in num_chunks),
+        "num_chunks": num_chunks,
+        "truncated_mask": truncated
+    }
+    return chunks, owners, stats
+
+
+def mean_pool(hidden: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+    """Trung bình hidden state trên các token không phải pad"""
+    mask = attention_mask.unsqueeze(-1).to(hidden.dtype)
+    return (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+
+
+def _restore_order(values: torch.Tensor, order: Optional[List[int]]) -> torch.Tensor:
+    if order is None:
+        return values
+    restored = torch.empty_like(values)
+    restored[torch.tensor(order, device=values.device)] = values
+    return restored
+
+
+def _average_by_owner(values: torch.Tensor, owners: List[int], n: int) -> torch.Tensor:
+    owners = torch.tensor(owners, device=values.device)
+    sums = torch.zeros((n, values.shape[-1]), device=values.device)
+    sums.index_add_(0, owners, values)
+    counts = torch.bincount(owners, minlength=n).clamp(min=1)
+    return sums / counts[:, None]
+
+
+@torch.no_grad()
+def predict_logits(model, tokenizer, texts: List[str], max_length: int = 256, batch_size: int = 32,
+                   long_text: str = "truncate", stride: int = 64, device=None,
+                   cache=None, pack: bool = False, max_tokens: Optional[int] = None,
+                   embeddings: bool = False) -> Tuple[torch.Tensor, Dict]:
+    """
+    Forward theo batch; chunk của câu dài được batch chung với câu thường,
+    logits được lấy trung bình theo câu gốc.
+    pack: batch các chunk theo độ dài (giảm pad), logits được trả về đúng thứ tự.
+    max_tokens: giới hạn token (kể cả pad) mỗi batch, batch câu ngắn được nhiều câu hơn.
+    embeddings: thêm stats["embeddings"] (n, hidden) = mean pooling layer cuối, cùng forward pass
+                (cần model HF gốc, không dùng được với ReplicaPool / EarlyExitModel).
+    """
+    device = device or model.device
+    if len(texts) == 0:
+        stats = {"inputs": 0, "chunks": 0, "truncated": 0, "windowed": 0, "num_chunks": [], "truncated_mask": []}
+        if embeddings:
+            stats["embeddings"] = torch.empty((0, model.config.hidden_size))
+        return torch.empty((0, model.config.num_labels)), stats
+    if embeddings and hasattr(model, "forward_chunks"):
+        raise ValueError("embeddings không dùng được với ReplicaPool")
+
+    start_time = time.perf_counter()
+    INFERENCE_SENTENCES.inc(len(texts), model=getattr(model.config, "model_type", "unknown"))
+
+    with span("tokenize", items=len(texts)) as s:
+        chunks, owners, stats = encode_inputs(tokenizer, texts, max_length, long_text, stride, cache)
+        s.set(chunks=stats["chunks"], tokens=sum(len(c) for c in chunks))
+
+    order = None
+    if pack:
+        order = sorted(range(len(chunks)), key=lambda i: len(chunks[i]), reverse=True)
+        chunks = [chunks[i] for i in order]
+
+    lengths = [len(c) for c in chunks]
+    bounds = batch_bounds(lengths, batch_size, max_tokens)
+    chunk_embeddings = None
+    with span("forward", items=len(chunks), batch_size=batch_size, device=str(device)) as s:
+        if s is not NOOP_SPAN:
+            s.set(batches=len(bounds), padded_tokens=sum(max(lengths[a:b]) * (b - a) for a, b in bounds))
+        for start, end in bounds:
+            INFERENCE_BATCH_SIZE.observe(end - start)
+        if hasattr(model, "forward_chunks"):  # ReplicaPool (utils.replicas): batch chạy song song
+            chunk_logits = model.forward_chunks([chunks[start:end] for start, end in bounds]).float()
+        else:
+            chunk_logits, pooled = [], []
+            for start, end in bounds:
+                batch = tokenizer.pad({"input_ids": chunks[start:end]}, padding=True, return_tensors='pt').to(device)
+                if embeddings:
+                    output = model(**batch, output_hidden_states=True)
+                    if getattr(output, "hidden_states", None) is None:
+                        raise ValueError(f"{type(model).__name__} không trả về hidden_states, không tính được embeddings")
+                    pooled.append(mean_pool(output.hidden_states[-1], batch["attention_mask"]).float())
+                else:
+                    output = model(**batch)
+                chunk_logits.append(output.logits.float())
+            chunk_logits = torch.cat(chunk_logits)
+            if embeddings:
+                chunk_embeddings = _restore_order(torch.cat(pooled), order)
+        chunk_logits = _restore_order(chunk_logits, order)
+    INFERENCE_LATENCY.observe(time.perf_counter() - start_time)
+
+    if stats["chunks"] == stats["inputs"]:
+        if chunk_embeddings is not None:
+            stats["embeddings"] = chunk_embeddings
+        return chunk_logits, stats
+
+    if chunk_embeddings is not None:
+        stats["embeddings"] = _average_by_owner(chunk_embeddings, owners, len(texts))
+    return _average_by_owner(chunk_logits, owners, len(texts)), stats
+
+
+@dataclass
+class PredictionTable:
+    """
+    Kết quả dự đoán dạng cột (NumPy) thay cho list-of-dicts:
+    class_id (n,), confidence (n,), probs (n, num_labels), num_windows (n,), truncated (n,),
+    embeddings (n, hidden) float16 nếu predict với embeddings=True
+    """
+    class_id: np.ndarray
+    confidence: np.ndarray
+    probs: np.ndarray
+    label_names: List[str]
+    num_windows: Optional[np.ndarray] = None
+    truncated: Optional[np.ndarray] = None
+    embeddings: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_logits(cls, logits: torch.Tensor, label_names: List[str], stats: Optional[Dict] = None):
+        probs = torch.softmax(logits.float(), dim=-1).cpu().numpy().astype(np.float32, copy=False)
+        class_id = probs.argmax(axis=1).astype(np.int16)
+        confidence = probs[np.arange(len(probs)), class_id]
+        n = len(probs)
+        num_windows = np.asarray(stats["num_chunks"], dtype=np.int32) if stats else np.ones(n, dtype=np.int32)
+        truncated = np.asarray(stats["truncated_mask"], dtype=bool) if stats else np.zeros(n, dtype=bool)
+        embeddings = None
+        if stats and "embeddings" in stats:
+            embeddings = stats["embeddings"].cpu().numpy().astype(np.float16)
+        return cls(class_id, confidence, probs, list(label_names or []), num_windows, truncated, embeddings)
+
+    def __len__(self) -> int:
+        return len(self.class_id)
+
+    @property
+    def num_labels(self) -> int:
+        return self.probs.shape[1] if self.probs.ndim == 2 else len(self.label_names)
+
+    @property
+    def labels(self) -> np.ndarray:
+        """Tên nhãn của từng dòng"""
+        return np.asarray(self.label_names, dtype=object)[self.class_id]
+
+    def label_id(self, label: str) -> int:
+        return self.label_names.index(label)
+
+    def mask(self, class_id: int) -> np.ndarray:
+        return self.class_id == class_id
+
+    def counts(self) -> np.ndarray:
+        """Số dòng theo class_id (np.bincount)"""
+        return np.bincount(self.class_id, minlength=self.num_labels)
+
+    def counts_by_label(self) -> Dict[str, int]:
+        counts = self.counts()
+        return {name: int(counts[i]) for i, name in enumerate(self.label_names) if i < len(counts)}
+
+    def take(self, indices) -> "PredictionTable":
+        """Chọn / fan-out dòng theo chỉ số"""
+        indices = np.asarray(indices)
+        return PredictionTable(
+            self.class_id[indices], self.confidence[indices], self.probs[indices], self.label_names,
+            None if self.num_windows is None else self.num_windows[indices],
+            None if self.truncated is None else self.truncated[indices],
+            None if self.embeddings is None else self.embeddings[indices]
+        )
+
+    def with_fallback(self, threshold: float, fallback_id: int) -> "PredictionTable":
+        """Dòng có confidence < threshold được gán fallback_id"""
+        class_id = np.where(self.confidence < threshold, fallback_id, self.class_id).astype(self.class_id.dtype)
+        return PredictionTable(class_id, self.confidence, self.probs, self.label_names,
+                               self.num_windows, self.truncated, self.embeddings)
+
+    def length_stats(self) -> Dict[str, int]:
+        """Thống kê truncate/window cho một document"""
+        num_windows = self.num_windows if self.num_windows is not None else np.ones(len(self), dtype=np.int32)
+        truncated = self.truncated if self.truncated is not None else np.zeros(len(self), dtype=bool)
+        return {
+            "inputs": len(self),
+            "truncated": int(truncated.sum()),
+            "windowed": int((num_windows > 1).sum()),
+            "chunks": int(num_windows.sum())
+        }
+
+    def to_dicts(self) -> List[Dict]:
+        """Định dạng cũ của batch_predict"""
+        labels = self.labels
+        return [
+            {
+                "class": labels[i],
+                "confidence": float(self.confidence[i]),
+                "class_id": int(self.class_id[i]),
+                "num_windows": int(self.num_windows[i]) if self.num_windows is not None else 1,
+                "truncated": bool(self.truncated[i]) if self.truncated is not None else False
+            }
+            for i in range(len(self))
+        ]
@@ -0,0 +1,287 @@
+"""
+Background Jobs
+In-process job manager cho phân tích ESG: worker pool, job ID, tiến độ theo
+stage, kết quả tạm (partial E/S/G counts) và huỷ cooperative giữa các batch.
+
+    manager = JobManager(max_workers=2)
+    job_id = manager.submit("analyze_report", analyze_sentences, classifier, calculator,
+                            sentences, industry, model_path, owner=session_id)
+    manager.get(job_id).snapshot()   # UI poll, không block
+    manager.cancel(job_id)
+
+Hàm chạy trong job nhận `job` làm tham số đầu tiên, gọi job.stage / job.advance /
+job.publish để báo tiến độ và job.check_cancelled() giữa các batch.
+"""
+
+import copy
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from utils.dedup import SentenceDeduplicator
+from utils.metrics import JOBS, QUEUE_DEPTH
+from utils.streaming import CATEGORIES, SENTIMENTS, TOPICS
+from utils.tracing import span, trace
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, name: str, owner: Optional[str] = None):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.owner = owner
+        self.status = QUEUED
+        self.current_stage = None
+        self.progress: Dict[str, List[int]] = {}  # stage -> [done, total]
+        self.partial: Dict = {}
+        self.result = None
+        self.error = None
+        self.trace = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.files: List[str] = []  # file tạm của job, xoá khi job bị prune
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    # ---------- gọi từ worker ----------
+    def stage(self, name: str, total: int):
+        with self._lock:
+            self.current_stage = name
+            self.progress[name] = [0, total]
+
+    def advance(self, n: int = 1):
+        with self._lock:
+            self.progress[self.current_stage][0] += n
+
+    def set_progress(self, done: int, total: int):
+        with self._lock:
+            self.progress[self.current_stage] = [done, total]
+
+    def publish(self, **partial):
+        """Kết quả tạm (bản sao), UI đọc qua snapshot()"""
+        partial = copy.deepcopy(partial)
+        with self._lock:
+            self.partial.update(partial)
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled(f"Job {self.job_id} cancelled")
+
+    # ---------- gọi từ UI ----------
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel.is_set()
+
+    @property
+    def done(self) -> bool:
+        return self.status in FINISHED
+
+    def snapshot(self) -> Dict:
+        """Bản sao trạng thái (rẻ, an toàn để đọc từ thread khác)"""
+        with self._lock:
+            return {
+                "job_id": self.job_id,
+                "name": self.name,
+                "status": self.status,
+                "stage": self.current_stage,
+                "progress": {k: tuple(v) for k, v in self.progress.items()},
+                "partial": dict(self.partial),
+                "error": self.error,
+                "cancel_requested": self._cancel.is_set(),
+                "elapsed": (self.finished or time.time()) - (self.started or time.time())
+            }
+
+
+class JobManager:
+    def __init__(self, max_workers: int = 2, queue: str = "analysis", keep_seconds: float = 3600):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"esg-{queue}")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self.keep_seconds = keep_seconds
+        QUEUE_DEPTH.set_function(lambda: {(("queue", queue),): self.pending()})
+
+    def submit(self, name: str, fn: Callable, *args, owner: Optional[str] = None, **kwargs) -> str:
+        job = Job(name, owner)
+        with self._lock:
+            self._prune()
+            self._jobs[job.job_id] = job
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job.job_id
+
+    def _run(self, job: Job, fn: Callable, args, kwargs):
+        if job.cancel_requested:  # huỷ khi còn trong hàng đợi
+            job.status, job.finished = CANCELLED, time.time()
+            JOBS.inc(status=CANCELLED)
+            return
+        job.status, job.started = RUNNING, time.time()
+        try:
+            # thread của pool không kế thừa contextvars: mỗi job có trace riêng
+            with trace(job.name, job_id=job.job_id) as job_trace:
+                job.trace = job_trace
+                job.result = fn(job, *args, **kwargs)
+            job.status = DONE
+        except JobCancelled:
+            job.status = CANCELLED
+        except Exception as e:
+            print(f"❌ Job {job.job_id} ({job.name}) failed: {e}")
+            job.error = f"{type(e).__name__}: {e}"
+            job.status = FAILED
+        finally:
+            job.finished = time.time()
+            JOBS.inc(status=job.status)
+
+    def get(self, job_id: Optional[str]) -> Optional[Job]:
+        return self._jobs.get(job_id) if job_id else None
+
+    def cancel(self, job_id: str) -> bool:
+        job = self.get(job_id)
+        if job is None or job.done:
+            return False
+        job.cancel()
+        return True
+
+    def jobs(self, owner: Optional[str] = None) -> List[Job]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return sorted((j for j in jobs if owner is None or j.owner == owner), key=lambda j: j.created)
+
+    def pending(self) -> int:
+        return sum(job.status == QUEUED for job in list(self._jobs.values()))
+
+    def _prune(self):
+        """Bỏ job đã xong quá keep_seconds (gọi khi đang giữ lock)"""
+        cutoff = time.time() - self.keep_seconds
+        for job_id in [j.job_id for j in self._jobs.values() if j.done and j.finished < cutoff]:
+            for path in self._jobs.pop(job_id).files:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def shutdown(self):
+        for job in self.jobs():
+            job.cancel()
+        self._executor.shutdown(wait=False)
+
+
+def _group_batches(group_ids: np.ndarray, size: int):
+    """
+    Chỉ số theo batch khoảng size phần tử; các phần tử cùng group luôn nằm chung
+    một batch (dedup trong classify_text / classify_multiple_sentiment phủ cả input).
+    """
+    order = np.argsort(group_ids, kind="stable")
+    sorted_ids = group_ids[order]
+    bounds = np.r_[np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]]), len(order)]
+    start = 0
+    while start < len(order):
+        end = bounds[min(np.searchsorted(bounds, start + size), len(bounds) - 1)]
+        yield order[start:end]
+        start = end
+
+
+def analyze_sentences(job: Job, classifier, calculator, sentences: List[str], industry: str,
+                      model_path: str, batch_size: int = 256, embedding_store=None,
+                      company: Optional[str] = None, year: Optional[int] = None) -> Dict:
+    """
+    classify_text + calculate_company_esg_score chia theo batch câu: sau mỗi batch
+    cập nhật counts tạm và kiểm tra huỷ. calculator nên tạo với cache_models=True
+    để không load lại sentiment model mỗi batch.
+    Câu trùng được gom vào cùng batch (exact dedup một lần trên cả list), nên mỗi câu
+    chỉ được phân loại / chấm sentiment một lần dù báo cáo lớn hơn một batch.
+    embedding_store: EmbeddingStore (utils/embeddings.py), lưu embedding của báo cáo (company, year)
+    lấy từ chính forward pass phân loại.
+    Trả về dict của score_from_summary + counts, summary, data, length_stats, industry.
+    """
+    if embedding_store is not None and (company is None or year is None):
+        raise ValueError("embedding_store cần company và year")
+    counts = {topic: 0 for topic in TOPICS}
+    length_stats = {}
+    frames, positions = [], []
+    with span("dedup", items=len(sentences)):
+        cluster_ids = SentenceDeduplicator(threshold=None).build(sentences).cluster_ids
+
+    job.stage("classify", len(sentences))
+    for batch in _group_batches(cluster_ids, batch_size):
+        job.check_cancelled()
+        batch_counts, data = classifier.classify_text([sentences[i] for i in batch],
+                                                      embeddings=embedding_store is not None)
+        if data is None:
+            raise RuntimeError("Classification failed")
+        for topic in TOPICS:
+            counts[topic] += batch_counts.get(topic, 0)
+        for key, value in data.attrs.get("length_stats", {}).items():
+            length_stats[key] = length_stats.get(key, 0) + value
+        frames.append(data)
+        positions.append(batch)
+        job.advance(len(batch))
+        job.publish(counts=counts)
+
+    if frames:  # về lại thứ tự câu ban đầu, cluster_id theo dedup trên cả list
+        data = pd.concat(frames, ignore_index=True)
+        data.index = np.concatenate(positions)
+        data = data.sort_index()
+        data["cluster_id"] = cluster_ids
+    else:
+        data = pd.DataFrame(columns=["text", "label", "class_id", "cluster_id"])
+    relevant = data[data["label"] != "Irrelevant"]
+    if embedding_store is not None and "embedding" in data:
+        with span("store_embeddings", items=len(relevant)):
+            embedding_store.add_frame(data, company, year, industry, model=getattr(classifier, "model_path", None))
+    summary = {category: {s: 0 for s in SENTIMENTS} for category in CATEGORIES}
+
+    job.stage("sentiment", len(relevant))
+    text_ids = pd.factorize(relevant["text"])[0]  # sentiment dedup theo text gốc (phân biệt hoa / thường)
+    for batch in _group_batches(text_ids, batch_size):
+        job.check_cancelled()
+        chunk = relevant.iloc[batch]
+        with span("classify_multiple_sentiment", items=len(chunk)):
+            chunk_summary = calculator.classify_multiple_sentiment(chunk, model_path)
+        for category in CATEGORIES:
+            for sentiment in SENTIMENTS:
+                summary[category][sentiment] += chunk_summary.get(category, {}).get(sentiment, 0)
+        job.advance(len(chunk))
+        job.publish(summary=summary)
+
+    job.check_cancelled()
+    job.stage("score", 1)
+    result = calculator.score_from_summary(summary, industry, len(relevant))
+    job.advance()
+    result.update({"counts": counts, "summary": summary, "data": data, "length_stats": length_stats,
+                   "industry": industry})
+    return result
+
+
+def stream_report(job: Job, analyzer, source, industry: str, results_dir: Optional[str] = None) -> Dict:
+    """
+    StreamingAnalyzer.run trong job: progress theo trang, huỷ giữa các cửa sổ.
+    results_dir: ghi kết quả từng câu vào <results_dir>/stream_results_<job_id>.csv
+    (riêng cho mỗi job, xoá khi job hết hạn).
+    """
+    job.stage("pages", 0)
+    if results_dir is not None:
+        analyzer = copy.copy(analyzer)
+        analyzer.results_path = os.path.join(results_dir, f"stream_results_{job.job_id}.csv")
+        job.files.append(analyzer.results_path)
+
+    def on_progress(done, total, running_counts):
+        job.set_progress(done, total)
+        job.publish(counts=running_counts)
+        job.check_cancelled()
+
+    return analyzer.run(source, industry, progress=on_progress)
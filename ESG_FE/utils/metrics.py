@@ -0,0 +1,245 @@
+"""
+Metrics Utilities
+In-process counters / histograms / gauges rendered in Prometheus text format
+(served by text_server.py at /metrics).
+
+Hot path is lock-free: every thread writes to its own shard (threading.local),
+the scrape sums all shards. The lock is only taken when a new thread gets its
+shard, when a metric is registered and during the scrape, which folds the
+shards of finished threads (Streamlit reruns, job workers) into one base shard.
+"""
+
+import bisect
+import threading
+import time
+import weakref
+from typing import Callable, Dict, List, Optional, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+def _key(labels: Dict) -> Tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: Tuple, extra: Optional[Tuple] = None) -> str:
+    pairs = list(key) + list(extra or ())
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Shard:
+    __slots__ = ("values", "histograms")
+
+    def __init__(self):
+        self.values = {}      # (name, labels) -> float (counter / gauge delta)
+        self.histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+
+    def merge(self, other: "_Shard"):
+        for key, value in other.values.items():
+            self.values[key] = self.values.get(key, 0) + value
+        for key, state in other.histograms.items():
+            total = self.histograms.setdefault(key, [0] * len(state))
+            for i, v in enumerate(state):
+                total[i] += v
+
+
+class Counter:
+    def __init__(self, registry: "Registry", name: str):
+        self._registry = registry
+        self.name = name
+
+    def inc(self, amount: float = 1, **labels):
+        values = self._registry._shard().values
+        key = (self.name, _key(labels))
+        values[key] = values.get(key, 0) + amount
+
+
+class Gauge(Counter):
+    """inc/dec cộng dồn theo shard (in-flight...), set_function cho giá trị đọc lúc scrape"""
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, fn: Callable[[], Dict[Tuple, float]]):
+        """fn() trả về {labels tuple hoặc (): value}, gọi mỗi lần scrape"""
+        self._registry._callbacks[self.name] = fn
+
+
+class Histogram:
+    def __init__(self, registry: "Registry", name: str, buckets: Tuple):
+        self._registry = registry
+        self.name = name
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        histograms = self._registry._shard().histograms
+        key = (self.name, _key(labels))
+        state = histograms.get(key)
+        if state is None:
+            state = histograms[key] = [0] * (len(self.buckets) + 2)
+        state[bisect.bisect_left(self.buckets, value)] += 1  # bucket cuối = +Inf
+        state[-2] += value
+        state[-1] += 1
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: Dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class Registry:
+    def __init__(self):
+        self._local = threading.local()
+        self._shards: List[Tuple[weakref.ref, _Shard]] = []  # (thread, shard) của thread còn sống
+        self._base = _Shard()  # shard của các thread đã kết thúc
+        self._metrics: Dict[str, Tuple[str, str, object]] = {}  # name -> (type, help, metric)
+        self._callbacks: Dict[str, Callable] = {}
+        self._lock = threading.Lock()
+
+    def _shard(self) -> _Shard:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                self._shards.append((weakref.ref(threading.current_thread()), shard))
+        return shard
+
+    def _fold_finished(self):
+        """Gộp shard của thread đã kết thúc vào _base (gọi khi đang giữ lock)"""
+        alive = []
+        for thread, shard in self._shards:
+            t = thread()
+            if t is None or not t.is_alive():
+                self._base.merge(shard)  # thread đã dừng, không còn ghi vào shard này
+            else:
+                alive.append((thread, shard))
+        self._shards = alive
+
+    def _register(self, name: str, kind: str, help_text: str, factory):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = (kind, help_text, factory())
+            return self._metrics[name][2]
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._register(name, "counter", help_text, lambda: Counter(self, name))
+
+    def gauge(self, name: str, help_text: str) -> Gauge:
+        return self._register(name, "gauge", help_text, lambda: Gauge(self, name))
+
+    def histogram(self, name: str, help_text: str, buckets: Tuple = LATENCY_BUCKETS) -> Histogram:
+        return self._register(name, "histogram", help_text, lambda: Histogram(self, name, buckets))
+
+    def _collect(self):
+        with self._lock:
+            self._fold_finished()
+            shards = [shard for _, shard in self._shards]
+            base = _Shard()
+            base.merge(self._base)
+        values, histograms = base.values, base.histograms
+        for shard in shards:
+            # dict.copy() chạy trọn dưới GIL nên không cần khoá shard
+            for key, value in shard.values.copy().items():
+                values[key] = values.get(key, 0) + value
+            for key, state in shard.histograms.copy().items():
+                total = histograms.setdefault(key, [0] * len(state))
+                for i, v in enumerate(list(state)):
+                    total[i] += v
+        return values, histograms
+
+    def render(self) -> str:
+        """Prometheus text exposition format 0.0.4"""
+        values, histograms = self._collect()
+        lines = []
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+            callbacks = dict(self._callbacks)
+        for name, (kind, help_text, metric) in metrics:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "histogram":
+                for (metric_name, labels), state in sorted(histograms.items()):
+                    if metric_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(metric.buckets + (float("inf"),), state[:-2]):
+                        cumulative += count
+                        le = _format_value(bound)
+                        lines.append(f"{name}_bucket{_format_labels(labels, (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(state[-2])}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {state[-1]}")
+                continue
+            samples = {labels: v for (metric_name, labels), v in values.items() if metric_name == name}
+            if name in callbacks:
+                try:
+                    samples.update({tuple(k): v for k, v in callbacks[name]().items()})
+                except Exception:
+                    pass
+            for labels, value in sorted(samples.items()):
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class SessionTracker:
+    """Số session (Streamlit) hoạt động trong `window` giây gần nhất"""
+
+    def __init__(self, window: float = 300):
+        self.window = window
+        self._last_seen: Dict[str, float] = {}
+
+    def touch(self, session_id: str):
+        self._last_seen[session_id] = time.time()  # một phép gán, không cần khoá
+
+    def active(self) -> int:
+        cutoff = time.time() - self.window
+        last_seen = self._last_seen.copy()
+        for session_id, seen in last_seen.items():
+            if seen < cutoff:
+                self._last_seen.pop(session_id, None)
+        return sum(seen >= cutoff for seen in last_seen.values())
+
+
+REGISTRY = Registry()
+
+# ---------- text server ----------
+HTTP_REQUESTS = REGISTRY.counter("esg_http_requests_total", "HTTP requests by route, method and status")
+HTTP_LATENCY = REGISTRY.histogram("esg_http_request_duration_seconds", "HTTP request latency by route")
+HTTP_REQUEST_BYTES = REGISTRY.histogram("esg_http_request_bytes", "HTTP request payload size by route", SIZE_BUCKETS)
+HTTP_IN_FLIGHT = REGISTRY.gauge("esg_http_in_flight_requests", "HTTP requests being handled")
+
+# ---------- app ----------
+SESSIONS = SessionTracker()
+ACTIVE_SESSIONS = REGISTRY.gauge("esg_active_sessions", "App sessions seen in the last 5 minutes")
+ACTIVE_SESSIONS.set_function(lambda: {(): SESSIONS.active()})
+QUEUE_DEPTH = REGISTRY.gauge("esg_queue_depth", "Pending work items by queue")
+JOBS = REGISTRY.counter("esg_jobs_total", "Background jobs finished by status")
+
+# ---------- inference (khi model chạy cùng process) ----------
+INFERENCE_BATCH_SIZE = REGISTRY.histogram("esg_inference_batch_size", "Chunks per forward batch", BATCH_BUCKETS)
+INFERENCE_SENTENCES = REGISTRY.counter("esg_inference_inputs_total", "Sentences sent to a model")
+INFERENCE_LATENCY = REGISTRY.histogram("esg_inference_duration_seconds", "predict_logits latency")
+MODEL_LOAD_SECONDS = REGISTRY.histogram("esg_model_load_seconds", "Model load time by kind",
+                                        (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120))
+CACHE_REQUESTS = REGISTRY.counter("esg_cache_requests_total", "Cache lookups by cache and result (hit/miss)")
@@ -0,0 +1,70 @@
+"""
+Inference Profiles
+Maps the fast/balanced/accurate switch to model artifacts and inference settings
+"""
+
+import json
+import os
+from dataclasses import dataclass
+from typing import Dict, Tuple
+
+
+@dataclass
+class InferenceProfile:
+    name: str
+    model_suffix: str = ""   # suffix appended to the base model directory
+    max_length: int = 256
+
+
+PROFILES: Dict[str, InferenceProfile] = {
+    # distilled students written by training/distill.py
+    "fast": InferenceProfile("fast", model_suffix="-fast", max_length=128),
+    # the production models
+    "balanced": InferenceProfile("balanced"),
+    # optional larger checkpoints, falls back to the production models
+    "accurate": InferenceProfile("accurate", model_suffix="-accurate"),
+}
+
+DEFAULT_PROFILE = "balanced"
+
+
+def get_profile(name: str) -> InferenceProfile:
+    """Get profile by name"""
+    if name not in PROFILES:
+        raise ValueError(f"Profile '{name}' not supported. Available: {list(PROFILES.keys())}")
+    return PROFILES[name]
+
+
+def resolve_model_path(model_path: str, profile: str = DEFAULT_PROFILE) -> Tuple[str, bool]:
+    """
+    (đường dẫn model cho profile, profile_applied): <model_path><suffix>.
+    Nếu chưa có artifact cho profile thì dùng model gốc và profile_applied = False.
+    """
+    suffix = get_profile(profile).model_suffix
+    if not suffix:
+        return model_path, True
+
+    candidate = model_path.rstrip("/\\") + suffix
+    if os.path.exists(candidate):
+        return candidate, True
+
+    print(f"⚠️ Không tìm thấy model cho profile '{profile}': {candidate} - dùng {model_path}")
+    return model_path, False
+
+
+def profile_max_length(model_path: str, profile: str, applied: bool) -> int:
+    """
+    max_length cho model đã resolve: max_length lúc distill (model_metadata.json) hoặc của profile
+    khi artifact của profile được load; model gốc (fallback) giữ max_length của DEFAULT_PROFILE.
+    """
+    if not applied:
+        return get_profile(DEFAULT_PROFILE).max_length
+    if not get_profile(profile).model_suffix:  # model gốc: không đọc max_length từ metadata
+        return get_profile(profile).max_length
+    metadata_path = os.path.join(model_path, "model_metadata.json")
+    if os.path.exists(metadata_path):
+        with open(metadata_path, "r", encoding="utf-8") as f:
+            max_length = json.load(f).get("max_length")
+        if max_length:
+            return int(max_length)
+    return get_profile(profile).max_length
@@ -0,0 +1,362 @@
+"""
+Replica Pool
+N model worker processes for large CPU servers, each pinned to its own core set
+(grouped by NUMA node) with its own intra-op thread count. Weights are loaded
+once in the parent and moved to shared memory (model.share_memory()), so the
+workers map the same pages instead of holding N copies.
+
+The parent keeps tokenization / packing (encode_inputs + EncodingCache);
+workers only pad + forward a batch of chunk ids and send logits back.
+Dispatch policy:
+    round_robin   - batch i -> worker i % N
+    least_loaded  - worker with the fewest pending tokens
+Each worker holds at most `max_inflight` batches, so a slow replica is not
+given more work than it can take.
+
+ReplicaPool is called like a model (`pool(**batch).logits`, `.config`,
+`.eval()`) and predict_logits sends all batches through `forward_chunks`.
+
+Env (used when ESGClassifier / ESGModel get replicas=None):
+    ESG_REPLICAS=4  ESG_REPLICA_THREADS=8  ESG_DISPATCH=least_loaded
+"""
+
+import glob
+import itertools
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+
+from utils.metrics import REGISTRY
+
+DISPATCH_POLICIES = ("round_robin", "least_loaded")
+DEFAULT_REPLICAS = int(os.environ.get("ESG_REPLICAS", "0"))
+DEFAULT_REPLICA_THREADS = int(os.environ.get("ESG_REPLICA_THREADS", "0"))
+DEFAULT_DISPATCH = os.environ.get("ESG_DISPATCH", "least_loaded")
+START_TIMEOUT = 300
+
+REPLICA_BATCHES = REGISTRY.counter("esg_replica_batches_total", "Forward batches run by each replica")
+REPLICA_PENDING = REGISTRY.gauge("esg_replica_pending_batches", "Batches queued or running on each replica")
+
+
+def _parse_cpulist(text: str) -> List[int]:
+    """"0-3,8-11" -> [0, 1, 2, 3, 8, 9, 10, 11]"""
+    cpus = []
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        if "-" in part:
+            first, last = part.split("-")
+            cpus.extend(range(int(first), int(last) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+def numa_nodes(physical_only: bool = True) -> List[List[int]]:
+    """
+    Core được phép dùng (sched_getaffinity) nhóm theo NUMA node.
+    physical_only: bỏ SMT sibling, mỗi core vật lý lấy một logical CPU.
+    Không đọc được sysfs -> một node chứa mọi core.
+    """
+    allowed = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    nodes = []
+    for path in sorted(glob.glob("/sys/devices/system/node/node[0-9]*/cpulist")):
+        with open(path) as f:
+            cpus = [c for c in _parse_cpulist(f.read()) if c in allowed]
+        if cpus:
+            nodes.append(cpus)
+    if not nodes:
+        nodes = [allowed]
+
+    if physical_only:
+        seen = set()
+        for node in nodes:
+            for cpu in list(node):
+                try:
+                    with open(f"/sys/devices/system/cpu/cpu{cpu}/topology/thread_siblings_list") as f:
+                        siblings = frozenset(_parse_cpulist(f.read()))
+                except OSError:
+                    continue
+                if siblings in seen:
+                    node.remove(cpu)
+                seen.add(siblings)
+    return nodes
+
+
+def plan_core_sets(replicas: int, threads: Optional[int] = None,
+                   nodes: Optional[List[List[int]]] = None) -> List[List[int]]:
+    """
+    Chia core cho từng replica: replica lần lượt được gán vào các NUMA node
+    (round-robin), trong node lấy `threads` core liên tiếp. threads=None: chia
+    đều core của node cho số replica trên node đó.
+    """
+    nodes = nodes or numa_nodes()
+    per_node = [[] for _ in nodes]
+    for i in range(replicas):
+        per_node[i % len(nodes)].append(i)
+
+    core_sets: List[Optional[List[int]]] = [None] * replicas
+    for node, members in zip(nodes, per_node):
+        if not members:
+            continue
+        width = threads or max(len(node) // len(members), 1)
+        for k, replica in enumerate(members):
+            start = (k * width) % len(node)
+            cores = node[start:start + width]
+            if len(cores) < width:  # nhiều thread hơn core: dùng chung core, vẫn trong node
+                cores = (node * (width // len(node) + 1))[start:start + width]
+            core_sets[replica] = sorted(set(cores))
+    return core_sets
+
+
+def _pad(chunks: Sequence[Sequence[int]], pad_token_id: int):
+    width = max(len(c) for c in chunks)
+    input_ids = torch.full((len(chunks), width), pad_token_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(chunks), width), dtype=torch.long)
+    for row, ids in enumerate(chunks):
+        input_ids[row, :len(ids)] = torch.as_tensor(ids, dtype=torch.long)
+        attention_mask[row, :len(ids)] = 1
+    return input_ids, attention_mask
+
+
+def _worker(index: int, model, cores: List[int], threads: int, pad_token_id: int, tasks, results):
+    """Process của một replica: pin core, set thread, rồi pad + forward từng batch"""
+    try:
+        if cores and hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, cores)
+        torch.set_num_threads(threads)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass
+        model.eval()
+    except Exception as e:
+        results.put(("error", index, None, repr(e)))
+        return
+    results.put(("ready", index, None, None))
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        task_id, chunks = task
+        try:
+            input_ids, attention_mask = _pad(chunks, pad_token_id)
+            with torch.inference_mode():
+                logits = model(input_ids=input_ids, attention_mask=attention_mask).logits
+            results.put(("done", index, task_id, logits.float().numpy()))
+        except Exception as e:
+            results.put(("failed", index, task_id, repr(e)))
+
+
+class ReplicaPool:
+    def __init__(self, model, pad_token_id: int, replicas: int, threads: Optional[int] = None,
+                 policy: str = DEFAULT_DISPATCH, max_inflight: int = 2,
+                 core_sets: Optional[List[List[int]]] = None, name: str = "model"):
+        if policy not in DISPATCH_POLICIES:
+            raise ValueError(f"Dispatch policy '{policy}' not supported. Available: {list(DISPATCH_POLICIES)}")
+        if replicas < 1:
+            raise ValueError("replicas phải >= 1")
+        self.config = model.config
+        self.name = name
+        self.policy = policy
+        self.max_inflight = max_inflight
+        self.core_sets = core_sets or plan_core_sets(replicas, threads)
+        self.threads = [threads or len(cores) for cores in self.core_sets]
+
+        self._load = [0] * replicas        # token đang chờ trên mỗi replica
+        self._inflight = [0] * replicas    # batch đang chờ trên mỗi replica
+        self._pending: Dict[int, tuple] = {}  # task_id -> (replica, tokens, future)
+        self._ids = itertools.count()
+        self._next = 0
+        self._cond = threading.Condition()
+        self._closed = False
+
+        model = model.cpu().eval()
+        model.share_memory()  # weights trong shared memory, worker không copy
+        ctx = mp.get_context("spawn")  # không fork sau khi parent đã khởi tạo OpenMP
+        self._results = ctx.Queue()
+        self._tasks = [ctx.Queue() for _ in range(replicas)]
+        self._processes = [
+            ctx.Process(target=_worker, daemon=True, name=f"esg-{name}-replica-{i}",
+                        args=(i, model, self.core_sets[i], self.threads[i], pad_token_id,
+                              self._tasks[i], self._results))
+            for i in range(replicas)
+        ]
+        for process in self._processes:
+            process.start()
+        self._wait_ready()
+        self._collector = threading.Thread(target=self._collect, daemon=True, name=f"esg-{name}-collector")
+        self._collector.start()
+        print(f"Replica pool '{name}': {replicas} replica × {self.threads} threads, cores {self.core_sets}, {policy}")
+
+    @property
+    def replicas(self) -> int:
+        return len(self._processes)
+
+    @property
+    def device(self):
+        return torch.device("cpu")
+
+    def eval(self):
+        return self
+
+    def to(self, *_args, **_kwargs):
+        return self  # worker luôn chạy CPU
+
+    def _wait_ready(self):
+        ready = 0
+        while ready < self.replicas:
+            try:
+                status, index, _, error = self._results.get(timeout=START_TIMEOUT)
+            except queue.Empty:
+                self.close()
+                raise RuntimeError(f"Replica pool '{self.name}' không khởi động kịp ({START_TIMEOUT}s)")
+            if status == "error":
+                self.close()
+                raise RuntimeError(f"Replica {index} lỗi khi khởi động: {error}")
+            ready += 1
+
+    def _pick(self) -> Optional[int]:
+        free = [i for i in range(self.replicas)
+                if self._inflight[i] < self.max_inflight and self._processes[i].is_alive()]
+        if not any(p.is_alive() for p in self._processes):
+            raise RuntimeError(f"Mọi replica của pool '{self.name}' đã dừng")
+        if not free:
+            return None
+        if self.policy == "least_loaded":
+            return min(free, key=lambda i: (self._load[i], self._inflight[i]))
+        for _ in range(self.replicas):
+            i = self._next
+            self._next = (self._next + 1) % self.replicas
+            if i in free:
+                return i
+        return None
+
+    def submit(self, chunks: Sequence[Sequence[int]]) -> Future:
+        """Gửi một batch chunk ids, Future trả về logits (numpy)"""
+        future = Future()
+        tokens = sum(len(c) for c in chunks)
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError(f"Replica pool '{self.name}' đã đóng")
+                replica = self._pick()
+                if replica is not None:
+                    break
+                self._cond.wait()
+            task_id = next(self._ids)
+            self._pending[task_id] = (replica, tokens, future)
+            self._load[replica] += tokens
+            self._inflight[replica] += 1
+        REPLICA_PENDING.inc(model=self.name, replica=replica)
+        self._tasks[replica].put((task_id, [list(c) for c in chunks]))
+        return future
+
+    def _finish(self, task_id: int):
+        with self._cond:
+            if task_id not in self._pending:  # đã báo lỗi bởi _check_alive
+                return None, None
+            replica, tokens, future = self._pending.pop(task_id)
+            self._load[replica] -= tokens
+            self._inflight[replica] -= 1
+            self._cond.notify_all()
+        REPLICA_PENDING.dec(model=self.name, replica=replica)
+        return replica, future
+
+    def _collect(self):
+        while True:
+            try:
+                status, index, task_id, payload = self._results.get(timeout=1.0)
+            except queue.Empty:
+                self._check_alive()
+                continue
+            except (EOFError, OSError):
+                return
+            if status == "stop":
+                return
+            replica, future = self._finish(task_id)
+            if future is None:
+                continue
+            if status == "done":
+                REPLICA_BATCHES.inc(model=self.name, replica=replica)
+                future.set_result(payload)
+            else:
+                future.set_exception(RuntimeError(f"Replica {replica}: {payload}"))
+
+    def _check_alive(self):
+        """Replica chết (OOM...) -> các batch đang chờ của nó báo lỗi thay vì treo"""
+        for replica, process in enumerate(self._processes):
+            if process.is_alive() or self._closed:
+                continue
+            with self._cond:
+                lost = [task_id for task_id, (r, _, _) in self._pending.items() if r == replica]
+            for task_id in lost:
+                _, future = self._finish(task_id)
+                if future is not None:
+                    future.set_exception(RuntimeError(f"Replica {replica} đã dừng (exit code {process.exitcode})"))
+
+    def forward_chunks(self, batches: List[List[List[int]]]) -> torch.Tensor:
+        """Chạy các batch song song trên các replica, logits đúng thứ tự"""
+        futures = [self.submit(batch) for batch in batches]
+        return torch.from_numpy(np.concatenate([f.result() for f in futures]))
+
+    def __call__(self, input_ids, attention_mask=None, **_):
+        """Gọi như model với một batch đã pad (predict() một câu)"""
+        if attention_mask is None:
+            attention_mask = torch.ones_like(input_ids)
+        lengths = attention_mask.sum(dim=1).tolist()
+        chunks = [ids[:n] for ids, n in zip(input_ids.cpu().tolist(), lengths)]
+        return SimpleNamespace(logits=torch.from_numpy(self.submit(chunks).result()))
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                "replicas": self.replicas,
+                "threads": list(self.threads),
+                "core_sets": [list(c) for c in self.core_sets],
+                "policy": self.policy,
+                "pending": len(self._pending),
+                "alive": [p.is_alive() for p in self._processes]
+            }
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        for tasks in self._tasks:
+            tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        self._results.put(("stop", -1, None, None))
+
+
+def maybe_pool(model, tokenizer, replicas: Optional[int] = None, threads: Optional[int] = None,
+               policy: Optional[str] = None, name: str = "model"):
+    """
+    ReplicaPool nếu replicas >= 1 (hoặc ESG_REPLICAS) và model chạy CPU,
+    không thì model gốc.
+    """
+    replicas = DEFAULT_REPLICAS if replicas is None else replicas
+    if replicas < 1:
+        return model
+    if next(model.parameters()).device.type != "cpu":
+        print("⚠️ Replica pool chỉ dùng cho CPU, giữ một model trên GPU")
+        return model
+    try:
+        return ReplicaPool(model, tokenizer.pad_token_id or 0, replicas, threads or DEFAULT_REPLICA_THREADS or None,
+                           policy or DEFAULT_DISPATCH, name=name)
+    except Exception as e:
+        print(f"⚠️ Không khởi động được replica pool ({e}), dùng một model")
+        return model
@@ -0,0 +1,264 @@
+"""
+Vietnamese Word Segmentation
+Pluggable segmenters for preprocess_vi_text. A segmenter has pyvi's interface
+(`tokenize(text) -> "từ_ghép từ"`) plus a batch API:
+
+    pyvi  - ViTokenizer (CRF), the default and the reference
+    trie  - longest-match over a compound-word dictionary (syllable trie),
+            much faster; the dictionary is learned from pyvi output
+
+Build a dictionary and compare against pyvi:
+    python -m utils.segmentation build "../Tool label/labeled_data.csv" --output ESG_classify/vi_compounds.txt
+    python -m utils.segmentation report "../Tool label/labeled_data.csv" --model ESG_classify/models/ViBert-ESG-base
+
+`report` learns the dictionary on the non-eval split (unless --dictionary is
+given) and reports, on the eval split: exact-sentence agreement, word-boundary
+precision/recall/F1 vs pyvi, throughput, and with --model the classifier
+accuracy / prediction agreement with each segmenter.
+"""
+
+import argparse
+import json
+import os
+import time
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+DEFAULT_DICTIONARY = os.path.join("ESG_classify", "vi_compounds.txt")
+DEFAULT_SEGMENTER = os.environ.get("ESG_SEGMENTER", "pyvi")
+_END = ""  # key đánh dấu hết từ trong trie (âm tiết không bao giờ rỗng)
+
+
+class Segmenter:
+    name = "base"
+
+    def tokenize(self, text: str) -> str:
+        raise NotImplementedError
+
+    def tokenize_batch(self, texts: Sequence[str]) -> List[str]:
+        return [self.tokenize(text) for text in texts]
+
+
+class PyviSegmenter(Segmenter):
+    name = "pyvi"
+
+    def __init__(self):
+        from pyvi import ViTokenizer
+        self._tokenizer = ViTokenizer
+
+    def tokenize(self, text: str) -> str:
+        return self._tokenizer.tokenize(text)
+
+
+class TrieSegmenter(Segmenter):
+    """
+    Forward longest-match trên âm tiết. words: từ ghép dạng "khí thải" hoặc
+    "khí_thải"; từ một âm tiết không cần có trong từ điển.
+    Input nên là output của simple_preprocess (chữ thường, cách nhau bởi space).
+    """
+    name = "trie"
+
+    def __init__(self, words: Iterable[str]):
+        self.root: Dict = {}
+        self.size = 0
+        for word in words:
+            syllables = word.replace("_", " ").split()
+            if len(syllables) < 2:
+                continue
+            node = self.root
+            for syllable in syllables:
+                node = node.setdefault(syllable, {})
+            if _END not in node:
+                node[_END] = True
+                self.size += 1
+
+    @classmethod
+    def from_file(cls, path: str = DEFAULT_DICTIONARY) -> "TrieSegmenter":
+        """Một từ mỗi dòng, dòng trống / bắt đầu bằng # bị bỏ qua"""
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Không tìm thấy từ điển: {path} (tạo bằng: python -m utils.segmentation build)")
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(line.strip() for line in f if line.strip() and not line.startswith("#"))
+
+    def segment(self, syllables: List[str]) -> List[str]:
+        words, i, n = [], 0, len(syllables)
+        root = self.root
+        while i < n:
+            node, end, j = root, i + 1, i
+            while j < n:
+                node = node.get(syllables[j])
+                if node is None:
+                    break
+                j += 1
+                if _END in node:
+                    end = j
+            words.append("_".join(syllables[i:end]) if end - i > 1 else syllables[i])
+            i = end
+        return words
+
+    def tokenize(self, text: str) -> str:
+        return " ".join(self.segment(text.split()))
+
+
+SEGMENTERS = {
+    "pyvi": PyviSegmenter,
+    "trie": TrieSegmenter.from_file,
+}
+
+
+def get_segmenter(name: Optional[str] = None, dictionary: Optional[str] = None) -> Segmenter:
+    """name: "pyvi" | "trie" (mặc định ESG_SEGMENTER hoặc pyvi)"""
+    name = name or DEFAULT_SEGMENTER
+    if name not in SEGMENTERS:
+        raise ValueError(f"Segmenter '{name}' not supported. Available: {list(SEGMENTERS.keys())}")
+    if name == "trie" and dictionary:
+        return TrieSegmenter.from_file(dictionary)
+    return SEGMENTERS[name]()
+
+
+@lru_cache(maxsize=None)
+def default_segmenter() -> Segmenter:
+    """Segmenter dùng chung khi không truyền vào (ESG_SEGMENTER, mặc định pyvi)"""
+    return get_segmenter()
+
+
+def build_dictionary(segmented: Iterable[str], min_count: int = 2) -> List[str]:
+    """Từ ghép (có "_") xuất hiện >= min_count lần trong output của pyvi"""
+    counts = Counter(word for text in segmented for word in text.split() if "_" in word)
+    return sorted(word for word, count in counts.items() if count >= min_count)
+
+
+# ---------- agreement report ----------
+
+def _spans(segmented: str) -> Set[Tuple[int, int]]:
+    """Tập (âm tiết bắt đầu, kết thúc) của từng từ"""
+    spans, position = set(), 0
+    for word in segmented.split():
+        length = word.count("_") + 1
+        spans.add((position, position + length))
+        position += length
+    return spans
+
+
+def agreement(reference: Sequence[str], candidate: Sequence[str]) -> Dict[str, float]:
+    """So ranh giới từ của candidate với reference (pyvi)"""
+    matched = ref_total = cand_total = exact = 0
+    for ref, cand in zip(reference, candidate):
+        ref_spans, cand_spans = _spans(ref), _spans(cand)
+        matched += len(ref_spans & cand_spans)
+        ref_total += len(ref_spans)
+        cand_total += len(cand_spans)
+        exact += ref == cand
+    precision = matched / cand_total if cand_total else 1.0
+    recall = matched / ref_total if ref_total else 1.0
+    return {
+        "sentences": len(reference),
+        "exact_sentence_agreement": exact / len(reference) if reference else 1.0,
+        "word_precision": precision,
+        "word_recall": recall,
+        "word_f1": 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    }
+
+
+def _timed(segmenter: Segmenter, texts: List[str]) -> Tuple[List[str], float]:
+    start = time.perf_counter()
+    output = segmenter.tokenize_batch(texts)
+    seconds = time.perf_counter() - start
+    return output, len(texts) / seconds if seconds > 0 else 0.0
+
+
+def _is_eval(text: str, eval_percent: int) -> bool:
+    from utils.dedup import in_eval_split, sentence_hash
+
+    return bool(in_eval_split(sentence_hash(text), eval_percent))
+
+
+def classifier_impact(model_path: str, data, processed: Dict[str, List[str]]) -> Dict[str, Dict]:
+    """Accuracy của classifier trên câu có đúng một nhãn, với input từ từng segmenter"""
+    import numpy as np
+    from ESG_classify.esg_classifier import ESGClassifier
+    from training.dataset import COLUMN_TO_CLASS, LABEL_COLUMNS
+
+    labels = data[LABEL_COLUMNS].to_numpy()
+    one_label = labels.sum(axis=1) == 1
+    gold = np.array([COLUMN_TO_CLASS[c] for c in LABEL_COLUMNS])[labels[one_label].argmax(axis=1)]
+
+    classifier = ESGClassifier(model_path)
+    if not classifier.is_ready():
+        raise RuntimeError(f"Không load được classifier: {model_path}")
+    predictions = {}
+    for name, texts in processed.items():
+        texts = [t for t, keep in zip(texts, one_label) if keep]
+        predictions[name] = classifier.predict_table(texts).class_id
+    report = {name: {"accuracy": float((pred == gold).mean()) if len(gold) else 0.0}
+              for name, pred in predictions.items()}
+    for name, pred in predictions.items():
+        if name != "pyvi":
+            report[name]["prediction_agreement_with_pyvi"] = float((pred == predictions["pyvi"]).mean())
+            report[name]["accuracy_delta"] = report[name]["accuracy"] - report["pyvi"]["accuracy"]
+    return report
+
+
+def main():
+    from gensim.utils import simple_preprocess
+    from training.dataset import load_labeled
+
+    parser = argparse.ArgumentParser(description="Vietnamese word segmenters: dictionary build + agreement report")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Learn a compound-word dictionary from pyvi output")
+    build.add_argument("csv", nargs="+")
+    build.add_argument("--output", default=DEFAULT_DICTIONARY)
+    build.add_argument("--min-count", type=int, default=2)
+    build.add_argument("--text-column", default="Sentences")
+    report = sub.add_parser("report", help="Agreement vs pyvi (+ classifier accuracy with --model)")
+    report.add_argument("csv", nargs="+")
+    report.add_argument("--dictionary", help="Existing dictionary (default: learn on the non-eval split)")
+    report.add_argument("--eval-percent", type=int, default=20)
+    report.add_argument("--min-count", type=int, default=2)
+    report.add_argument("--text-column", default="Sentences")
+    report.add_argument("--model", help="ESGClassifier model dir for the downstream accuracy check")
+    report.add_argument("--output", help="Write report JSON here")
+    args = parser.parse_args()
+
+    data = load_labeled(args.csv, args.text_column)
+    plain = [" ".join(simple_preprocess(text)) for text in data["Sentences"]]
+    pyvi = PyviSegmenter()
+
+    if args.command == "build":
+        words = build_dictionary(pyvi.tokenize_batch(plain), args.min_count)
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(f"# learned from pyvi on {len(plain)} sentences, min_count={args.min_count}\n")
+            f.write("\n".join(words) + "\n")
+        print(f"✅ {len(words)} từ ghép → {args.output}")
+        return
+
+    eval_mask = [_is_eval(text, args.eval_percent) for text in data["Sentences"]]
+    if args.dictionary:
+        trie = TrieSegmenter.from_file(args.dictionary)
+    else:
+        train = [text for text, is_eval in zip(plain, eval_mask) if not is_eval]
+        trie = TrieSegmenter(build_dictionary(pyvi.tokenize_batch(train), args.min_count))
+    data = data[eval_mask].reset_index(drop=True)
+    plain = [text for text, is_eval in zip(plain, eval_mask) if is_eval]
+
+    reference, pyvi_speed = _timed(pyvi, plain)
+    candidate, trie_speed = _timed(trie, plain)
+    result = {
+        "dictionary_words": trie.size,
+        "agreement": agreement(reference, candidate),
+        "sentences_per_sec": {"pyvi": pyvi_speed, "trie": trie_speed},
+        "speedup": trie_speed / pyvi_speed if pyvi_speed else 0.0
+    }
+    if args.model:
+        result["classifier"] = classifier_impact(args.model, data, {"pyvi": reference, "trie": candidate})
+
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
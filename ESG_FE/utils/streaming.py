@@ -0,0 +1,182 @@
+"""
+Streaming Analysis
+Phân tích PDF lớn theo cửa sổ trang: extract -> normalize -> classify -> sentiment
+cho từng cửa sổ, chỉ giữ số đếm cộng dồn trong RAM; kết quả từng câu được ghi
+ra CSV trên đĩa (tối đa max_results dòng).
+
+Kết quả giống normalize_full_text + classify_text + calculate_company_esg_score
+trên cả document: normalize từng trang độc lập, và trang có nội dung đầu / cuối
+(intro / outro) được bỏ như clean_text_remove_intro_outro_add_dots.
+"""
+
+import csv
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+import fitz
+
+from utils.boilerplate import STRIP_BOILERPLATE, page_blocks, repeated_keys, strip_pages
+from utils.components import ensure_dot, smart_normalize_text, split_sentences
+from utils.tracing import span
+from utils.triage import get_policy, triage_page
+
+TOPICS = ["Environment", "Social", "Governance", "Irrelevant"]
+CATEGORIES = ["environment", "governance", "social"]
+SENTIMENTS = ["Positive", "Neutral", "Negative"]
+
+
+def iter_pages(source: Union[str, bytes], strip_boilerplate: Optional[bool] = None, triage: Optional[str] = None,
+               skipped: Optional[List[int]] = None) -> Iterator[Tuple[int, str, int]]:
+    """
+    (page_no, normalized page text, total pages); fitz load từng trang một.
+    strip_boilerplate (mặc định như extract_pdf_text): một lượt đầu chỉ giữ key
+    của block (không giữ text) để tìm header / footer lặp, lượt sau mới lấy text.
+    triage: policy của utils/triage.py (mặc định ESG_TRIAGE), trang bị bỏ được thêm vào skipped.
+    """
+    if strip_boilerplate is None:
+        strip_boilerplate = STRIP_BOILERPLATE
+    policy = get_policy(triage)
+    doc = fitz.open(source) if isinstance(source, str) else fitz.open(stream=source, filetype="pdf")
+    try:
+        total = len(doc)
+        repeated = None
+        if strip_boilerplate:
+            with span("boilerplate_scan", items=total) as s:
+                repeated = repeated_keys([[key for _, key in page_blocks(doc.load_page(i))] for i in range(total)])
+                s.set(repeated_keys=len(repeated))
+        for i in range(total):
+            page = doc.load_page(i)
+            if repeated is None:
+                text = page.get_text().strip()
+            else:
+                text = strip_pages([page_blocks(page)], repeated)[0][0].strip()
+            if not text:
+                continue
+            if policy is not None and triage_page(page, text, policy, i + 1).skip:
+                if skipped is not None:
+                    skipped.append(i + 1)
+                continue
+            _, pages = smart_normalize_text(text)
+            yield i + 1, pages[0] if pages else "", total
+    finally:
+        doc.close()
+
+
+def iter_paragraphs(pages: Iterator[Tuple[int, str, int]]) -> Iterator[Tuple[int, str]]:
+    """
+    Bỏ đoạn đầu và cuối (khi có >= 3 đoạn) mà không cần đọc hết document:
+    giữ lại đoạn đầu và đoạn gần nhất cho tới khi biết còn đoạn sau.
+    """
+    first, pending, count = None, None, 0
+    for page_no, paragraph, _ in pages:
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        count += 1
+        if count == 1:
+            first = (page_no, paragraph)
+            continue
+        if pending is not None:
+            yield pending[0], ensure_dot(pending[1])
+        pending = (page_no, paragraph)
+    if count < 3:
+        for item in (first, pending):
+            if item is not None:
+                yield item[0], ensure_dot(item[1])
+
+
+class StreamingAnalyzer:
+    def __init__(self, classifier, calculator, model_path: str, window_pages: int = 20,
+                 results_path: Optional[str] = None, max_results: int = 100_000, triage: Optional[str] = None):
+        """
+        classifier: ESGClassifier, calculator: ESGScoreCalculator (nên tạo với cache_models=True
+        để không load lại sentiment model ở mỗi cửa sổ).
+        results_path: CSV (page, text, label) cho từng câu, None = không ghi.
+        triage: bỏ trang báo cáo tài chính / bảng số (utils/triage.py), mặc định ESG_TRIAGE.
+        """
+        self.classifier = classifier
+        self.calculator = calculator
+        self.model_path = model_path
+        self.window_pages = window_pages
+        self.results_path = results_path
+        self.max_results = max_results
+        self.triage = triage
+
+    def run(self, source: Union[str, bytes], industry: str,
+            progress: Optional[Callable[[int, int, Dict], None]] = None) -> Dict:
+        """source: đường dẫn PDF (khuyên dùng, không giữ cả file trong RAM) hoặc bytes"""
+        topic_counts = {topic: 0 for topic in TOPICS}
+        summary = {category: {s: 0 for s in SENTIMENTS} for category in CATEGORIES}
+        state = {"sentences": 0, "relevant": 0, "written": 0, "pages": 0, "total_pages": 0, "skipped_pages": []}
+
+        writer, results_file = None, None
+        if self.results_path:
+            results_file = open(self.results_path, "w", encoding="utf-8", newline="")
+            writer = csv.writer(results_file)
+            writer.writerow(["page", "text", "label"])
+
+        def flush(window):
+            if not window:
+                return
+            pages = [page_no for page_no, _ in window]
+            sentences, sentence_pages = [], []
+            for page_no, paragraph in window:
+                parts = split_sentences(paragraph)
+                sentences.extend(parts)
+                sentence_pages.extend([page_no] * len(parts))
+            if not sentences:
+                return
+            with span("stream_window", items=len(sentences), first_page=pages[0], last_page=pages[-1]):
+                counts, data = self.classifier.classify_text(sentences)
+                if data is None:
+                    raise RuntimeError(f"Classification failed for pages {pages[0]}-{pages[-1]}")
+                for topic in TOPICS:
+                    topic_counts[topic] += counts.get(topic, 0)
+                window_summary = self.calculator.classify_multiple_sentiment(data, self.model_path)
+                for category in CATEGORIES:
+                    for sentiment in SENTIMENTS:
+                        summary[category][sentiment] += window_summary.get(category, {}).get(sentiment, 0)
+
+                state["sentences"] += len(sentences)
+                state["relevant"] += int((data["label"] != "Irrelevant").sum())
+                if writer is not None and state["written"] < self.max_results:
+                    rows = list(zip(sentence_pages, data["text"], data["label"]))[:self.max_results - state["written"]]
+                    writer.writerows(rows)
+                    state["written"] += len(rows)
+
+        try:
+            window, window_start = [], None
+            for page_no, paragraph in iter_paragraphs(self._track(source, state, self.triage)):
+                if window_start is not None and page_no >= window_start + self.window_pages:
+                    flush(window)
+                    window = []
+                    if progress:
+                        progress(state["pages"], state["total_pages"], topic_counts)
+                if not window:
+                    window_start = page_no
+                window.append((page_no, paragraph))
+            flush(window)
+            if progress:
+                progress(state["total_pages"], state["total_pages"], topic_counts)
+        finally:
+            if results_file is not None:
+                results_file.close()
+
+        result = self.calculator.score_from_summary(summary, industry, state["relevant"])
+        result.update({
+            "counts": topic_counts,
+            "summary": summary,
+            "pages": state["total_pages"],
+            "sentences": state["sentences"],
+            "results_path": self.results_path,
+            "results_written": state["written"],
+            "skipped_pages": state["skipped_pages"],
+            "results_truncated": state["written"] < state["sentences"] and self.results_path is not None
+        })
+        return result
+
+    @staticmethod
+    def _track(source, state, triage=None):
+        """iter_pages + ghi lại số trang đã đọc cho progress"""
+        for page_no, text, total in iter_pages(source, triage=triage, skipped=state["skipped_pages"]):
+            state["pages"], state["total_pages"] = page_no, total
+            yield page_no, text, total
@@ -0,0 +1,177 @@
+"""
+Tokenization Utilities
+Fast (Rust `tokenizers`) tokenizer loading with a token-id parity check against
+the slow tokenizer in MODEL_MAP, and a bounded LRU cache of encoded ids so
+repeated sentences skip tokenization.
+
+load_tokenizer:
+    1. AutoTokenizer(use_fast=True): dùng tokenizer.json nếu có, không thì
+       transformers convert từ vocab của slow tokenizer.
+    2. So input_ids của fast và slow trên PARITY_SAMPLES (+ samples truyền vào).
+       Lệch -> dùng slow. Kết quả lưu ở tokenizer_parity.json trong thư mục model,
+       tokenizer.json đã convert cũng được lưu để lần sau không convert lại.
+    Model không có bản fast (PhoBERT BPE) vẫn dùng slow tokenizer, cache bù lại.
+"""
+
+import array
+import hashlib
+import json
+import os
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import List, Optional, Sequence
+
+import transformers
+from transformers import AutoTokenizer
+
+from utils.metrics import CACHE_REQUESTS
+
+PARITY_FILE = "tokenizer_parity.json"
+TOKEN_CACHE_SIZE = 50_000
+
+PARITY_SAMPLES = [
+    "Công ty đã giảm 15% lượng khí thải CO2 trong năm 2023.",
+    "công_ty đã giảm lượng khí_thải nhà_kính",
+    "Hội đồng quản trị (HĐQT) gồm 7 thành viên, trong đó có 2 thành viên độc lập!",
+    "  Nhiều   khoảng trắng\tvà\nxuống dòng  ",
+    "Tổng doanh thu đạt 1.234,56 tỷ đồng; lợi nhuận sau thuế tăng 12,5 % so với cùng kỳ.",
+    "ESG, GRI 305-1, ISO 14001:2015 và SDG #13 — “trích dẫn” ‘đơn’ …",
+    "NGƯỜI LAO ĐỘNG được đào tạo an toàn lao động 🌱 ♻️",
+    unicodedata.normalize("NFD", "Tiếng Việt dạng tổ hợp (NFD): người lao động"),
+    "",
+    "a " * 300
+]
+
+
+def _samples_hash(samples: Sequence[str]) -> str:
+    return hashlib.sha1("\x00".join(samples).encode("utf-8")).hexdigest()[:16]
+
+
+def check_parity(fast, slow, samples: Sequence[str]) -> List[int]:
+    """Vị trí các sample mà fast và slow cho input_ids khác nhau"""
+    samples = list(samples)
+    mismatches = []
+    for add_special_tokens in (False, True):
+        fast_ids = fast(samples, add_special_tokens=add_special_tokens, truncation=False)["input_ids"]
+        slow_ids = slow(samples, add_special_tokens=add_special_tokens, truncation=False)["input_ids"]
+        mismatches.extend(i for i, (a, b) in enumerate(zip(fast_ids, slow_ids)) if a != b)
+    if fast.num_special_tokens_to_add() != slow.num_special_tokens_to_add():
+        mismatches.append(-1)
+    piece = [fast.unk_token_id or 0] * 3
+    if list(fast.build_inputs_with_special_tokens(piece)) != list(slow.build_inputs_with_special_tokens(piece)):
+        mismatches.append(-1)
+    return sorted(set(mismatches))
+
+
+def _read_verdict(model_path: str, key: dict) -> Optional[bool]:
+    try:
+        with open(os.path.join(model_path, PARITY_FILE), "r", encoding="utf-8") as f:
+            verdict = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return verdict.get("ok") if all(verdict.get(k) == v for k, v in key.items()) else None
+
+
+def _write_verdict(model_path: str, verdict: dict):
+    try:
+        with open(os.path.join(model_path, PARITY_FILE), "w", encoding="utf-8") as f:
+            json.dump(verdict, f, indent=2)
+    except OSError:
+        pass  # thư mục model chỉ đọc: lần sau kiểm tra lại
+
+
+def load_tokenizer(model_path: str, TokenizerClass=AutoTokenizer, prefer_fast: bool = True,
+                   samples: Optional[Sequence[str]] = None):
+    """Fast tokenizer nếu có và khớp token-id với slow tokenizer, không thì slow"""
+    def load_slow():
+        if TokenizerClass is AutoTokenizer:
+            return AutoTokenizer.from_pretrained(model_path, use_fast=False)
+        return TokenizerClass.from_pretrained(model_path)
+
+    if not prefer_fast:
+        return load_slow()
+    try:
+        fast = AutoTokenizer.from_pretrained(model_path, use_fast=True)
+    except Exception as e:
+        print(f"⚠️ Không load được fast tokenizer ({e}), dùng slow tokenizer")
+        return load_slow()
+    if not getattr(fast, "is_fast", False):
+        return fast  # không có bản fast (vd. PhoBERT): AutoTokenizer đã trả về slow
+
+    samples = PARITY_SAMPLES + list(samples or [])
+    key = {
+        "transformers": transformers.__version__,
+        "fast_class": type(fast).__name__,
+        "samples": _samples_hash(samples)
+    }
+    verdict = _read_verdict(model_path, key)
+    if verdict is None:
+        try:
+            slow = load_slow()
+        except Exception as e:
+            print(f"⚠️ Không load được slow tokenizer để so sánh ({e}), dùng fast tokenizer")
+            return fast
+        mismatches = check_parity(fast, slow, samples)
+        verdict = not mismatches
+        _write_verdict(model_path, dict(key, ok=verdict, slow_class=type(slow).__name__, mismatches=mismatches))
+        if not verdict:
+            print(f"⚠️ Fast tokenizer lệch token-id ở sample {mismatches}, dùng {type(slow).__name__}")
+            return slow
+        tokenizer_json = os.path.join(model_path, "tokenizer.json")
+        if not os.path.exists(tokenizer_json):
+            try:
+                fast.backend_tokenizer.save(tokenizer_json)  # lần sau không phải convert lại
+            except Exception:
+                pass
+    elif not verdict:
+        return load_slow()
+    print(f"Tokenizer: {type(fast).__name__} (fast, parity OK)")
+    return fast
+
+
+class EncodingCache:
+    """
+    LRU cache text -> input_ids (không special tokens, không truncate), dùng chung
+    cho truncate / window trong encode_inputs. Key là text đúng như đưa vào
+    tokenizer (đầu vào classifier đã được preprocess_vi_text chuẩn hoá).
+    ids lưu dạng array('i') (4 byte / token).
+    """
+
+    def __init__(self, max_entries: int = TOKEN_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, array.array]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def encode(self, tokenizer, texts: Sequence[str]) -> List[List[int]]:
+        results: List[Optional[List[int]]] = [None] * len(texts)
+        misses = {}
+        with self._lock:
+            for i, text in enumerate(texts):
+                ids = self._entries.get(text)
+                if ids is None:
+                    misses.setdefault(text, []).append(i)
+                else:
+                    self._entries.move_to_end(text)
+                    results[i] = list(ids)
+        CACHE_REQUESTS.inc(len(texts) - sum(len(v) for v in misses.values()), cache="tokens", result="hit")
+        CACHE_REQUESTS.inc(sum(len(v) for v in misses.values()), cache="tokens", result="miss")
+        if misses:
+            unique = list(misses)
+            encoded = tokenizer(unique, add_special_tokens=False, truncation=False)["input_ids"]
+            with self._lock:
+                for text, ids in zip(unique, encoded):
+                    for i in misses[text]:
+                        results[i] = ids
+                    self._entries[text] = array.array("i", ids)
+                    self._entries.move_to_end(text)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return results
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,245 @@
+"""
+Tracing Utilities
+Lightweight per-stage spans (duration, item count, bytes) for the report pipeline.
+
+    with trace("analyze_report") as t:
+        with span("extract_pdf", bytes=len(pdf_bytes)) as s:
+            ...
+            s.set(items=num_pages)
+    t.waterfall()
+
+Spans opened outside a trace are no-ops, so library code can always be instrumented.
+Exporters: structured JSON lines (one span per line) and OpenTelemetry OTLP/JSON.
+For batch runs set ESG_TRACE_FILE=traces.jsonl (ESG_TRACE_FORMAT=jsonl|otel) to
+export every finished trace automatically.
+"""
+
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+_current_trace = contextvars.ContextVar("esg_trace", default=None)
+_current_span = contextvars.ContextVar("esg_span", default=None)
+
+
+@dataclass
+class Span:
+    name: str
+    span_id: str
+    parent_id: Optional[str]
+    start_ns: int
+    end_ns: Optional[int] = None
+    attrs: Dict = field(default_factory=dict)
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.perf_counter_ns()
+        return (end - self.start_ns) / 1e6
+
+    def set(self, **attrs) -> "Span":
+        """Gán thêm items / bytes / thuộc tính khi đã biết kết quả"""
+        self.attrs.update({k: v for k, v in attrs.items() if v is not None})
+        return self
+
+
+class _NoopSpan:
+    attrs = {}
+
+    def set(self, **attrs):
+        return self
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    """Tập span của một lần chạy (ví dụ một lần bấm Phân tích ESG)"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.trace_id = uuid.uuid4().hex
+        self.spans: List[Span] = []
+        # quy đổi perf_counter_ns -> epoch ns cho exporter
+        self.epoch_offset_ns = time.time_ns() - time.perf_counter_ns()
+        self._lock = threading.Lock()
+
+    def add(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def _depths(self) -> Dict[str, int]:
+        parents = {s.span_id: s.parent_id for s in self.spans}
+        depths = {}
+        for span_id in parents:
+            depth, parent = 0, parents[span_id]
+            while parent in parents:
+                depth, parent = depth + 1, parents[parent]
+            depths[span_id] = depth
+        return depths
+
+    def waterfall(self) -> List[Dict]:
+        """Các span theo thời điểm bắt đầu, offset tính từ span đầu tiên (ms)"""
+        if not self.spans:
+            return []
+        origin = min(s.start_ns for s in self.spans)
+        depths = self._depths()
+        return [
+            {
+                "name": s.name,
+                "depth": depths[s.span_id],
+                "start_ms": (s.start_ns - origin) / 1e6,
+                "duration_ms": s.duration_ms,
+                "items": s.attrs.get("items"),
+                "bytes": s.attrs.get("bytes"),
+                "error": s.attrs.get("error")
+            }
+            for s in sorted(self.spans, key=lambda s: s.start_ns)
+        ]
+
+    def summary(self) -> Dict[str, Dict]:
+        """Tổng thời gian / items / bytes theo tên stage"""
+        totals = {}
+        for s in self.spans:
+            entry = totals.setdefault(s.name, {"calls": 0, "duration_ms": 0.0, "items": 0, "bytes": 0})
+            entry["calls"] += 1
+            entry["duration_ms"] += s.duration_ms
+            entry["items"] += s.attrs.get("items") or 0
+            entry["bytes"] += s.attrs.get("bytes") or 0
+        return totals
+
+    def to_records(self) -> List[Dict]:
+        """Structured log: một dict mỗi span"""
+        return [
+            {
+                "trace_id": self.trace_id,
+                "trace": self.name,
+                "span_id": s.span_id,
+                "parent_id": s.parent_id,
+                "name": s.name,
+                "start_unix_ns": s.start_ns + self.epoch_offset_ns,
+                "duration_ms": round(s.duration_ms, 3),
+                **s.attrs
+            }
+            for s in self.spans
+        ]
+
+    def to_otel(self, service_name: str = "esg-analysis") -> Dict:
+        """OTLP/JSON (ExportTraceServiceRequest), gửi được tới OTel collector qua /v1/traces"""
+        def attribute(key, value):
+            if isinstance(value, bool):
+                return {"key": key, "value": {"boolValue": value}}
+            if isinstance(value, int):
+                return {"key": key, "value": {"intValue": str(value)}}
+            if isinstance(value, float):
+                return {"key": key, "value": {"doubleValue": value}}
+            return {"key": key, "value": {"stringValue": str(value)}}
+
+        spans = []
+        for s in self.spans:
+            spans.append({
+                "traceId": self.trace_id,
+                "spanId": s.span_id,
+                "parentSpanId": s.parent_id or "",
+                "name": s.name,
+                "kind": 1,
+                "startTimeUnixNano": str(s.start_ns + self.epoch_offset_ns),
+                "endTimeUnixNano": str((s.end_ns or s.start_ns) + self.epoch_offset_ns),
+                "attributes": [attribute(k, v) for k, v in s.attrs.items()],
+                "status": {"code": 2} if "error" in s.attrs else {}
+            })
+        return {"resourceSpans": [{
+            "resource": {"attributes": [attribute("service.name", service_name)]},
+            "scopeSpans": [{"scope": {"name": "utils.tracing"}, "spans": spans}]
+        }]}
+
+
+class JsonlExporter:
+    """Ghi mỗi trace vào file: jsonl = một span mỗi dòng, otel = một OTLP/JSON request mỗi dòng"""
+
+    def __init__(self, path: str, fmt: str = "jsonl"):
+        if fmt not in ("jsonl", "otel"):
+            raise ValueError(f"Trace format '{fmt}' not supported. Available: ['jsonl', 'otel']")
+        self.path = path
+        self.fmt = fmt
+        self._lock = threading.Lock()
+
+    def export(self, finished: Trace):
+        lines = [finished.to_otel()] if self.fmt == "otel" else finished.to_records()
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            for line in lines:
+                f.write(json.dumps(line, ensure_ascii=False, default=str) + "\n")
+
+
+def default_exporters() -> List[JsonlExporter]:
+    path = os.environ.get("ESG_TRACE_FILE")
+    return [JsonlExporter(path, os.environ.get("ESG_TRACE_FORMAT", "jsonl"))] if path else []
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Đo một stage; ngoài trace thì không ghi gì"""
+    active = _current_trace.get()
+    if active is None:
+        yield NOOP_SPAN
+        return
+    parent = _current_span.get()
+    current = Span(name, uuid.uuid4().hex[:16], parent.span_id if parent else None,
+                   time.perf_counter_ns(), attrs={k: v for k, v in attrs.items() if v is not None})
+    token = _current_span.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.attrs["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.end_ns = time.perf_counter_ns()
+        _current_span.reset(token)
+        active.add(current)
+
+
+@contextmanager
+def trace(name: str, exporters: Optional[List] = None, **attrs):
+    """Bắt đầu một trace (span gốc `name`); nếu đã trong trace thì chỉ là một span con"""
+    if _current_trace.get() is not None:
+        with span(name, **attrs):
+            yield _current_trace.get()
+        return
+
+    active = Trace(name)
+    token = _current_trace.set(active)
+    try:
+        with span(name, **attrs):
+            yield active
+    finally:
+        _current_trace.reset(token)
+        for exporter in (default_exporters() if exporters is None else exporters):
+            try:
+                exporter.export(active)
+            except Exception as e:
+                print(f"⚠️ Không export được trace: {e}")
+
+
+def traced(name: Optional[str] = None):
+    """Decorator: bọc cả hàm trong một span"""
+    def decorator(fn):
+        span_name = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _current_trace.get() is None:
+                return fn(*args, **kwargs)
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
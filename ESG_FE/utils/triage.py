@@ -0,0 +1,261 @@
+"""
+Page Triage
+Cheap per-page check between extraction and normalize_full_text that flags
+financial-statement / numeric-table pages, which otherwise get normalized,
+segmented and classified sentence by sentence only to end up Irrelevant.
+
+Signals (thresholds come from the policy):
+    digits          - tỉ lệ chữ số trên ký tự không phải khoảng trắng
+    numeric_tokens  - tỉ lệ token chỉ gồm số / dấu (1.234,5  (12)  15%)
+    tables          - diện tích bảng (page.find_tables() của PyMuPDF) / diện tích trang
+    short_lines     - tỉ lệ dòng ngắn (ô bảng, cột số)
+    finance_terms   - số cụm từ của báo cáo tài chính (bảng cân đối kế toán...)
+A page is flagged when it has at least `min_signals` signals; action "skip"
+drops it, "report" only records the decision.
+
+Policies: off | report | conservative | balanced | aggressive, or a JSON file
+with TriagePolicy fields. Default: ESG_TRIAGE (off).
+
+Report on real reports (pages skipped, ESG sentences lost per policy):
+    python -m utils.triage report_2023.pdf --labels "../Tool label/labeled_data.csv"
+    python -m utils.triage report_2023.pdf --model ESG_classify/models/ViBert-ESG-base
+"""
+
+import argparse
+import json
+import os
+import re
+import time
+from dataclasses import asdict, dataclass, field, replace
+from typing import Dict, List, Optional
+
+DEFAULT_TRIAGE = os.environ.get("ESG_TRIAGE", "off")
+SHORT_LINE_CHARS = 25
+NUMERIC_TOKEN = re.compile(r"^[\d.,%()\-–/+]*\d[\d.,%()\-–/+]*$")
+FINANCE_TERMS = (
+    "bảng cân đối kế toán", "báo cáo kết quả hoạt động kinh doanh", "báo cáo lưu chuyển tiền tệ",
+    "thuyết minh báo cáo tài chính", "lưu chuyển tiền thuần", "vốn chủ sở hữu", "tài sản ngắn hạn",
+    "tài sản dài hạn", "nợ phải trả", "lợi nhuận sau thuế", "mã số", "thuyết minh", "số cuối năm",
+    "số đầu năm", "đơn vị tính", "triệu đồng", "vnd"
+)
+# một lần quét, cụm dài trước: "thuyết minh báo cáo tài chính" không được đếm thêm là "thuyết minh"
+FINANCE_PATTERN = re.compile("|".join(re.escape(term) for term in sorted(FINANCE_TERMS, key=len, reverse=True)))
+
+
+@dataclass
+class TriagePolicy:
+    name: str
+    action: str = "skip"            # "skip" | "report"
+    max_digits: float = 0.25
+    max_numeric_tokens: float = 0.4
+    max_table_area: float = 0.4
+    max_short_lines: float = 0.7
+    min_finance_terms: int = 3
+    min_signals: int = 2
+    detect_tables: bool = True      # find_tables tốn hơn các feature còn lại
+
+
+POLICIES: Dict[str, Optional[TriagePolicy]] = {
+    "off": None,
+    "report": TriagePolicy("report", action="report"),
+    "conservative": TriagePolicy("conservative", max_digits=0.3, max_numeric_tokens=0.5, max_table_area=0.5,
+                                 max_short_lines=0.8, min_finance_terms=4, min_signals=3),
+    "balanced": TriagePolicy("balanced"),
+    "aggressive": TriagePolicy("aggressive", max_digits=0.15, max_numeric_tokens=0.3, max_table_area=0.25,
+                               max_short_lines=0.6, min_finance_terms=2, min_signals=1),
+}
+
+
+def get_policy(name: Optional[str] = None) -> Optional[TriagePolicy]:
+    """Tên policy hoặc đường dẫn JSON (các field của TriagePolicy); "off" -> None"""
+    name = name or DEFAULT_TRIAGE
+    if name in POLICIES:
+        return POLICIES[name]
+    if name.endswith(".json") and os.path.exists(name):
+        with open(name, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        return TriagePolicy(**dict({"name": os.path.basename(name)}, **config))
+    raise ValueError(f"Triage policy '{name}' not supported. Available: {list(POLICIES.keys())} or a .json file")
+
+
+@dataclass
+class PageDecision:
+    page_no: int
+    flagged: bool
+    skip: bool
+    signals: List[str] = field(default_factory=list)
+    features: Dict[str, float] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+def text_features(text: str) -> Dict[str, float]:
+    compact = re.sub(r"\s+", "", text)
+    tokens = text.split()
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    lowered = text.lower()
+    return {
+        "chars": len(compact),
+        "digits": sum(c.isdigit() for c in compact) / len(compact) if compact else 0.0,
+        "numeric_tokens": sum(bool(NUMERIC_TOKEN.match(t)) for t in tokens) / len(tokens) if tokens else 0.0,
+        "lines": len(lines),
+        "mean_line_chars": sum(len(line) for line in lines) / len(lines) if lines else 0.0,
+        "short_lines": sum(len(line) < SHORT_LINE_CHARS for line in lines) / len(lines) if lines else 0.0,
+        "finance_terms": len(FINANCE_PATTERN.findall(lowered))
+    }
+
+
+def table_features(page) -> Dict[str, float]:
+    """Số bảng và tỉ lệ diện tích bảng (PyMuPDF >= 1.23)"""
+    try:
+        tables = page.find_tables().tables
+    except Exception:  # PyMuPDF cũ / trang lỗi: bỏ qua signal này
+        return {"tables": 0, "table_area": 0.0}
+    area = abs(page.rect)
+    covered = sum(abs(page.rect & table.bbox) for table in tables)
+    return {"tables": len(tables), "table_area": min(covered / area, 1.0) if area else 0.0}
+
+
+def page_features(page, text: str, detect_tables: bool = True) -> Dict[str, float]:
+    features = text_features(text)
+    if detect_tables and page is not None:
+        features.update(table_features(page))
+    return features
+
+
+def signals(features: Dict[str, float], policy: TriagePolicy) -> List[str]:
+    found = []
+    if features["digits"] >= policy.max_digits:
+        found.append("digits")
+    if features["numeric_tokens"] >= policy.max_numeric_tokens:
+        found.append("numeric_tokens")
+    if features.get("table_area", 0.0) >= policy.max_table_area:
+        found.append("tables")
+    if features["lines"] >= 5 and features["short_lines"] >= policy.max_short_lines:
+        found.append("short_lines")
+    if features["finance_terms"] >= policy.min_finance_terms:
+        found.append("finance_terms")
+    return found
+
+
+def decide(page_no: int, features: Dict[str, float], policy: TriagePolicy) -> PageDecision:
+    found = signals(features, policy)
+    flagged = len(found) >= policy.min_signals
+    return PageDecision(page_no, flagged, flagged and policy.action == "skip", found, features)
+
+
+def triage_page(page, text: str, policy: TriagePolicy, page_no: int) -> PageDecision:
+    return decide(page_no, page_features(page, text, policy.detect_tables), policy)
+
+
+# ---------- report ----------
+
+def _page_sentences(text: str) -> List[str]:
+    from utils.components import smart_normalize_text, split_sentences
+    _, pages = smart_normalize_text(text)
+    return split_sentences(pages[0]) if pages and pages[0] else []
+
+
+def _labeled_index(csv_paths: List[str]) -> Dict[str, str]:
+    """exact_key(câu) -> nhãn (E/S/G/I, câu nhiều nhãn lấy nhãn đầu theo LABEL_COLUMNS)"""
+    from training.dataset import LABEL_COLUMNS, load_labeled
+    from utils.dedup import exact_key
+
+    data = load_labeled(csv_paths)
+    labels = data[LABEL_COLUMNS].to_numpy()
+    index = {}
+    for text, row in zip(data["Sentences"], labels):
+        if row.any():
+            index[exact_key(text)] = LABEL_COLUMNS[int(row.argmax())]
+    return index
+
+
+def report(pdf_path: str, policies: List[TriagePolicy], labeled: Optional[Dict[str, str]] = None,
+           classifier=None) -> Dict:
+    from utils.components import extract_pdf_pages
+    from utils.dedup import exact_key
+
+    with open(pdf_path, "rb") as f:
+        pdf_bytes = f.read()
+    start = time.perf_counter()
+    extract_pdf_pages(pdf_bytes, triage="off")
+    plain_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    pages, decisions = extract_pdf_pages(pdf_bytes, triage="report")  # features của mọi trang, không bỏ trang nào
+    triage_seconds = time.perf_counter() - start - plain_seconds
+    texts = dict(pages)
+    features = {d.page_no: d.features for d in decisions}
+
+    sentences = {page_no: _page_sentences(text) for page_no, text in pages}
+    predicted = {}
+    if classifier is not None:
+        flat = [(page_no, s) for page_no, page in sentences.items() for s in page]
+        _, data = classifier.classify_text([s for _, s in flat])
+        if data is not None:
+            for (page_no, _), label in zip(flat, data["label"]):
+                predicted.setdefault(page_no, []).append(label)
+
+    result = {
+        "text_pages": len(pages),
+        "sentences": sum(len(s) for s in sentences.values()),
+        "triage_ms_per_page": max(triage_seconds, 0.0) * 1000 / max(len(pages), 1),
+        "policies": {}
+    }
+    if labeled is not None:
+        matched = [labeled.get(exact_key(s)) for page in sentences.values() for s in page]
+        result["labeled_sentences"] = sum(label is not None for label in matched)
+        result["labeled_esg_sentences"] = sum(label in ("E", "S", "G") for label in matched)
+    if predicted:
+        result["predicted_esg_sentences"] = sum(label != "Irrelevant" for page in predicted.values() for label in page)
+
+    for policy in policies:
+        ignored = () if policy.detect_tables else ("tables", "table_area")
+        skipped = [page_no for page_no, f in features.items()
+                   if decide(page_no, {k: v for k, v in f.items() if k not in ignored}, replace(policy, action="skip")).skip]
+        row = {
+            "skipped_pages": skipped,
+            "pages_skipped": len(skipped),
+            "sentences_skipped": sum(len(sentences[page_no]) for page_no in skipped),
+            "chars_skipped": sum(len(texts[page_no]) for page_no in skipped)
+        }
+        row["sentence_reduction"] = row["sentences_skipped"] / max(result["sentences"], 1)
+        if labeled is not None:
+            lost = [labeled.get(exact_key(s)) for page_no in skipped for s in sentences[page_no]]
+            row["labeled_esg_lost"] = sum(label in ("E", "S", "G") for label in lost)
+            row["labeled_esg_lost_ratio"] = row["labeled_esg_lost"] / max(result["labeled_esg_sentences"], 1)
+        if predicted:
+            row["predicted_esg_lost"] = sum(label != "Irrelevant" for page_no in skipped
+                                            for label in predicted.get(page_no, []))
+            row["predicted_esg_lost_ratio"] = row["predicted_esg_lost"] / max(result["predicted_esg_sentences"], 1)
+        result["policies"][policy.name] = row
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Page triage report: pages skipped and ESG sentences lost per policy")
+    parser.add_argument("pdf", nargs="+")
+    parser.add_argument("--policy", nargs="+", default=["conservative", "balanced", "aggressive"],
+                        help="Policy names or .json files")
+    parser.add_argument("--labels", nargs="*", help="Labeled CSVs (Sentences,E,S,G,I) matched by exact sentence")
+    parser.add_argument("--model", help="ESGClassifier model dir: count predicted ESG sentences on skipped pages")
+    parser.add_argument("--output", help="Write report JSON here")
+    args = parser.parse_args()
+
+    policies = [get_policy(name) for name in args.policy]
+    policies = [p for p in policies if p is not None]
+    labeled = _labeled_index(args.labels) if args.labels else None
+    classifier = None
+    if args.model:
+        from ESG_classify.esg_classifier import ESGClassifier
+        classifier = ESGClassifier(args.model, long_text="window")
+
+    result = {path: report(path, policies, labeled, classifier) for path in args.pdf}
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,16 +4,91 @@ import json
 from flask import Flask, render_template, request, jsonify, session, send_file
 from werkzeug.utils import secure_filename
 import io
+import glob
+import time
 import uuid
+import threading
+from storage import SessionStore, QuotaExceeded
 
 app = Flask(__name__)
 app.secret_key = os.urandom(24)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload size
 app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
+MAX_PAGE_SIZE = 500  # max rows per /get_sentences page or /update_sentences batch
+
+# Upload lifecycle (override with environment variables)
+SESSION_TTL = float(os.environ.get('LABEL_SESSION_TTL_HOURS', 72)) * 3600  # idle sessions are evicted after this
+EVICTION_INTERVAL = int(os.environ.get('LABEL_EVICTION_INTERVAL', 600))     # seconds between eviction passes
+MAX_SESSIONS_PER_USER = int(os.environ.get('LABEL_MAX_SESSIONS_PER_USER', 5))
+MAX_ROWS_PER_USER = int(os.environ.get('LABEL_MAX_ROWS_PER_USER', 500000))
+UPLOAD_CHUNK_ROWS = 5000  # rows parsed and inserted at a time
+LABEL_COLS = ['E', 'S', 'G', 'I']
 
 # Create uploads directory if it doesn't exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+# Session rows and label counts live in SQLite, the CSV is only built on export
+store = SessionStore(os.path.join(app.config['UPLOAD_FOLDER'], 'labels.db'))
+
+
+def evict_stale():
+    """Drop sessions idle for longer than SESSION_TTL and leftover per-upload CSV files"""
+    evicted = store.evict_expired(SESSION_TTL)
+    removed = 0
+    cutoff = time.time() - SESSION_TTL
+    for path in glob.glob(os.path.join(app.config['UPLOAD_FOLDER'], '*.csv')):
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            pass
+    if evicted or removed:
+        app.logger.info('Evicted %d sessions, removed %d upload files', len(evicted), removed)
+
+
+def eviction_worker():
+    while True:
+        try:
+            evict_stale()
+        except Exception as e:
+            app.logger.warning('Eviction failed: %s', e)
+        time.sleep(EVICTION_INTERVAL)
+
+
+threading.Thread(target=eviction_worker, name='session-eviction', daemon=True).start()
+
+
+def current_user():
+    """Anonymous per-browser id used for upload quotas"""
+    if 'user_id' not in session:
+        session['user_id'] = str(uuid.uuid4())
+    return session['user_id']
+
+
+def normalize_chunks(reader):
+    """Validate and clean each parsed chunk so the upload is never held in memory as a whole"""
+    for df in reader:
+        # Validate required columns
+        if 'Sentences' not in df.columns:
+            raise ValueError('CSV must contain a "Sentences" column')
+        
+        # Ensure label columns exist and are numeric (0 or 1), handle None/NaN
+        for col in LABEL_COLS:
+            if col not in df.columns:
+                df[col] = 0  # Initialize with 0 if column is missing
+            else:
+                # Convert to numeric, coercing errors to NaN, then only 1 counts as set
+                df[col] = (pd.to_numeric(df[col], errors='coerce') == 1).astype(int)
+        yield df
+
+
+@app.before_request
+def touch_session():
+    # Keep the active session alive, last_access is written at most once a minute
+    if 'csv_session_id' in session:
+        store.touch(session['csv_session_id'])
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -30,45 +105,38 @@ def upload_file():
     
     if file and file.filename.endswith('.csv'):
         try:
-            # Read the CSV file
-            df = pd.read_csv(file)
-            
-            # Validate required columns
-            if 'Sentences' not in df.columns:
-                return jsonify({'error': 'CSV must contain a "Sentences" column'}), 400
-            
-            # Ensure label columns exist and are numeric (0 or 1), handle None/NaN
-            label_cols = ['E', 'S', 'G', 'I']
-            for col in label_cols:
-                if col not in df.columns:
-                    df[col] = 0  # Initialize with 0 if column is missing
-                else:
-                    # Convert to numeric, coercing errors to NaN, then fill NaN with 0
-                    df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(int)
-                    # Ensure values are only 0 or 1
-                    df[col] = df[col].apply(lambda x: 1 if x == 1 else 0)
+            user_id = current_user()
+            _, used_rows = store.usage(user_id)
+            # Rows of the least recently used sessions that make room for this upload count toward it,
+            # but nothing is deleted until the upload has been stored
+            used_rows -= store.evictable_rows(user_id, MAX_SESSIONS_PER_USER - 1)
             
             # Generate a unique session ID for this file
             session_id = str(uuid.uuid4())
             
-            # Save the processed dataframe to a temporary file
-            temp_file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{session_id}.csv")
-            df.to_csv(temp_file_path, index=False)
+            # Parse the CSV in chunks straight from the upload stream into the session store
+            reader = pd.read_csv(file.stream, chunksize=UPLOAD_CHUNK_ROWS)
+            total, counts = store.create_session(session_id, normalize_chunks(reader), owner=user_id,
+                                                 max_rows=MAX_ROWS_PER_USER - used_rows)
             
             # Store the session ID in the user's session
             session['csv_session_id'] = session_id
             
-            # Calculate initial counts
-            counts = {col: int(df[col].sum()) for col in label_cols}
+            # Keep the per-user session quota, least recently used sessions go first
+            store.evict_owner(user_id, MAX_SESSIONS_PER_USER)
             
             # Return success with data summary
             return jsonify({
                 'success': True,
                 'message': 'File uploaded successfully',
-                'rows': len(df),
+                'rows': total,
                 'counts': counts
             })
             
+        except QuotaExceeded as e:
+            return jsonify({'error': str(e)}), 413
+        except ValueError as e:
+            return jsonify({'error': f'Error processing CSV: {str(e)}'}), 400
         except Exception as e:
             return jsonify({'error': f'Error processing CSV: {str(e)}'}), 500
     
@@ -78,27 +146,25 @@ def upload_file():
 def get_sentence():
     index = request.args.get('index', 0, type=int)
     
-    if 'csv_session_id' not in session:
+    if 'csv_session_id' not in session or not store.exists(session['csv_session_id']):
         return jsonify({'error': 'No CSV file loaded'}), 400
     
     try:
-        # Load the CSV file
+        # Read a single row by index
         session_id = session['csv_session_id']
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{session_id}.csv")
-        df = pd.read_csv(file_path)
+        total, _ = store.stats(session_id)
         
-        if index < 0 or index >= len(df):
+        if index < 0 or index >= total:
             return jsonify({'error': 'Index out of range'}), 400
         
         # Get the sentence and labels
-        sentence = df.loc[index, 'Sentences']
-        labels = {col: int(df.loc[index, col]) for col in ['E', 'S', 'G', 'I']}
+        sentence, labels = store.get_row(session_id, index)
         
         return jsonify({
             'success': True,
             'sentence': sentence,
             'labels': labels,
-            'total': len(df),
+            'total': total,
             'current': index + 1
         })
         
@@ -107,7 +173,7 @@ def get_sentence():
 
 @app.route('/update_sentence', methods=['POST'])
 def update_sentence():
-    if 'csv_session_id' not in session:
+    if 'csv_session_id' not in session or not store.exists(session['csv_session_id']):
         return jsonify({'error': 'No CSV file loaded'}), 400
     
     try:
@@ -116,48 +182,143 @@ def update_sentence():
         sentence = data.get('sentence', '')
         labels = data.get('labels', {})
         
-        # Load the CSV file
+        # Update the sentence and labels (counts are adjusted incrementally)
         session_id = session['csv_session_id']
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{session_id}.csv")
-        df = pd.read_csv(file_path)
+        counts = store.update_row(session_id, index, sentence, labels)
         
-        if index < 0 or index >= len(df):
+        if counts is None:
             return jsonify({'error': 'Index out of range'}), 400
         
-        # Update the sentence and labels
-        df.loc[index, 'Sentences'] = sentence
-        for col, value in labels.items():
-            if col in df.columns:
-                df.loc[index, col] = 1 if value else 0
+        return jsonify({
+            'success': True,
+            'message': 'Sentence updated successfully',
+            'counts': counts
+        })
         
-        # Save the updated dataframe
-        df.to_csv(file_path, index=False)
+    except Exception as e:
+        return jsonify({'error': f'Error updating sentence: {str(e)}'}), 500
+
+@app.route('/get_sentences', methods=['GET'])
+def get_sentences():
+    start = request.args.get('start', 0, type=int)
+    limit = min(request.args.get('limit', 50, type=int), MAX_PAGE_SIZE)
+    
+    if 'csv_session_id' not in session or not store.exists(session['csv_session_id']):
+        return jsonify({'error': 'No CSV file loaded'}), 400
+    
+    try:
+        # Read a page of rows
+        session_id = session['csv_session_id']
+        total, counts = store.stats(session_id)
         
-        # Calculate updated counts
-        counts = {col: int(df[col].sum()) for col in ['E', 'S', 'G', 'I']}
+        if start < 0 or start >= total or limit <= 0:
+            return jsonify({'error': 'Index out of range'}), 400
         
         return jsonify({
             'success': True,
-            'message': 'Sentence updated successfully',
+            'items': store.get_range(session_id, start, limit),
+            'start': start,
+            'total': total,
             'counts': counts
         })
         
     except Exception as e:
-        return jsonify({'error': f'Error updating sentence: {str(e)}'}), 500
+        return jsonify({'error': f'Error retrieving sentences: {str(e)}'}), 500
+
+@app.route('/update_sentences', methods=['POST'])
+def update_sentences():
+    if 'csv_session_id' not in session or not store.exists(session['csv_session_id']):
+        return jsonify({'error': 'No CSV file loaded'}), 400
+    
+    try:
+        data = request.get_json(force=True, silent=True) or {}
+        changes = data.get('changes', [])
+        
+        if not isinstance(changes, list) or len(changes) > MAX_PAGE_SIZE:
+            return jsonify({'error': f'changes must be a list of at most {MAX_PAGE_SIZE} items'}), 400
+        
+        # All changes are applied in one transaction, or none if a row version is stale
+        session_id = session['csv_session_id']
+        versions, counts, conflicts = store.bulk_update(session_id, changes)
+        
+        if conflicts:
+            return jsonify({
+                'error': 'Some sentences were changed by someone else',
+                'conflicts': conflicts,
+                'counts': counts
+            }), 409
+        
+        return jsonify({
+            'success': True,
+            'message': f'{len(versions)} sentences updated successfully',
+            'versions': versions,
+            'counts': counts
+        })
+        
+    except (IndexError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'Error updating sentences: {str(e)}'}), 500
+
+@app.route('/get_queue', methods=['GET'])
+def get_queue():
+    order = request.args.get('order', 'margin')
+    start = request.args.get('start', 0, type=int)
+    limit = min(request.args.get('limit', 50, type=int), MAX_PAGE_SIZE)
+    
+    if 'csv_session_id' not in session or not store.exists(session['csv_session_id']):
+        return jsonify({'error': 'No CSV file loaded'}), 400
+    
+    try:
+        # Untouched rows with model suggestions, most uncertain first (see prelabel.py)
+        session_id = session['csv_session_id']
+        
+        return jsonify({
+            'success': True,
+            'items': store.get_queue(session_id, order, max(start, 0), limit),
+            'suggestions': store.suggestion_count(session_id)
+        })
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'Error retrieving queue: {str(e)}'}), 500
+
+@app.route('/accept_suggestions', methods=['POST'])
+def accept_suggestions():
+    if 'csv_session_id' not in session or not store.exists(session['csv_session_id']):
+        return jsonify({'error': 'No CSV file loaded'}), 400
+    
+    try:
+        data = request.get_json(force=True, silent=True) or {}
+        min_confidence = float(data.get('min_confidence', 0.9))
+        
+        # Apply confident suggestions to rows no annotator has touched yet
+        session_id = session['csv_session_id']
+        accepted, counts = store.accept_suggestions(session_id, min_confidence)
+        
+        return jsonify({
+            'success': True,
+            'message': f'{accepted} suggestions accepted',
+            'accepted': accepted,
+            'counts': counts
+        })
+        
+    except Exception as e:
+        return jsonify({'error': f'Error accepting suggestions: {str(e)}'}), 500
 
 @app.route('/export', methods=['GET'])
 def export_csv():
-    if 'csv_session_id' not in session:
+    if 'csv_session_id' not in session or not store.exists(session['csv_session_id']):
         return jsonify({'error': 'No CSV file loaded'}), 400
     
     try:
-        # Load the CSV file
+        # Materialize the CSV from the session store
         session_id = session['csv_session_id']
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{session_id}.csv")
         
         # Return the file for download
         return send_file(
-            file_path,
+            store.export_csv(session_id),
             mimetype='text/csv',
             as_attachment=True,
             download_name='labeled_data.csv'
@@ -168,22 +329,19 @@ def export_csv():
 
 @app.route('/get_stats', methods=['GET'])
 def get_stats():
-    if 'csv_session_id' not in session:
+    if 'csv_session_id' not in session or not store.exists(session['csv_session_id']):
         return jsonify({'error': 'No CSV file loaded'}), 400
     
     try:
-        # Load the CSV file
+        # Counts are maintained by the session store
         session_id = session['csv_session_id']
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{session_id}.csv")
-        df = pd.read_csv(file_path)
-        
-        # Calculate counts
-        counts = {col: int(df[col].sum()) for col in ['E', 'S', 'G', 'I']}
+        total, counts = store.stats(session_id)
         
         return jsonify({
             'success': True,
-            'total': len(df),
-            'counts': counts
+            'total': total,
+            'counts': counts,
+            'suggestions': store.suggestion_count(session_id)
         })
         
     except Exception as e:
@@ -0,0 +1,82 @@
+"""
+Offline pre-labeling job.
+Runs the ESG_FE topic classifier over uploaded sessions and stores the
+suggested E/S/G/I label with confidence, margin and entropy, which the
+labeling tool uses to order its work queue by uncertainty.
+
+Usage:
+    python prelabel.py --all --model ../ESG_FE/ESG_classify/models/ViBert-ESG-base
+    python prelabel.py --session <session id> --model ...
+"""
+import os
+import sys
+import argparse
+import numpy as np
+
+from storage import SessionStore
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ESG_FE_DIR = os.path.join(os.path.dirname(BASE_DIR), 'ESG_FE')
+
+# ESGClassifier class_id -> labeling tool column
+CLASS_TO_COLUMN = {0: 'I', 1: 'E', 2: 'S', 3: 'G'}
+
+
+def load_classifier(model_path, profile):
+    # ESG_FE modules import each other from the ESG_FE root
+    sys.path.insert(0, ESG_FE_DIR)
+    from ESG_classify.esg_classifier import ESGClassifier
+    classifier = ESGClassifier(model_path, profile=profile)
+    if not classifier.is_ready():
+        raise RuntimeError(f'Could not load classifier from {model_path}')
+    return classifier
+
+
+def uncertainty(probs):
+    """(margin, entropy) per row of a probability matrix"""
+    top2 = np.sort(probs, axis=1)[:, -2:]
+    margin = top2[:, 1] - top2[:, 0]
+    entropy = -(probs * np.log(np.clip(probs, 1e-12, 1.0))).sum(axis=1)
+    return margin, entropy
+
+
+def prelabel_session(store, classifier, session_id, chunk_size=512, batch_size=32, model_name=None):
+    total, _ = store.stats(session_id)
+    for start in range(0, total, chunk_size):
+        items = store.get_range(session_id, start, chunk_size)
+        processed = [classifier.preproces_text(item['sentence']) for item in items]
+        table = classifier.predict_table(processed, batch_size=batch_size)
+        margin, entropy = uncertainty(table.probs)
+        store.save_suggestions(session_id, (
+            (item['index'], CLASS_TO_COLUMN[int(table.class_id[i])], table.confidence[i],
+             margin[i], entropy[i], table.probs[i])
+            for i, item in enumerate(items)
+        ), model=model_name)
+        print(f'{session_id}: {min(start + chunk_size, total)}/{total}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pre-label labeling tool sessions with ESGClassifier')
+    parser.add_argument('--model', required=True, help='ESGClassifier model directory')
+    parser.add_argument('--profile', default='balanced', help='fast | balanced | accurate')
+    parser.add_argument('--db', default=os.path.join(BASE_DIR, 'uploads', 'labels.db'))
+    parser.add_argument('--session', action='append', default=[], help='Session id (repeatable)')
+    parser.add_argument('--all', action='store_true', help='All sessions that have no suggestions yet')
+    parser.add_argument('--batch-size', type=int, default=32)
+    args = parser.parse_args()
+
+    store = SessionStore(args.db)
+    sessions = list(args.session)
+    if args.all:
+        sessions += [s for s in store.sessions_without_suggestions() if s not in sessions]
+    if not sessions:
+        parser.error('No sessions to process (use --session or --all)')
+
+    classifier = load_classifier(os.path.abspath(args.model), args.profile)
+    for session_id in sessions:
+        prelabel_session(store, classifier, session_id, batch_size=args.batch_size,
+                         model_name=os.path.basename(os.path.normpath(args.model)))
+
+
+if __name__ == '__main__':
+    main()
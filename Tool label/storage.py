@@ -0,0 +1,457 @@
+import io
+import json
+import sqlite3
+import threading
+import time
+import zlib
+import pandas as pd
+
+LABEL_COLS = ['E', 'S', 'G', 'I']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    columns TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    count_E INTEGER NOT NULL DEFAULT 0,
+    count_S INTEGER NOT NULL DEFAULT 0,
+    count_G INTEGER NOT NULL DEFAULT 0,
+    count_I INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL DEFAULT (strftime('%s', 'now')),
+    owner TEXT,
+    last_access REAL
+);
+CREATE TABLE IF NOT EXISTS rows (
+    session_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    sentence TEXT,
+    E INTEGER NOT NULL DEFAULT 0,
+    S INTEGER NOT NULL DEFAULT 0,
+    G INTEGER NOT NULL DEFAULT 0,
+    I INTEGER NOT NULL DEFAULT 0,
+    extra TEXT,
+    version INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (session_id, idx)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS suggestions (
+    session_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    label TEXT NOT NULL,
+    confidence REAL NOT NULL,
+    margin REAL NOT NULL,
+    entropy REAL NOT NULL,
+    probs TEXT,
+    model TEXT,
+    PRIMARY KEY (session_id, idx)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS suggestions_margin ON suggestions (session_id, margin);
+CREATE INDEX IF NOT EXISTS suggestions_entropy ON suggestions (session_id, entropy);
+"""
+
+# columns added after the first release of the store, created on open if missing
+MIGRATIONS = {
+    'rows': [('version', 'INTEGER NOT NULL DEFAULT 0')],
+    'sessions': [('owner', 'TEXT'), ('last_access', 'REAL')]
+}
+
+COMPRESS_MIN_BYTES = 64  # shorter texts are stored as plain TEXT
+TOUCH_INTERVAL = 60      # seconds between last_access writes for a session
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+def pack_text(value):
+    """zlib-compress long strings for storage, keep short ones as TEXT"""
+    if not isinstance(value, str):
+        return value
+    data = value.encode('utf-8')
+    if len(data) < COMPRESS_MIN_BYTES:
+        return value
+    packed = zlib.compress(data, 6)
+    return packed if len(packed) < len(data) else value
+
+
+def unpack_text(value):
+    if isinstance(value, bytes):
+        return zlib.decompress(value).decode('utf-8')
+    return value
+
+QUEUE_ORDERS = {
+    'margin': 'sg.margin ASC',      # smallest top-1/top-2 gap first
+    'entropy': 'sg.entropy DESC',   # most spread-out distribution first
+    'confidence': 'sg.confidence ASC'
+}
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _check_change(change):
+    """Shape of one bulk_update change, raises ValueError"""
+    if not isinstance(change, dict):
+        raise ValueError(f'Each change must be an object, got {type(change).__name__}')
+    if not _is_int(change.get('index')):
+        raise ValueError(f"Change index must be an integer: {change.get('index')!r}")
+    if change.get('version') is not None and not _is_int(change['version']):
+        raise ValueError(f"Change version must be an integer: {change['version']!r}")
+    if not isinstance(change.get('labels', {}), dict):
+        raise ValueError('Change labels must be an object')
+    if change.get('sentence') is not None and not isinstance(change['sentence'], str):
+        raise ValueError('Change sentence must be a string')
+
+
+class SessionStore:
+    """
+    SQLite-backed storage for labeling sessions.
+    Each row is read/written by primary key (session_id, idx) and the E/S/G/I
+    counts are maintained incrementally, so a click never rewrites the whole file.
+    The CSV is only materialized on export.
+    Sentences and extra columns are zlib-compressed at rest; sessions carry an
+    owner and a last_access time used for quotas and TTL eviction.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._touched = {}
+        conn = self._connect()
+        with conn:
+            conn.executescript(SCHEMA)
+            for table, added in MIGRATIONS.items():
+                columns = [r['name'] for r in conn.execute(f'PRAGMA table_info({table})')]
+                for name, decl in added:
+                    if name not in columns:
+                        conn.execute(f'ALTER TABLE {table} ADD COLUMN {name} {decl}')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            # only takes effect on a new database, lets eviction give pages back to the OS
+            conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def create_session(self, session_id, chunks, owner=None, max_rows=None):
+        """
+        Bulk insert a validated dataframe, or an iterable of dataframe chunks
+        (each must contain Sentences + E/S/G/I), inside one transaction.
+        Raises QuotaExceeded (nothing is written) if the rows go over max_rows.
+        """
+        if isinstance(chunks, pd.DataFrame):
+            chunks = [chunks]
+
+        conn = self._connect()
+        columns = None
+        total = 0
+        counts = {col: 0 for col in LABEL_COLS}
+        with conn:
+            for df in chunks:
+                if columns is None:
+                    columns = list(df.columns)
+                    extra_cols = [c for c in columns if c != 'Sentences' and c not in LABEL_COLS]
+                    pos = {c: columns.index(c) for c in columns}
+                    conn.execute(
+                        'INSERT INTO sessions (session_id, columns, total, owner, last_access) '
+                        'VALUES (?, ?, 0, ?, ?)',
+                        (session_id, json.dumps(columns, ensure_ascii=False), owner, time.time())
+                    )
+                if max_rows is not None and total + len(df) > max_rows:
+                    raise QuotaExceeded(f'Upload exceeds the limit of {max_rows} rows')
+
+                def iter_rows(df=df, offset=total):
+                    for idx, row in enumerate(df.itertuples(index=False, name=None), offset):
+                        extra = {c: row[pos[c]] for c in extra_cols}
+                        yield (session_id, idx, pack_text(row[pos['Sentences']]),
+                               *(int(row[pos[col]]) for col in LABEL_COLS),
+                               pack_text(json.dumps(extra, ensure_ascii=False, default=str)) if extra else None)
+
+                conn.executemany(
+                    'INSERT INTO rows (session_id, idx, sentence, E, S, G, I, extra) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', iter_rows()
+                )
+                total += len(df)
+                for col in LABEL_COLS:
+                    counts[col] += int(df[col].sum())
+
+            if columns is None:
+                raise ValueError('CSV is empty')
+            conn.execute(
+                'UPDATE sessions SET total = ?, count_E = ?, count_S = ?, count_G = ?, count_I = ? '
+                'WHERE session_id = ?',
+                (total, counts['E'], counts['S'], counts['G'], counts['I'], session_id)
+            )
+        return total, counts
+
+    def _session(self, session_id):
+        row = self._connect().execute(
+            'SELECT * FROM sessions WHERE session_id = ?', (session_id,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(f'Unknown session {session_id}')
+        return row
+
+    def exists(self, session_id):
+        return self._connect().execute(
+            'SELECT 1 FROM sessions WHERE session_id = ?', (session_id,)
+        ).fetchone() is not None
+
+    def stats(self, session_id):
+        session_row = self._session(session_id)
+        return session_row['total'], {col: session_row[f'count_{col}'] for col in LABEL_COLS}
+
+    def get_row(self, session_id, index):
+        row = self._connect().execute(
+            'SELECT sentence, E, S, G, I FROM rows WHERE session_id = ? AND idx = ?',
+            (session_id, index)
+        ).fetchone()
+        if row is None:
+            return None
+        return unpack_text(row['sentence']), {col: int(row[col]) for col in LABEL_COLS}
+
+    def get_range(self, session_id, start, limit):
+        """Page of rows [start, start + limit) with their versions"""
+        cursor = self._connect().execute(
+            'SELECT r.idx, r.sentence, r.E, r.S, r.G, r.I, r.version, sg.label, sg.confidence '
+            'FROM rows r LEFT JOIN suggestions sg ON sg.session_id = r.session_id AND sg.idx = r.idx '
+            'WHERE r.session_id = ? AND r.idx >= ? AND r.idx < ? ORDER BY r.idx',
+            (session_id, start, start + limit)
+        )
+        return [self._row_dict(row) for row in cursor]
+
+    @staticmethod
+    def _row_dict(row):
+        item = {
+            'index': row['idx'],
+            'sentence': unpack_text(row['sentence']),
+            'labels': {col: int(row[col]) for col in LABEL_COLS},
+            'version': row['version']
+        }
+        if row['label'] is not None:
+            item['suggestion'] = {'label': row['label'], 'confidence': row['confidence']}
+        return item
+
+    def _apply(self, conn, session_id, index, sentence, labels):
+        """Write one row inside an open transaction, return (delta, new_version) or None"""
+        old = conn.execute(
+            'SELECT sentence, E, S, G, I, version FROM rows WHERE session_id = ? AND idx = ?',
+            (session_id, index)
+        ).fetchone()
+        if old is None:
+            return None
+        new = {col: (1 if labels.get(col) else 0) if col in labels else int(old[col])
+               for col in LABEL_COLS}
+        conn.execute(
+            'UPDATE rows SET sentence = ?, E = ?, S = ?, G = ?, I = ?, version = version + 1 '
+            'WHERE session_id = ? AND idx = ?',
+            (old['sentence'] if sentence is None else pack_text(sentence),
+             new['E'], new['S'], new['G'], new['I'], session_id, index)
+        )
+        return [new[col] - int(old[col]) for col in LABEL_COLS], old['version'] + 1
+
+    def _add_counts(self, conn, session_id, delta):
+        conn.execute(
+            'UPDATE sessions SET count_E = count_E + ?, count_S = count_S + ?, '
+            'count_G = count_G + ?, count_I = count_I + ? WHERE session_id = ?',
+            tuple(delta) + (session_id,)
+        )
+
+    def update_row(self, session_id, index, sentence, labels):
+        """Update one row and apply the label delta to the session counts"""
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')  # the old-row read in _apply must be in the write transaction
+            applied = self._apply(conn, session_id, index, sentence, labels)
+            if applied is None:
+                return None
+            self._add_counts(conn, session_id, applied[0])
+        return self.stats(session_id)[1]
+
+    def bulk_update(self, session_id, changes):
+        """
+        Apply many changes in one transaction.
+        Each change: {'index', 'labels', optional 'sentence', optional 'version'}.
+        If any change carries a version that no longer matches the stored row,
+        nothing is written and the conflicting rows are returned with their current state.
+        Returns (versions, counts, conflicts).
+        Raises ValueError for a malformed change (nothing is written).
+        """
+        for change in changes:
+            _check_change(change)
+        conn = self._connect()
+        total = self.stats(session_id)[0]
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conflicts = []
+            for change in changes:
+                index = change.get('index')
+                if not isinstance(index, int) or index < 0 or index >= total:
+                    raise IndexError(f'Index out of range: {index}')
+                if change.get('version') is None:
+                    continue
+                current = conn.execute(
+                    'SELECT version FROM rows WHERE session_id = ? AND idx = ?', (session_id, index)
+                ).fetchone()
+                if current['version'] != change['version']:
+                    conflicts.append(index)
+
+            if conflicts:
+                conn.rollback()
+                current_rows = [self.get_range(session_id, i, 1)[0] for i in conflicts]
+                return {}, self.stats(session_id)[1], current_rows
+
+            delta = [0, 0, 0, 0]
+            versions = {}
+            for change in changes:
+                row_delta, version = self._apply(conn, session_id, change['index'],
+                                                 change.get('sentence'), change.get('labels', {}))
+                delta = [d + r for d, r in zip(delta, row_delta)]
+                versions[change['index']] = version
+            self._add_counts(conn, session_id, delta)
+        return versions, self.stats(session_id)[1], []
+
+    def save_suggestions(self, session_id, suggestions, model=None):
+        """suggestions: iterable of (idx, label, confidence, margin, entropy, probs)"""
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO suggestions '
+                '(session_id, idx, label, confidence, margin, entropy, probs, model) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                ((session_id, int(idx), label, float(conf), float(margin), float(entropy),
+                  json.dumps([round(float(p), 4) for p in probs]), model)
+                 for idx, label, conf, margin, entropy, probs in suggestions)
+            )
+
+    def sessions_without_suggestions(self):
+        return [row['session_id'] for row in self._connect().execute(
+            'SELECT s.session_id FROM sessions s WHERE NOT EXISTS '
+            '(SELECT 1 FROM suggestions sg WHERE sg.session_id = s.session_id)'
+        )]
+
+    def suggestion_count(self, session_id):
+        return self._connect().execute(
+            'SELECT COUNT(*) FROM suggestions WHERE session_id = ?', (session_id,)
+        ).fetchone()[0]
+
+    def get_queue(self, session_id, order='margin', start=0, limit=50):
+        """Rows not yet touched by an annotator (version 0), most uncertain suggestion first"""
+        if order not in QUEUE_ORDERS:
+            raise ValueError(f'Unknown queue order {order}. Available: {list(QUEUE_ORDERS)}')
+        cursor = self._connect().execute(
+            'SELECT r.idx, r.sentence, r.E, r.S, r.G, r.I, r.version, sg.label, sg.confidence '
+            'FROM suggestions sg JOIN rows r ON r.session_id = sg.session_id AND r.idx = sg.idx '
+            f'WHERE sg.session_id = ? AND r.version = 0 ORDER BY {QUEUE_ORDERS[order]}, r.idx '
+            'LIMIT ? OFFSET ?',
+            (session_id, limit, start)
+        )
+        return [self._row_dict(row) for row in cursor]
+
+    def accept_suggestions(self, session_id, min_confidence):
+        """Set labels from suggestions with confidence >= min_confidence on untouched rows"""
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute(
+                'SELECT sg.idx, sg.label FROM suggestions sg '
+                'JOIN rows r ON r.session_id = sg.session_id AND r.idx = sg.idx '
+                'WHERE sg.session_id = ? AND r.version = 0 AND sg.confidence >= ?',
+                (session_id, min_confidence)
+            ).fetchall()
+            delta = [0, 0, 0, 0]
+            for row in rows:
+                labels = {col: 1 if col == row['label'] else 0 for col in LABEL_COLS}
+                row_delta, _ = self._apply(conn, session_id, row['idx'], None, labels)
+                delta = [d + r for d, r in zip(delta, row_delta)]
+            self._add_counts(conn, session_id, delta)
+        return len(rows), self.stats(session_id)[1]
+
+    def export_csv(self, session_id):
+        """Materialize the session as CSV bytes in the original column order"""
+        columns = json.loads(self._session(session_id)['columns'])
+        cursor = self._connect().execute(
+            'SELECT sentence, E, S, G, I, extra FROM rows WHERE session_id = ? ORDER BY idx',
+            (session_id,)
+        )
+        records = []
+        for row in cursor:
+            record = json.loads(unpack_text(row['extra'])) if row['extra'] else {}
+            record['Sentences'] = unpack_text(row['sentence'])
+            record.update({col: row[col] for col in LABEL_COLS})
+            records.append(record)
+        df = pd.DataFrame.from_records(records, columns=columns)
+        buffer = io.BytesIO()
+        df.to_csv(buffer, index=False)
+        buffer.seek(0)
+        return buffer
+
+    def delete_session(self, session_id):
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM suggestions WHERE session_id = ?', (session_id,))
+            conn.execute('DELETE FROM rows WHERE session_id = ?', (session_id,))
+            conn.execute('DELETE FROM sessions WHERE session_id = ?', (session_id,))
+
+    # ---------- lifecycle ----------
+    def touch(self, session_id, interval=TOUCH_INTERVAL):
+        """Refresh last_access, at most once per `interval` seconds so reads stay read-only"""
+        now = time.time()
+        if now - self._touched.get(session_id, 0) < interval:
+            return
+        self._touched[session_id] = now
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'UPDATE sessions SET last_access = ? WHERE session_id = ? '
+                'AND (last_access IS NULL OR last_access < ?)',
+                (now, session_id, now - interval)
+            )
+
+    def usage(self, owner):
+        """(sessions, rows) currently held by an owner"""
+        row = self._connect().execute(
+            'SELECT COUNT(*), COALESCE(SUM(total), 0) FROM sessions WHERE owner = ?', (owner,)
+        ).fetchone()
+        return row[0], row[1]
+
+    def evictable_rows(self, owner, keep):
+        """Rows held by the sessions evict_owner(owner, keep) would delete (read-only)"""
+        row = self._connect().execute(
+            'SELECT COALESCE(SUM(total), 0) FROM ('
+            'SELECT total FROM sessions WHERE owner = ? '
+            'ORDER BY COALESCE(last_access, created_at) DESC LIMIT -1 OFFSET ?)',
+            (owner, max(keep, 0))
+        ).fetchone()
+        return row[0]
+
+    def evict_owner(self, owner, keep):
+        """Delete an owner's least recently used sessions so that at most `keep` remain"""
+        rows = self._connect().execute(
+            'SELECT session_id FROM sessions WHERE owner = ? '
+            'ORDER BY COALESCE(last_access, created_at) DESC LIMIT -1 OFFSET ?',
+            (owner, max(keep, 0))
+        ).fetchall()
+        evicted = [row['session_id'] for row in rows]
+        for session_id in evicted:
+            self.delete_session(session_id)
+        return evicted
+
+    def evict_expired(self, ttl_seconds):
+        """Delete sessions not accessed for ttl_seconds, return their ids"""
+        rows = self._connect().execute(
+            'SELECT session_id FROM sessions WHERE COALESCE(last_access, created_at) < ?',
+            (time.time() - ttl_seconds,)
+        ).fetchall()
+        evicted = [row['session_id'] for row in rows]
+        for session_id in evicted:
+            self.delete_session(session_id)
+            self._touched.pop(session_id, None)
+        if evicted:
+            self._connect().execute('PRAGMA incremental_vacuum')
+        return evicted